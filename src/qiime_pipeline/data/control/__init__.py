@@ -1,3 +1,7 @@
-from .check_manifest import check_manifest
+from .check_manifest import check_manifest, validate_manifest
 from .create_Mfiles import create_Mfiles
 from .extract_id import extract_id
+from .fastq_scan import preflight, fastq_pairs, FastqIntegrityError
+from .quality_profile import propose_region, QualityProfile
+from .detect_region import detect_regions
+from .subsample import preview_datasets, parse_preview
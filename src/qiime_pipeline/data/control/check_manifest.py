@@ -1,12 +1,24 @@
 #!/usr/bin/env python
 
 import csv
+import re
 import argparse
+import dataclasses
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePath
 from textwrap import dedent
-from .validate_pattern import (
-    extract_pattern,
-    check_current_pair,
-)
+from typing import Mapping
+
+ID_COLUMN = "sample-id"
+FORWARD_COLUMN = "forward-absolute-filepath"
+REVERSE_COLUMN = "reverse-absolute-filepath"
+
+# validate_patternのcheck_current_pairと同じ判定を1つの正規表現で行う
+#   tag: 最初の"_"より前の部分（サンプル名）
+#   direction: 最後に現れる"_R1"または"_R2"
+FASTQ_NAME = re.compile(r"(?P<tag>[^_]*).*_R(?P<direction>[12])", re.DOTALL)
 
 
 def raise_err(id: str, forward: str, reverse: str) -> str:
@@ -14,18 +26,162 @@ def raise_err(id: str, forward: str, reverse: str) -> str:
     raise SyntaxError(msg)
 
 
+@dataclasses.dataclass(frozen=True)
+class ManifestProblem:
+    """マニフェストの1つの問題"""
+
+    line: int
+    sample_id: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"line {self.line} (id: {self.sample_id}): {self.message}"
+
+
+@dataclasses.dataclass
+class ManifestReport:
+    """マニフェスト全体の検証結果"""
+
+    manifest_path: str
+    rows: int = 0
+    problems: list[ManifestProblem] = dataclasses.field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def add(self, line: int, sample_id: str, message: str) -> None:
+        self.problems.append(ManifestProblem(line, sample_id, message))
+
+    def __str__(self) -> str:
+        if self.ok:
+            return f"{self.manifest_path}: {self.rows} rows OK"
+        return "\n".join(
+            [
+                f"{self.manifest_path}: {len(self.problems)} problem(s)",
+                *(f"  {problem}" for problem in self.problems),
+            ]
+        )
+
+
+def _fastq_tag(name: str) -> tuple[str, str] | None:
+    """ファイル名から (サンプル名, 方向) を取り出す。一致しなければNone"""
+    match = FASTQ_NAME.match(name)
+    if match is None:
+        return None
+    tag = match["tag"].replace(".fastq", "").replace(".gz", "").lower()
+    return tag, match["direction"]
+
+
+def _to_local(path: str, path_map: Mapping[PurePath, Path]) -> Path | None:
+    """コンテナ内のパスを、path_mapの接頭辞の対応に従ってローカルのパスに変換する"""
+    pure = PurePath(path)
+    for ctn_prefix, local_prefix in path_map.items():
+        if pure.is_relative_to(ctn_prefix):
+            return local_prefix / pure.relative_to(ctn_prefix)
+    return None
+
+
+def _exists(path: Path) -> bool:
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+    return True
+
+
+def validate_manifest(
+    manifest_path: str,
+    path_map: Mapping[PurePath, Path] | None = None,
+    max_workers: int = 32,
+) -> ManifestReport:
+    """
+    マニフェスト全体を検証し、全ての問題をまとめたレポートを返す
+
+    forward/reverseの列を一度に読み込み、全てのファイル名を1つの正規表現で分類して
+    サンプル名と方向の組を検証する。サンプルIDの重複も検出する。
+    path_mapを指定した場合は、コンテナ内のパスをローカルのパスに変換し、
+    ファイルが存在するかをスレッドプールで並列に確認する。
+
+    Args:
+        manifest_path: マニフェストのパス
+        path_map: コンテナ内のパスの接頭辞から、ローカルのパスの接頭辞への対応
+        max_workers: ファイルの存在確認に使うスレッドの数
+    """
+    report = ManifestReport(manifest_path=str(manifest_path))
+    with open(manifest_path, "r", newline="") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, [])
+        rows = list(reader)
+
+    if not header:
+        return report
+
+    missing = [c for c in (FORWARD_COLUMN, REVERSE_COLUMN) if c not in header]
+    if missing:
+        report.add(1, "-", f"missing column(s): {', '.join(missing)}")
+        return report
+
+    id_index = header.index(ID_COLUMN) if ID_COLUMN in header else 0
+    fwd_index, rvs_index = header.index(FORWARD_COLUMN), header.index(REVERSE_COLUMN)
+    width = max(id_index, fwd_index, rvs_index) + 1
+
+    rows = [(line, row) for line, row in enumerate(rows, start=2) if row]
+    report.rows = len(rows)
+    for line, row in rows:
+        if len(row) < width:
+            report.add(line, row[0], "too few columns")
+    rows = [(line, row) for line, row in rows if len(row) >= width]
+
+    ids = [row[id_index] for _, row in rows]
+    forwards = [row[fwd_index] for _, row in rows]
+    reverses = [row[rvs_index] for _, row in rows]
+
+    fwd_tags = [_fastq_tag(PurePath(path).name) for path in forwards]
+    rvs_tags = [_fastq_tag(PurePath(path).name) for path in reverses]
+    for (line, _), sample_id, fwd, rvs, fwd_tag, rvs_tag in zip(
+        rows, ids, forwards, reverses, fwd_tags, rvs_tags
+    ):
+        if fwd_tag is None or fwd_tag[1] != "1":
+            report.add(line, sample_id, f"forward ({fwd}) is not an R1 file")
+        if rvs_tag is None or rvs_tag[1] != "2":
+            report.add(line, sample_id, f"reverse ({rvs}) is not an R2 file")
+        if fwd_tag and rvs_tag and fwd_tag[0] != rvs_tag[0]:
+            report.add(
+                line,
+                sample_id,
+                f"forward ({fwd}) and reverse ({rvs}) have different sample names",
+            )
+
+    counts = Counter(ids)
+    for (line, _), sample_id in zip(rows, ids):
+        if counts[sample_id] > 1:
+            report.add(line, sample_id, "duplicate sample id")
+
+    if path_map is not None:
+        paths = [
+            (line, sample_id, path)
+            for (line, _), sample_id, fwd, rvs in zip(rows, ids, forwards, reverses)
+            for path in (fwd, rvs)
+        ]
+        local_paths = [_to_local(path, path_map) for _, _, path in paths]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            exists = pool.map(lambda p: p is not None and _exists(p), local_paths)
+            for (line, sample_id, path), local, found in zip(
+                paths, local_paths, exists
+            ):
+                if not found:
+                    report.add(line, sample_id, f"file not found: {local or path}")
+
+    report.problems.sort(key=lambda problem: problem.line)
+    return report
+
+
 def check_manifest(manifest_path: str) -> bool:
     """
     Check the manifest file for consistency.
     """
-    with open(manifest_path, "r") as f:
-        reader = csv.DictReader(f, delimiter="\t")
-        for row in reader:
-            forward, reverse = extract_pattern(row)
-            if not check_current_pair(forward, reverse):
-                return False
-
-    return True
+    return validate_manifest(manifest_path).ok
 
 
 if __name__ == "__main__":
@@ -40,4 +196,4 @@ if __name__ == "__main__":
     )
 
     manifest_path = parser.parse_args().input_path
-    check_manifest(manifest_path)
+    print(validate_manifest(manifest_path))
@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 
 import csv
+import filecmp
+import heapq
 from pathlib import Path, PurePath
-from qiime_pipeline.data.store import Datasets
+from typing import Iterable, Iterator
+from qiime_pipeline.data.store import Datasets, SampleIdRegistry
 from .validate_pattern import Direction, check_current_pair, extract_first_underscore
 
+MANIFEST_HEADER = [
+    "sample-id",
+    "forward-absolute-filepath",
+    "reverse-absolute-filepath",
+]
+
 
 class Pair:
     def __init__(self, forward: str, reverse: str) -> None:
@@ -61,14 +70,33 @@ def pairwise(datasets: Datasets) -> dict[Pair]:
     return pairwised_files(all_fastq)
 
 
+def normalize_header(header: list[str]) -> list[str]:
+    """
+    メタデータのヘッダーのSampleID列をRawIDに置き換える
+    """
+    return [name.replace("#", "").replace("SampleID", "RawID") for name in header]
+
+
 def get_header(meta_path: str) -> list[str]:
     """
     指定されたメタデータファイルのヘッダーを取得する
     """
     assert Path(meta_path).exists(), f"{meta_path} does not exist"
-    with Path(meta_path).open() as f:
-        header_str = f.readline().replace("\n", "")
-        return header_str.replace("#", "").replace("SampleID", "RawID").split(",")
+    with Path(meta_path).open(newline="") as f:
+        return normalize_header(next(csv.reader(f), []))
+
+
+def iter_all_metadata(datasets: Datasets) -> Iterator[list[str]]:
+    """
+    Datasetsに含まれる全てのDatasetのメタデータの行を、RawID順に1行ずつ返す
+
+    各データセットの行はそれぞれ一度だけ並べ替え、ヒープによるk-wayマージで
+    結合するため、作業用のメモリはデータセットの数に比例する分しか使わない。
+    """
+    return heapq.merge(
+        *(dataset.metadata.sorted_rows() for dataset in datasets.sets),
+        key=lambda row: row[0],
+    )
 
 
 def combine_all_metadata(datasets: Datasets) -> list[list[str]]:
@@ -76,13 +104,34 @@ def combine_all_metadata(datasets: Datasets) -> list[list[str]]:
     Datasetsに含まれる全てのDatasetのメタデータを一つのリストにまとめて返す
     """
 
-    all_metadata = []
-    for dataset in datasets.sets:
-        header_removed = dataset.metadata[1:]
-        all_metadata.extend(header_removed)
+    header = normalize_header(next(iter(datasets.sets)).metadata.header)
+    return [header, *iter_all_metadata(datasets)]
+
+
+def iter_linked_rows(
+    rows: Iterable[list[str]],
+    pairwised: dict[Pair],
+    ctn_fastq_path: Path,
+    id_prefix: str = "id",
+    registry: SampleIdRegistry | None = None,
+) -> Iterator[tuple[list[str], list[str]]]:
+    """
+    メタデータの行ごとにIDを振り、メタデータ表とマニフェスト表の行の組を返す
 
-    all_metadata.sort(key=lambda x: x[0])  # RawIDでソート（test1, test2, ...の順）
-    return [get_header(list(datasets.sets)[0].metadata_path), *all_metadata]
+    registryを指定した場合はレジストリに保存されたIDを、
+    指定しない場合は行の順番に基づくIDを割り当てる。
+    """
+    for i, row in enumerate(rows, start=1):
+        if registry is not None:
+            id_name = registry.sample_id(row[0])
+        else:
+            id_name = id_prefix + str(i)
+        pair = pairwised[row[0]]
+        yield [id_name, *row], [
+            id_name,
+            str(ctn_fastq_path / pair.forward),
+            str(ctn_fastq_path / pair.reverse),
+        ]
 
 
 def linked_table_expose(
@@ -92,53 +141,75 @@ def linked_table_expose(
     id_prefix: str = "id",
 ) -> tuple[list, list]:
     metadata_table = [["#SampleID", *metadata[0]]]
-    for i, row in enumerate(metadata[1:], start=1):
-        id_name = id_prefix + str(i)
-        metadata_table.append([id_name, *row])
-
-    manifest_table = [
-        ["sample-id", "forward-absolute-filepath", "reverse-absolute-filepath"]
-    ]
-    for i, key in enumerate([row[0] for row in metadata[1:]], start=1):
-        id_name = id_prefix + str(i)
-        manifest_table.append(
-            [
-                id_name,
-                str(ctn_fastq_path / pairwised[key].forward),
-                str(ctn_fastq_path / pairwised[key].reverse),
-            ]
-        )
+    manifest_table = [MANIFEST_HEADER]
+    for meta_row, manifest_row in iter_linked_rows(
+        metadata[1:], pairwised, ctn_fastq_path, id_prefix
+    ):
+        metadata_table.append(meta_row)
+        manifest_table.append(manifest_row)
 
     return metadata_table, manifest_table
 
 
-def write_tsv(path: Path, table: list[list[str]]) -> None:
+def write_tsv(path: Path, table: Iterable[list[str]]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     with path.open("w") as f:
         writer = csv.writer(f, delimiter="\t")
         writer.writerows(table)
 
 
+def _part_path(path: Path) -> Path:
+    return path.with_name(path.name + ".part")
+
+
+def _replace_if_changed(path: Path) -> None:
+    """
+    書き出した一時ファイルの内容が既存のファイルと同じであれば一時ファイルを破棄する
+    既存のファイルの更新日時が変わらないため、下流のキャッシュが無効にならない
+    """
+    part = _part_path(path)
+    if path.exists() and filecmp.cmp(part, path, shallow=False):
+        part.unlink()
+    else:
+        part.replace(path)
+
+
 def create_Mfiles(
     local_output: Path,
     container_fastq_path: Path,
     data: Datasets,
     id_prefix: str = "id",
+    registry: SampleIdRegistry | None = None,
 ) -> tuple[Path, Path]:
     """
     Create metadata and manifest files from the given data.
+
+    メタデータの結合からファイルへの書き出しまでを1行ずつ流して行うため、
+    どちらの表も全体をメモリに保持することはない。
+    内容が前回の実行から変わっていないファイルは書き換えない。
     """
 
-    metadata = combine_all_metadata(data)
     pairwised = pairwise(data)
-
-    metatable, manifest = linked_table_expose(
-        metadata, pairwised, container_fastq_path, id_prefix
+    header = normalize_header(next(iter(data.sets)).metadata.header)
+    linked = iter_linked_rows(
+        iter_all_metadata(data), pairwised, container_fastq_path, id_prefix, registry
     )
 
     metatable_local_path = local_output / "metadata.tsv"
     manifest_local_path = local_output / "manifest.tsv"
-    write_tsv(metatable_local_path, metatable)
-    write_tsv(manifest_local_path, manifest)
-
+    local_output.mkdir(parents=True, exist_ok=True)
+    with (
+        _part_path(metatable_local_path).open("w") as meta_f,
+        _part_path(manifest_local_path).open("w") as manifest_f,
+    ):
+        meta_writer = csv.writer(meta_f, delimiter="\t")
+        manifest_writer = csv.writer(manifest_f, delimiter="\t")
+        meta_writer.writerow(["#SampleID", *header])
+        manifest_writer.writerow(MANIFEST_HEADER)
+        for meta_row, manifest_row in linked:
+            meta_writer.writerow(meta_row)
+            manifest_writer.writerow(manifest_row)
+
+    _replace_if_changed(metatable_local_path)
+    _replace_if_changed(manifest_local_path)
     return metatable_local_path, manifest_local_path
@@ -0,0 +1,166 @@
+"""
+プライマー配列からデータセットの領域を推定する
+
+各データセットの先頭のリードを読み込み、既知のプライマーの組と照合する。
+縮重塩基は事前に全ての配列へ展開してトライ木にまとめておくため、
+1リードあたりの照合はプライマーの数によらずプライマー長程度の手数で済む。
+"""
+
+from __future__ import annotations
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Iterable
+from qiime_pipeline.data.store import KNOWN_PRIMERS, PrimerPair
+from .fastq_io import iter_reads, open_fastq
+
+IUPAC_CODES = {
+    "A": "A",
+    "C": "C",
+    "G": "G",
+    "T": "T",
+    "R": "AG",
+    "Y": "CT",
+    "S": "CG",
+    "W": "AT",
+    "K": "GT",
+    "M": "AC",
+    "B": "CGT",
+    "D": "AGT",
+    "H": "ACT",
+    "V": "ACG",
+    "N": "ACGT",
+}
+
+FORWARD = "forward"
+REVERSE = "reverse"
+
+# トライ木のノードで、一致したプライマーを保持するキー
+_TERMINAL = -1
+
+
+def expand_degenerate(primer: str) -> list[bytes]:
+    """縮重塩基を含む配列を、取りうる全ての配列に展開する"""
+    choices = [IUPAC_CODES[base] for base in primer.upper()]
+    return ["".join(bases).encode() for bases in itertools.product(*choices)]
+
+
+class PrimerAutomaton:
+    """
+    複数のプライマーを同時に照合するトライ木
+
+    各ノードは次の塩基(バイト値)から子ノードへの辞書であり、
+    プライマーの終端には一致した (領域名, 向き) の組を保持する。
+    """
+
+    def __init__(self, primers: Iterable[PrimerPair]):
+        self.__root: dict = {}
+        for pair in primers:
+            self.__add(pair.forward, (pair.region_name, FORWARD))
+            self.__add(pair.reverse, (pair.region_name, REVERSE))
+
+    def __add(self, primer: str, label: tuple[str, str]) -> None:
+        for variant in expand_degenerate(primer):
+            node = self.__root
+            for base in variant:
+                node = node.setdefault(base, {})
+            node.setdefault(_TERMINAL, set()).add(label)
+
+    def match(self, seq: bytes, max_offset: int = 2) -> set[tuple[str, str]]:
+        """
+        リードの先頭(max_offset塩基までのずれを許容)に一致するプライマーを返す
+        """
+        found = set()
+        seq = seq.upper()
+        for offset in range(min(max_offset, len(seq)) + 1):
+            node = self.__root
+            for base in seq[offset:]:
+                node = node.get(base)
+                if node is None:
+                    break
+                if _TERMINAL in node:
+                    found |= node[_TERMINAL]
+
+        return found
+
+
+@lru_cache(maxsize=None)
+def _automaton(primers: tuple[PrimerPair, ...]) -> PrimerAutomaton:
+    return PrimerAutomaton(primers)
+
+
+def sample_read_pairs(
+    pairs: Iterable[tuple[Path, Path]], sample_reads: int
+) -> Iterable[tuple[bytes, bytes]]:
+    """ファイルの先頭から順に、合計sample_reads組までの (R1, R2) の配列を返す"""
+    remaining = sample_reads
+    for forward, reverse in sorted(pairs):
+        if remaining <= 0:
+            return
+
+        with open_fastq(forward) as f, open_fastq(reverse) as r:
+            reads = zip(iter_reads(f), iter_reads(r))
+            for (_, fwd_seq, _), (_, rvs_seq, _) in itertools.islice(reads, remaining):
+                remaining -= 1
+                yield fwd_seq, rvs_seq
+
+
+def detect_region(
+    pairs: Iterable[tuple[Path, Path]],
+    primers: tuple[PrimerPair, ...] = KNOWN_PRIMERS,
+    sample_reads: int = 2000,
+    min_fraction: float = 0.5,
+    max_offset: int = 2,
+) -> str | None:
+    """
+    リードの組に最も多く一致するプライマーの組の領域名を返す
+
+    R1にフォワード、R2にリバースプライマーが一致した組
+    (またはその逆向きの組)を数え、その割合がmin_fraction未満であればNoneを返す。
+    """
+    automaton = _automaton(tuple(primers))
+    hits = {pair.region_name: 0 for pair in primers}
+
+    total = 0
+    for fwd_seq, rvs_seq in sample_read_pairs(pairs, sample_reads):
+        total += 1
+        fwd_found = automaton.match(fwd_seq, max_offset)
+        rvs_found = automaton.match(rvs_seq, max_offset)
+        for name in hits:
+            if ((name, FORWARD) in fwd_found and (name, REVERSE) in rvs_found) or (
+                (name, REVERSE) in fwd_found and (name, FORWARD) in rvs_found
+            ):
+                hits[name] += 1
+
+    if total == 0:
+        return None
+
+    name, count = max(hits.items(), key=lambda item: item[1])
+    if count / total < min_fraction:
+        return None
+
+    return name
+
+
+def detect_regions(
+    pairs_per_dataset: list[list[tuple[Path, Path]]],
+    primers: tuple[PrimerPair, ...] = KNOWN_PRIMERS,
+    sample_reads: int = 2000,
+    min_fraction: float = 0.5,
+    max_workers: int | None = None,
+) -> list[str | None]:
+    """
+    複数のデータセットの領域をプロセスプールで並列に推定する
+
+    Returns:
+        pairs_per_datasetと同じ順序の領域名のリスト
+    """
+    detector = partial(
+        detect_region,
+        primers=tuple(primers),
+        sample_reads=sample_reads,
+        min_fraction=min_fraction,
+    )
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(detector, pairs_per_dataset))
@@ -1,8 +1,16 @@
 import csv
+import mmap
+import os
 import sys
 import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from textwrap import dedent
-from typing import Iterator, List, Set
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Union
+
+# バルクモードで1つのワーカーが処理するチャンクのおおよその大きさ
+BULK_CHUNK_SIZE = 16 << 20
 
 
 class ExtractError(Exception):
@@ -11,15 +19,46 @@ class ExtractError(Exception):
     pass
 
 
+def resolve_column(header: List[str], column: Union[int, str]) -> int:
+    """列名または列のインデックスを、列のインデックスに変換する
+
+    列名は先頭の"#"を除いた名前でも指定できる（例: "SampleID"）。
+
+    Raises:
+        ExtractError: 列が存在しない場合
+    """
+    if isinstance(column, str) and column.isdigit():
+        column = int(column)
+
+    if isinstance(column, int):
+        if column >= len(header):
+            raise ExtractError(f"指定された列インデックス {column} が範囲外です")
+        return column
+
+    for i, name in enumerate(header):
+        if column in (name, name.lstrip("#")):
+            return i
+    raise ExtractError(f"指定された列名 {column} が見つかりません")
+
+
+def read_targets(path: str) -> List[str]:
+    """1行に1つのIDが書かれたファイルからターゲットIDを読み込む（空行は無視）"""
+    try:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        raise ExtractError(f"ファイル '{path}' が見つかりません")
+
+
 def process_rows(
-    file, targets: Set[str], column: int, exclude_mode: bool
+    file, targets: Set[str], column: Union[int, str], exclude_mode: bool
 ) -> Iterator[List[str]]:
     """ファイルの各行を処理するジェネレータ関数
 
     Args:
         file: 入力ファイルオブジェクト
         targets: 抽出または除外対象のIDセット
-        column: 対象とする列のインデックス
+        column: 対象とする列のインデックスまたは列名
         exclude_mode: 除外モードフラグ
 
     Yields:
@@ -33,8 +72,7 @@ def process_rows(
     except StopIteration:
         raise ExtractError("ファイルが空です")
 
-    if column >= len(header):
-        raise ExtractError(f"指定された列インデックス {column} が範囲外です")
+    column = resolve_column(header, column)
 
     for row in reader:
         if len(row) <= column:
@@ -46,7 +84,10 @@ def process_rows(
 
 
 def extract_id(
-    input_path: str, targets: List[str], column: int = 0, exclude_mode: bool = False
+    input_path: str,
+    targets: List[str],
+    column: Union[int, str] = 0,
+    exclude_mode: bool = False,
 ) -> Iterator[str]:
     """
     指定した列の値に基づいて、CSVデータの行を抽出または除外します。
@@ -55,7 +96,7 @@ def extract_id(
     Args:
         input_path: 入力ファイルのパス
         targets: 抽出または除外するターゲットIDのリスト
-        column: 対象とする列のインデックス（0始まり）
+        column: 対象とする列のインデックス（0始まり）または列名
         exclude_mode: Trueの場合、ターゲットIDに一致する行を除外
 
     Yields:
@@ -75,6 +116,251 @@ def extract_id(
         raise ExtractError(f"ファイル '{input_path}' が見つかりません")
 
 
+# ワーカープロセスごとに一度だけ設定される、バルクモードの照合条件
+_bulk_targets: frozenset = frozenset()
+_bulk_column: int = 0
+_bulk_exclude: bool = False
+
+
+def _init_bulk_worker(targets: frozenset, column: int, exclude_mode: bool) -> None:
+    global _bulk_targets, _bulk_column, _bulk_exclude
+    _bulk_targets, _bulk_column, _bulk_exclude = targets, column, exclude_mode
+
+
+def _filter_block(block: bytes) -> bytes:
+    """改行で区切られたバイト列から、条件に合う行だけを連結して返す"""
+    targets, column, exclude_mode = _bulk_targets, _bulk_column, _bulk_exclude
+    kept = []
+    for line in block.split(b"\n"):
+        # 末尾の改行の後の空文字列や空行は、列0の除外モードでも出力しない
+        if not line.rstrip(b"\r"):
+            continue
+        fields = line.rstrip(b"\r").split(b"\t", column + 1)
+        if len(fields) <= column:
+            continue
+        if (fields[column] in targets) != exclude_mode:
+            kept.append(line)
+
+    if not kept:
+        return b""
+    return b"\n".join(kept) + b"\n"
+
+
+def _filter_chunk(job: tuple) -> bytes:
+    input_path, start, end = job
+    with open(input_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _filter_block(mm[start:end])
+
+
+def _chunk_bounds(mm: mmap.mmap, start: int, chunk_size: int) -> List[tuple]:
+    """startからファイル末尾までを、改行の直後で区切ったチャンクに分割する"""
+    bounds = []
+    size = len(mm)
+    while start < size:
+        end = mm.find(b"\n", min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def extract_id_bulk(
+    input_path: str,
+    targets: List[str],
+    column: Union[int, str] = 0,
+    exclude_mode: bool = False,
+    output: Optional[BinaryIO] = None,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    max_workers: Optional[int] = None,
+) -> int:
+    """
+    extract_idのバルクモード
+
+    入力をメモリマップし、改行位置で揃えたチャンクをワーカープロセスで並列に処理する。
+    結果はチャンク単位の大きなブロックとして、入力と同じ順序でoutputに書き出す。
+    引用符を含まないタブ区切りのファイル（QIIME2から出力した特徴量表など）を想定している。
+
+    Args:
+        input_path: 入力ファイルのパス
+        targets: 抽出または除外するターゲットIDのリスト
+        column: 対象とする列のインデックス（0始まり）または列名
+        exclude_mode: Trueの場合、ターゲットIDに一致する行を除外
+        output: 書き出し先のバイナリストリーム（省略時は標準出力）
+        chunk_size: 1つのチャンクのおおよそのバイト数
+        max_workers: ワーカープロセスの数
+
+    Returns:
+        書き出した行数（ヘッダーを除く）
+
+    Raises:
+        ExtractError: ファイルが空、または列が無効な場合
+    """
+    if output is None:
+        output = sys.stdout.buffer
+
+    try:
+        size = os.path.getsize(input_path)
+    except FileNotFoundError:
+        raise ExtractError(f"ファイル '{input_path}' が見つかりません")
+    if size == 0:
+        raise ExtractError("ファイルが空です")
+
+    with open(input_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = mm.find(b"\n")
+            header_end = size if header_end == -1 else header_end + 1
+            header = mm[:header_end]
+            bounds = _chunk_bounds(mm, header_end, chunk_size)
+
+    header_fields = header.rstrip(b"\r\n").decode().split("\t")
+    column = resolve_column(header_fields, column)
+    initargs = (frozenset(t.encode() for t in targets), column, exclude_mode)
+
+    output.write(header.rstrip(b"\n") + b"\n")
+    jobs = [(input_path, start, end) for start, end in bounds]
+
+    written = 0
+    if len(jobs) <= 1:
+        # 小さなファイルではプロセスを起動せずに処理する
+        _init_bulk_worker(*initargs)
+        blocks = map(_filter_chunk, jobs)
+        for block in blocks:
+            written += block.count(b"\n")
+            output.write(block)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_bulk_worker,
+            initargs=initargs,
+        ) as pool:
+            for block in pool.map(_filter_chunk, jobs):
+                written += block.count(b"\n")
+                output.write(block)
+
+    output.flush()
+    return written
+
+
+def _check_outputs(input_paths: List[str], output_paths: List[str]) -> None:
+    """出力先が入力ファイル自身であれば、書き出す前にエラーにする
+
+    Raises:
+        ExtractError: 出力ファイルが入力ファイルと同じ場合
+    """
+    inputs = {os.path.realpath(path) for path in input_paths}
+    for path in output_paths:
+        if os.path.realpath(path) in inputs:
+            raise ExtractError(f"出力ファイル '{path}' が入力ファイルと同じです")
+
+
+@contextmanager
+def _replace_on_success(path: str) -> Iterator[BinaryIO]:
+    """同じディレクトリの一時ファイルに書き出し、成功した場合のみpathに置き換える"""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}."
+    )
+    try:
+        with os.fdopen(fd, "wb") as out:
+            yield out
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def extract_ids(
+    input_paths: List[str],
+    targets: List[str],
+    output_dir: str,
+    column: Union[int, str, Dict[str, Union[int, str]]] = 0,
+    exclude_mode: bool = False,
+    max_workers: Optional[int] = None,
+) -> Dict[str, str]:
+    """
+    複数のファイルを同じターゲットIDで絞り込み、output_dirに同じファイル名で書き出す
+
+    各ファイルはextract_id_bulkにより1回の並列処理で絞り込まれる。
+
+    Args:
+        input_paths: 入力ファイルのパスのリスト
+        targets: 抽出または除外するターゲットIDのリスト
+        output_dir: 出力先のディレクトリ
+        column: 対象とする列。入力ファイルのパスをキーとする辞書でファイルごとに指定できる
+        exclude_mode: Trueの場合、ターゲットIDに一致する行を除外
+        max_workers: ワーカープロセスの数
+
+    Returns:
+        入力ファイルのパスから出力ファイルのパスへの辞書
+
+    Raises:
+        ExtractError: 同じファイル名の入力がある場合、または出力先が入力ファイル自身の場合
+    """
+    names = [os.path.basename(path) for path in input_paths]
+    if len(set(names)) != len(names):
+        raise ExtractError("同じファイル名の入力ファイルが複数指定されています")
+    out_paths = [os.path.join(output_dir, name) for name in names]
+    _check_outputs(input_paths, out_paths)
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {}
+    for path, out_path in zip(input_paths, out_paths):
+        file_column = column.get(path, 0) if isinstance(column, dict) else column
+        with _replace_on_success(out_path) as out:
+            extract_id_bulk(
+                path,
+                targets,
+                file_column,
+                exclude_mode,
+                output=out,
+                max_workers=max_workers,
+            )
+        outputs[path] = out_path
+
+    return outputs
+
+
+def subset_Mfiles(
+    metadata_path: str,
+    manifest_path: str,
+    targets: List[str],
+    output_dir: str,
+    column: Union[int, str] = "RawID",
+    exclude_mode: bool = False,
+) -> tuple:
+    """
+    create_Mfilesで作成したメタデータとマニフェストを、同じサンプルの組に絞り込む
+
+    メタデータをcolumn（既定ではRawID）で絞り込み、
+    残ったサンプルのSampleIDでマニフェストを絞り込むため、
+    出力の組はそのままfile_importに渡すことができる。
+
+    Returns:
+        絞り込んだ (メタデータ, マニフェスト) のパス
+
+    Raises:
+        ExtractError: ファイル名が同じ場合、または出力先が入力ファイル自身の場合
+    """
+    sub_metadata = os.path.join(output_dir, os.path.basename(metadata_path))
+    sub_manifest = os.path.join(output_dir, os.path.basename(manifest_path))
+    if sub_metadata == sub_manifest:
+        raise ExtractError("メタデータとマニフェストのファイル名が同じです")
+    _check_outputs([metadata_path, manifest_path], [sub_metadata, sub_manifest])
+    os.makedirs(output_dir, exist_ok=True)
+
+    with _replace_on_success(sub_metadata) as out:
+        extract_id_bulk(metadata_path, targets, column, exclude_mode, output=out)
+
+    with open(sub_metadata, "rb") as f:
+        next(f)
+        sample_ids = [line.split(b"\t", 1)[0].decode().rstrip("\r\n") for line in f]
+
+    with _replace_on_success(sub_manifest) as out:
+        extract_id_bulk(manifest_path, sample_ids, 0, output=out)
+
+    return sub_metadata, sub_manifest
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="指定した列の値に基づいて、CSVデータの行を抽出または除外します。"
@@ -89,21 +375,31 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "targets",
-        nargs="+",
+        nargs="*",
         help=dedent(
             """
             抽出対象のID（複数指定可）
             """
         ),
     )
+    parser.add_argument(
+        "-t",
+        "--targets-file",
+        help=dedent(
+            """
+            抽出対象のIDを1行に1つずつ書いたファイルのパス
+            （コマンドラインで指定したIDに追加されます）
+            """
+        ),
+    )
     parser.add_argument(
         "-c",
         "--column",
-        type=int,
-        default=0,
+        default=None,
         help=dedent(
             """
-            対象とする列のインデックス（0始まり）
+            対象とする列のインデックス（0始まり）または列名
+            （既定では0、--manifestを指定した場合はRawID）
             """
         ),
     )
@@ -118,14 +414,92 @@ if __name__ == "__main__":
             """
         ),
     )
+    parser.add_argument(
+        "-a",
+        "--also",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help=dedent(
+            """
+            同じターゲットIDで絞り込む追加の入力ファイル（複数回指定可）
+            --output-dirの指定が必要です
+            """
+        ),
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        help=dedent(
+            """
+            input_pathをcreate_Mfilesで作成したメタデータとみなし、
+            このマニフェストと組にして同じサンプルに絞り込みます
+            （既定では--columnにRawID列を使います。--output-dirの指定が必要です）
+            """
+        ),
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        help=dedent(
+            """
+            絞り込んだファイルを同じファイル名で書き出すディレクトリ
+            """
+        ),
+    )
+    parser.add_argument(
+        "-b",
+        "--bulk",
+        action="store_true",
+        help=dedent(
+            """
+            入力をメモリマップし、複数のプロセスで並列に処理します。
+            数百万行の特徴量表など、大きなタブ区切りファイル向けのモードです。
+            """
+        ),
+    )
 
     args = parser.parse_args()
 
     try:
-        for line in extract_id(
-            args.input_path, args.targets, args.column, args.exclude
-        ):
-            print(line)
+        targets = list(args.targets)
+        if args.targets_file:
+            targets.extend(read_targets(args.targets_file))
+        if not targets:
+            parser.error("抽出対象のIDを指定してください")
+
+        if (args.also or args.manifest) and not args.output_dir:
+            parser.error("--also/--manifestには--output-dirの指定が必要です")
+
+        column = args.column
+        if column is None:
+            column = "RawID" if args.manifest else "0"
+
+        if args.manifest:
+            for path in subset_Mfiles(
+                args.input_path,
+                args.manifest,
+                targets,
+                args.output_dir,
+                column,
+                args.exclude,
+            ):
+                print(path)
+        elif args.output_dir:
+            outputs = extract_ids(
+                [args.input_path, *args.also],
+                targets,
+                args.output_dir,
+                column,
+                args.exclude,
+            )
+            for path in outputs.values():
+                print(path)
+        elif args.bulk:
+            extract_id_bulk(args.input_path, targets, column, args.exclude)
+        else:
+            for line in extract_id(args.input_path, targets, column, args.exclude):
+                print(line)
     except ExtractError as e:
         print(f"エラー: {e}", file=sys.stderr)
         sys.exit(1)
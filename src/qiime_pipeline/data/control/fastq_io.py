@@ -0,0 +1,41 @@
+import gzip
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+
+def is_gzipped(path: Path) -> bool:
+    """
+    拡張子からgzip圧縮されたFASTQかどうかを判定する
+    """
+    return Path(path).suffix == ".gz"
+
+
+def open_fastq(path: Path) -> BinaryIO:
+    """
+    FASTQファイルをバイナリモードで開く
+    .gzの場合はストリーミングで展開しながら読み込む
+    """
+    if is_gzipped(path):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_reads(handle: BinaryIO) -> Iterator[tuple[bytes, bytes, bytes]]:
+    """
+    FASTQのレコードを (ヘッダー, 配列, クオリティ) の組として順に返す
+
+    Args:
+        handle: open_fastqで開いたファイルオブジェクト
+
+    Yields:
+        改行を取り除いた各行のバイト列
+    """
+    while True:
+        header = handle.readline()
+        if not header:
+            return
+
+        seq = handle.readline().rstrip(b"\r\n")
+        handle.readline()  # "+" 行
+        qual = handle.readline().rstrip(b"\r\n")
+        yield header.rstrip(b"\r\n"), seq, qual
@@ -0,0 +1,212 @@
+"""
+FASTQファイルの事前検査
+
+コンテナを起動する前に全てのFASTQを走査し、
+gzipの破損やR1/R2のリード数の不一致を検出する。
+"""
+
+from __future__ import annotations
+import dataclasses
+import json
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable
+from qiime_pipeline.data.store import Dataset, Datasets
+from .create_Mfiles import pairwised_files
+from .fastq_io import open_fastq
+
+CHUNK_SIZE = 1 << 20
+
+
+class FastqIntegrityError(ValueError):
+    """FASTQの検査で問題が見つかった場合のエラー"""
+
+    def __init__(self, problems: list[str]):
+        self.problems = problems
+        super().__init__("FASTQ preflight failed:\n  " + "\n  ".join(problems))
+
+
+@dataclasses.dataclass(frozen=True)
+class ScanResult:
+    """
+    1つのFASTQファイルの検査結果
+
+    Attributes:
+        path: ファイルの絶対パス
+        size: 検査時のファイルサイズ
+        mtime_ns: 検査時の更新時刻
+        reads: リード数
+        error: 問題があった場合のメッセージ
+    """
+
+    path: str
+    size: int
+    mtime_ns: int
+    reads: int
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def scan_fastq(path: Path) -> ScanResult:
+    """
+    FASTQを最後まで読み込み、gzipの整合性とリード数を確認する
+
+    行数のみを数えるため、レコードの中身は検査しない。
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+
+    lines = 0
+    last = b"\n"
+    try:
+        with open_fastq(path) as f:
+            while chunk := f.read(CHUNK_SIZE):
+                lines += chunk.count(b"\n")
+                last = chunk[-1:]
+    except (OSError, EOFError, zlib.error) as e:
+        # 途中で切れたgzipはEOFError、破損したものはBadGzipFile(OSError)になる
+        return ScanResult(
+            str(path), stat.st_size, stat.st_mtime_ns, 0, f"{type(e).__name__}: {e}"
+        )
+
+    # 末尾に改行がない場合、最後の行を数える
+    if last != b"\n":
+        lines += 1
+
+    error = None
+    if lines % 4 != 0:
+        error = f"truncated record: {lines} lines is not a multiple of 4"
+
+    return ScanResult(str(path), stat.st_size, stat.st_mtime_ns, lines // 4, error)
+
+
+class ScanCache:
+    """
+    検査結果をファイルサイズと更新時刻をキーとして保存するキャッシュ
+    """
+
+    def __init__(self, cache_path: Path | None = None):
+        self.__path = cache_path
+        self.__entries: dict[str, dict] = {}
+
+        if cache_path is not None and cache_path.exists():
+            try:
+                self.__entries = json.loads(cache_path.read_text())
+            except json.JSONDecodeError:
+                self.__entries = {}
+
+    def lookup(self, path: Path) -> ScanResult | None:
+        entry = self.__entries.get(str(path))
+        if entry is None:
+            return None
+
+        stat = path.stat()
+        if entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            return None
+
+        return ScanResult(path=str(path), **entry)
+
+    def store(self, result: ScanResult) -> None:
+        entry = dataclasses.asdict(result)
+        del entry["path"]
+        self.__entries[result.path] = entry
+
+    def save(self) -> None:
+        if self.__path is None:
+            return
+
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.__path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.__entries))
+        tmp.replace(self.__path)
+
+
+def dataset_pairs(dataset: Dataset) -> list[tuple[Path, Path]]:
+    """
+    データセットのR1/R2の組を絶対パスの組として返す
+    """
+    files = [dataset.fastq_folder / Path(f).name for f in dataset.fastq_files]
+    return [
+        (Path(pair.forward), Path(pair.reverse))
+        for pair in pairwised_files(files).values()
+    ]
+
+
+def fastq_pairs(datasets: Datasets) -> list[tuple[Path, Path]]:
+    """
+    全てのデータセットについてR1/R2の組を作り、絶対パスの組として返す
+    """
+    pairs = []
+    for dataset in datasets.sets:
+        pairs.extend(dataset_pairs(dataset))
+
+    return pairs
+
+
+def scan_all(
+    files: Iterable[Path],
+    cache_path: Path | None = None,
+    max_workers: int | None = None,
+) -> dict[str, ScanResult]:
+    """
+    複数のFASTQをプロセスプールで並列に検査する
+    キャッシュに一致する結果があるファイルは再検査しない
+
+    Returns:
+        絶対パスをキーとした検査結果
+    """
+    cache = ScanCache(cache_path)
+    results: dict[str, ScanResult] = {}
+    to_scan = []
+    for f in dict.fromkeys(Path(f).resolve() for f in files):
+        cached = cache.lookup(f)
+        if cached is not None:
+            results[str(f)] = cached
+        else:
+            to_scan.append(f)
+
+    if to_scan:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for result in pool.map(scan_fastq, to_scan):
+                results[result.path] = result
+                cache.store(result)
+        cache.save()
+
+    return results
+
+
+def preflight(
+    pairs: Iterable[tuple[Path, Path]],
+    cache_path: Path | None = None,
+    max_workers: int | None = None,
+) -> dict[str, ScanResult]:
+    """
+    全てのFASTQを検査し、R1とR2のリード数が一致することを確認する
+
+    Raises:
+        FastqIntegrityError: 1つでも問題が見つかった場合。全ての問題を列挙する
+    """
+    pairs = [(Path(f).resolve(), Path(r).resolve()) for f, r in pairs]
+    results = scan_all(
+        [p for pair in pairs for p in pair],
+        cache_path=cache_path,
+        max_workers=max_workers,
+    )
+
+    problems = [f"{r.path}: {r.error}" for r in results.values() if not r.ok]
+    for forward, reverse in pairs:
+        fwd, rvs = results[str(forward)], results[str(reverse)]
+        if fwd.ok and rvs.ok and fwd.reads != rvs.reads:
+            problems.append(
+                f"read count mismatch: {forward.name} ({fwd.reads}) "
+                f"and {reverse.name} ({rvs.reads})"
+            )
+
+    if problems:
+        raise FastqIntegrityError(problems)
+
+    return results
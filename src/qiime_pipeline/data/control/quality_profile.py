@@ -0,0 +1,267 @@
+"""
+FASTQのクオリティプロファイルからDADA2のトランケート長を推定する
+
+各FASTQからリザーバーサンプリングでリードを抽出し、
+ポジションごとのクオリティ値の分布を作成する。
+分布の分位点が閾値を下回る位置をトランケート長とし、
+ペアエンドリードの結合に必要なオーバーラップが残るように調整する。
+"""
+
+from __future__ import annotations
+import dataclasses
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Iterable
+from qiime_pipeline.data.store import Region
+from qiime_pipeline.data.store.ribosome_regions import AMPLICON_LENGTHS
+from .fastq_io import iter_reads, open_fastq
+
+PHRED_OFFSET = 33
+
+# 長さの異なるリードを揃えるための値
+# クオリティ文字としては出現しないため、分布には含まれない
+PADDING = b"\x00"
+
+
+def reservoir_sample(path: Path, sample_size: int, seed: int = 0) -> list[bytes]:
+    """
+    FASTQからsample_size件のクオリティ行を一様に抽出する
+
+    乱数はseedとファイル名から決まるため、同じファイルからは常に同じリードが選ばれる。
+    """
+    rng = random.Random(f"{seed}:{Path(path).name}")
+    sample: list[bytes] = []
+    with open_fastq(path) as f:
+        for i, (_, _, qual) in enumerate(iter_reads(f)):
+            if i < sample_size:
+                sample.append(qual)
+                continue
+
+            j = rng.randrange(i + 1)
+            if j < sample_size:
+                sample[j] = qual
+
+    return sample
+
+
+@dataclasses.dataclass(frozen=True)
+class QualityProfile:
+    """
+    ポジションごとのクオリティ値のヒストグラム
+
+    Attributes:
+        reads: プロファイルの作成に使用したリード数
+        histograms: ポジションごとの {Phredスコア: 出現数}
+    """
+
+    reads: int = 0
+    histograms: tuple[dict[int, int], ...] = ()
+
+    @classmethod
+    def from_qualities(cls, qualities: list[bytes]) -> QualityProfile:
+        """
+        クオリティ行のリストからプロファイルを作成する
+
+        全てのリードを同じ長さに揃えて連結し、ストライド付きのスライスで
+        ポジションごとの列を取り出す。集計はbytes.countで行うため、
+        リード数に比例するPythonのループは発生しない。
+        """
+        if not qualities:
+            return cls()
+
+        width = max(map(len, qualities))
+        joined = b"".join(q.ljust(width, PADDING) for q in qualities)
+        symbols = set(joined) - set(PADDING)
+
+        histograms = []
+        for position in range(width):
+            column = joined[position::width]
+            histograms.append(
+                {
+                    symbol - PHRED_OFFSET: count
+                    for symbol in symbols
+                    if (count := column.count(symbol))
+                }
+            )
+
+        return cls(reads=len(qualities), histograms=tuple(histograms))
+
+    def __add__(self, other: QualityProfile) -> QualityProfile:
+        width = max(len(self.histograms), len(other.histograms))
+        merged = []
+        for position in range(width):
+            histogram = {}
+            for source in (self.histograms, other.histograms):
+                if position < len(source):
+                    for phred, count in source[position].items():
+                        histogram[phred] = histogram.get(phred, 0) + count
+            merged.append(histogram)
+
+        return QualityProfile(self.reads + other.reads, tuple(merged))
+
+    def coverage(self) -> list[float]:
+        """ポジションごとに、その位置まで到達しているリードの割合を返す"""
+        if self.reads == 0:
+            return []
+        return [sum(h.values()) / self.reads for h in self.histograms]
+
+    def quantile(self, q: float) -> list[int]:
+        """ポジションごとのクオリティ値の分位点を返す"""
+        result = []
+        for histogram in self.histograms:
+            total = sum(histogram.values())
+            cumulative = 0
+            for phred in sorted(histogram):
+                cumulative += histogram[phred]
+                if cumulative >= q * total:
+                    result.append(phred)
+                    break
+
+        return result
+
+
+def profile_fastq(
+    path: Path, sample_size: int = 10000, seed: int = 0
+) -> QualityProfile:
+    """1つのFASTQのクオリティプロファイルを作成する"""
+    return QualityProfile.from_qualities(reservoir_sample(path, sample_size, seed))
+
+
+def propose_truncation(
+    profile: QualityProfile,
+    threshold: int = 25,
+    quantile: float = 0.5,
+    min_coverage: float = 0.95,
+) -> int:
+    """
+    分位点がthresholdを下回る、またはリードが十分に到達していない
+    最初のポジションをトランケート長として返す
+    """
+    for position, (value, covered) in enumerate(
+        zip(profile.quantile(quantile), profile.coverage())
+    ):
+        if value < threshold or covered < min_coverage:
+            return position
+
+    return len(profile.histograms)
+
+
+def _readable_length(profile: QualityProfile, min_coverage: float) -> int:
+    """min_coverage以上のリードが到達している長さを返す"""
+    for position, covered in enumerate(profile.coverage()):
+        if covered < min_coverage:
+            return position
+    return len(profile.histograms)
+
+
+def _keep_overlap(
+    forward: QualityProfile,
+    reverse: QualityProfile,
+    trunc_len_f: int,
+    trunc_len_r: int,
+    required: int,
+    quantile: float,
+    min_coverage: float,
+) -> tuple[int, int]:
+    """
+    trunc_len_f + trunc_len_r がrequiredに届くまで、
+    次のポジションのクオリティが高い方を1塩基ずつ伸ばす
+    """
+    fwd_max = _readable_length(forward, min_coverage)
+    rvs_max = _readable_length(reverse, min_coverage)
+    fwd_q = forward.quantile(quantile)
+    rvs_q = reverse.quantile(quantile)
+
+    while trunc_len_f + trunc_len_r < required:
+        can_extend_f = trunc_len_f < fwd_max
+        can_extend_r = trunc_len_r < rvs_max
+        if not (can_extend_f or can_extend_r):
+            raise ValueError(
+                f"Reads are too short to keep the overlap: "
+                f"{fwd_max} + {rvs_max} < {required}"
+            )
+
+        if can_extend_f and (
+            not can_extend_r or fwd_q[trunc_len_f] >= rvs_q[trunc_len_r]
+        ):
+            trunc_len_f += 1
+        else:
+            trunc_len_r += 1
+
+    return trunc_len_f, trunc_len_r
+
+
+def propose_region(
+    pairs: Iterable[tuple[Path, Path]],
+    base: Region,
+    sample_size: int = 10000,
+    seed: int = 0,
+    threshold: int = 25,
+    quantile: float = 0.5,
+    min_coverage: float = 0.95,
+    min_overlap: int = 12,
+    amplicon_length: int | None = None,
+    max_workers: int | None = None,
+) -> Region:
+    """
+    R1/R2の組からクオリティプロファイルを作成し、トランケート長を推定したRegionを返す
+
+    trim_left_f, trim_left_rはbaseの値を引き継ぐ。
+
+    Args:
+        pairs: (R1, R2) のパスの組
+        base: 元となるRegion
+        sample_size: 各FASTQから抽出するリード数
+        seed: サンプリングに使用する乱数のシード
+        threshold: 許容する最低のクオリティ値
+        quantile: thresholdと比較するクオリティ値の分位点
+        min_coverage: トランケート長まで到達しているべきリードの割合
+        min_overlap: ペアエンドリードの結合に必要なオーバーラップ
+        amplicon_length: プライマーを含むアンプリコン長。
+            Noneの場合はAMPLICON_LENGTHSから取得し、無ければオーバーラップを考慮しない
+
+    Raises:
+        ValueError: オーバーラップを確保できない場合
+    """
+    pairs = list(pairs)
+    forward_files = [f for f, _ in pairs]
+    reverse_files = [r for _, r in pairs]
+
+    profiler = partial(profile_fastq, sample_size=sample_size, seed=seed)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        profiles = list(pool.map(profiler, forward_files + reverse_files))
+
+    forward = sum(profiles[: len(forward_files)], QualityProfile())
+    reverse = sum(profiles[len(forward_files) :], QualityProfile())
+
+    trunc_len_f = propose_truncation(forward, threshold, quantile, min_coverage)
+    trunc_len_r = propose_truncation(reverse, threshold, quantile, min_coverage)
+
+    if amplicon_length is None:
+        amplicon_length = AMPLICON_LENGTHS.get(base.name)
+    if amplicon_length is not None:
+        trunc_len_f, trunc_len_r = _keep_overlap(
+            forward,
+            reverse,
+            trunc_len_f,
+            trunc_len_r,
+            amplicon_length + min_overlap,
+            quantile,
+            min_coverage,
+        )
+
+    if trunc_len_f <= base.trim_left_f or trunc_len_r <= base.trim_left_r:
+        raise ValueError(
+            f"Proposed truncation ({trunc_len_f}, {trunc_len_r}) does not exceed "
+            f"trim_left ({base.trim_left_f}, {base.trim_left_r})"
+        )
+
+    return Region(
+        name=base.name,
+        trim_left_f=base.trim_left_f,
+        trim_left_r=base.trim_left_r,
+        trunc_len_f=trunc_len_f,
+        trunc_len_r=trunc_len_r,
+    )
@@ -0,0 +1,162 @@
+"""
+プレビュー実行のためのFASTQのサブサンプリング
+
+R1とR2を同時に読み進めて同じリードの組を選ぶため、出力のペアは常に揃っている。
+乱数のシードはサンプル名から決まるため、同じ入力からは常に同じ出力が得られる。
+"""
+
+from __future__ import annotations
+import argparse
+import gzip
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from qiime_pipeline.data.store import Dataset, Datasets
+from .fastq_io import is_gzipped, iter_reads, open_fastq
+from .fastq_scan import ScanCache, dataset_pairs, scan_fastq
+
+
+def parse_preview(value: str) -> float | int:
+    """
+    --previewの値を解釈する
+
+    小数点を含む値は割合(0 < x <= 1)、整数はサンプルあたりのリード数として扱う。
+    """
+    try:
+        amount = float(value) if "." in value else int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid preview amount: {value}")
+
+    if isinstance(amount, float) and not 0 < amount <= 1:
+        raise argparse.ArgumentTypeError(f"Preview fraction must be in (0, 1]: {value}")
+    if isinstance(amount, int) and amount < 1:
+        raise argparse.ArgumentTypeError(f"Preview read count must be >= 1: {value}")
+
+    return amount
+
+
+def _open_output(path: Path, compress: bool):
+    if compress:
+        # 一時的なファイルなので圧縮率より速度を優先する
+        return gzip.open(path, "wb", compresslevel=1)
+    return open(path, "wb")
+
+
+def _write_record(handle, header: bytes, seq: bytes, qual: bytes) -> None:
+    handle.write(b"%s\n%s\n+\n%s\n" % (header, seq, qual))
+
+
+def subsample_pair(
+    pair: tuple[Path, Path],
+    out_dir: Path,
+    amount: float | int,
+    seed: int = 0,
+    reads: int | None = None,
+) -> tuple[Path, Path]:
+    """
+    R1/R2の組からリードの組をサブサンプリングし、out_dirに同じファイル名で書き出す
+
+    Args:
+        pair: (R1, R2) のパス
+        out_dir: 出力先のディレクトリ
+        amount: 割合(float)またはリード数(int)
+        seed: 乱数のシード
+        reads: R1のリード数（preflightの結果など）。リード数で指定した場合に使い、
+            省略した場合はR1を読んで数える
+
+    Returns:
+        書き出した (R1, R2) のパス
+    """
+    forward, reverse = pair
+    out_fwd, out_rvs = out_dir / forward.name, out_dir / reverse.name
+
+    # 入力より新しい出力があれば、前回のプレビューの結果を再利用する
+    if all(
+        out.exists() and out.stat().st_mtime_ns >= src.stat().st_mtime_ns
+        for src, out in ((forward, out_fwd), (reverse, out_rvs))
+    ):
+        return out_fwd, out_rvs
+
+    rng = random.Random(f"{seed}:{forward.name}")
+    if isinstance(amount, int):
+        total = scan_fastq(forward).reads if reads is None else reads
+        selected = set(rng.sample(range(total), min(amount, total)))
+        keep = selected.__contains__
+    else:
+
+        def keep(_: int) -> bool:
+            return rng.random() < amount
+
+    # 中断された場合に不完全なファイルが再利用されないよう、書き終えてから置き換える
+    out_dir.mkdir(parents=True, exist_ok=True)
+    part_fwd = out_fwd.with_name(out_fwd.name + ".part")
+    part_rvs = out_rvs.with_name(out_rvs.name + ".part")
+    with (
+        open_fastq(forward) as f,
+        open_fastq(reverse) as r,
+        _open_output(part_fwd, is_gzipped(out_fwd)) as fo,
+        _open_output(part_rvs, is_gzipped(out_rvs)) as ro,
+    ):
+        for i, (fwd, rvs) in enumerate(zip(iter_reads(f), iter_reads(r))):
+            if keep(i):
+                _write_record(fo, *fwd)
+                _write_record(ro, *rvs)
+
+    part_fwd.replace(out_fwd)
+    part_rvs.replace(out_rvs)
+    return out_fwd, out_rvs
+
+
+def preview_datasets(
+    datasets: Datasets,
+    amount: float | int,
+    scratch_dir: Path,
+    seed: int = 0,
+    max_workers: int | None = None,
+    cache_path: Path | None = None,
+) -> Datasets:
+    """
+    全てのデータセットのFASTQをサブサンプリングし、
+    サブサンプリング後のFASTQを参照するDatasetsを返す
+
+    cache_pathにpreflightの検査結果のキャッシュを渡すと、リード数で指定した場合に
+    キャッシュにあるR1のリード数を使い、ファイルを数え直さない。
+
+    出力は scratch_dir/<amount>/<fastq_folderの名前>/ に書き出されるため、
+    コンテナ内のマウント先やマニフェストのパスは通常の実行と変わらない。
+    """
+    scratch_dir = scratch_dir / str(amount)
+
+    cache = ScanCache(cache_path)
+    jobs = []
+    for dataset in datasets.sets:
+        out_dir = scratch_dir / dataset.fastq_folder.name
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for pair in dataset_pairs(dataset):
+            cached = cache.lookup(pair[0].resolve())
+            reads = cached.reads if cached is not None and cached.ok else None
+            jobs.append((pair, out_dir, reads))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        sampler = partial(_subsample_job, amount=amount, seed=seed)
+        list(pool.map(sampler, jobs))
+
+    return Datasets(
+        sets={
+            Dataset(
+                name=dataset.name,
+                fastq_folder=scratch_dir / dataset.fastq_folder.name,
+                metadata_path=dataset.metadata_path,
+                region=dataset.region,
+            )
+            for dataset in datasets.sets
+        }
+    )
+
+
+def _subsample_job(
+    job: tuple[tuple[Path, Path], Path, int | None], amount, seed
+) -> tuple[Path, Path]:
+    pair, out_dir, reads = job
+    return subsample_pair(pair, out_dir, amount, seed, reads=reads)
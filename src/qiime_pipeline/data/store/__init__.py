@@ -1,4 +1,15 @@
 from .dataset import Datasets, Dataset
 from .generate_id import generate_id
+from .metadata_table import MetadataTable
 from .ribosome_regions import Region, Regions
-from .setting_data_structure import SettingData, ContainerData, PairPath
+from .setting_data_structure import (
+    SettingData,
+    ContainerData,
+    PairPath,
+    PullPolicy,
+    OutputMode,
+    ReapMode,
+    ScratchData,
+)
+from .primers import PrimerPair, KNOWN_PRIMERS
+from .sample_registry import SampleIdRegistry
@@ -2,6 +2,7 @@ from __future__ import annotations
 import dataclasses
 from pathlib import Path
 import tomlkit
+from .metadata_table import MetadataTable
 from .ribosome_regions import Region
 
 
@@ -22,12 +23,8 @@ class Dataset:
             *list(fastq_folder.glob("*.fastq.gz")),
         ]
 
-    def __get_metadata(self) -> list[str]:
-        with self.metadata_path.open() as f:
-            return [
-                raw_csv_text.replace("\n", "").split(",")
-                for raw_csv_text in f.readlines()
-            ]
+    def __get_metadata(self) -> MetadataTable:
+        return MetadataTable.from_csv(self.metadata_path)
 
     def __post_init__(self):
         if not self.fastq_folder.exists():
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import csv
+from array import array
+from pathlib import Path
+from typing import Iterator, Sequence, overload
+
+
+class MetadataTable(Sequence[list[str]]):
+    """
+    メタデータを列ごとに保持するテーブル
+
+    各セルの値は文字列プールに一度だけ登録し、列はそのインデックスの
+    配列(array)として保持する。同じ値が繰り返し現れる列(種名や宿主など)では
+    行ごとにlistを持つよりも大幅にメモリを削減できる。
+
+    後方互換性のため、シーケンスとしては
+    「先頭にヘッダー行を持つ行のリスト」として振る舞う。
+    """
+
+    def __init__(self, header: list[str], columns: list[array], pool: list[str]):
+        self.__header = header
+        self.__columns = columns
+        self.__pool = pool
+        self.__index = {name: i for i, name in enumerate(header)}
+        self.__orders: dict[int, Sequence[int]] = {}
+
+    @classmethod
+    def from_csv(cls, path: Path, delimiter: str = ",") -> MetadataTable:
+        """
+        csvモジュールでファイルを1行ずつ読み込み、テーブルを作成する
+        引用符で囲まれた値に含まれる区切り文字も正しく扱われる
+
+        Raises:
+            ValueError: ヘッダーより多くの値を持つ行がある場合
+        """
+        pool: list[str] = []
+        interned: dict[str, int] = {}
+
+        def intern(value: str) -> int:
+            code = interned.get(value)
+            if code is None:
+                code = interned[value] = len(pool)
+                pool.append(value)
+            return code
+
+        with Path(path).open(newline="") as f:
+            reader = csv.reader(f, delimiter=delimiter)
+            header = next(reader, [])
+            width = len(header)
+            columns = [array("I") for _ in header]
+
+            for row in reader:
+                if not row:
+                    continue
+
+                if len(row) > width:
+                    # 末尾の区切り文字による空の値は無視する
+                    if any(row[width:]):
+                        raise ValueError(
+                            f"{path}:{reader.line_num}: "
+                            f"expected {width} fields, got {len(row)}"
+                        )
+                    row = row[:width]
+                elif len(row) < width:
+                    row = row + [""] * (width - len(row))
+
+                for column, value in zip(columns, row):
+                    column.append(intern(value))
+
+        return cls(header, columns, pool)
+
+    @property
+    def header(self) -> list[str]:
+        """ファイルに書かれたままのヘッダー"""
+        return list(self.__header)
+
+    @property
+    def n_rows(self) -> int:
+        """ヘッダーを除いた行数"""
+        return len(self.__columns[0]) if self.__columns else 0
+
+    def column_index(self, name: str) -> int:
+        if name not in self.__index:
+            raise KeyError(f"Column {name} not found.")
+        return self.__index[name]
+
+    def column(self, key: str | int) -> list[str]:
+        """列名または列のインデックスを指定して、列の値を返す"""
+        index = key if isinstance(key, int) else self.column_index(key)
+        pool = self.__pool
+        return [pool[code] for code in self.__columns[index]]
+
+    def row(self, i: int) -> list[str]:
+        """ヘッダーを除いたi番目の行を返す"""
+        pool = self.__pool
+        return [pool[column[i]] for column in self.__columns]
+
+    def rows(self) -> Iterator[list[str]]:
+        """ヘッダーを除いた行を順に返す"""
+        pool = self.__pool
+        for codes in zip(*self.__columns):
+            yield [pool[code] for code in codes]
+
+    def sorted_rows(self, key: str | int = 0) -> Iterator[list[str]]:
+        """
+        指定した列の値で並べ替えた行を順に返す
+
+        並び順は列ごとに一度だけ計算して保持する。
+        ファイルが既に並んでいる場合は並べ替えを行わない。
+        """
+        index = key if isinstance(key, int) else self.column_index(key)
+        order = self.__orders.get(index)
+        if order is None:
+            order = self.__orders[index] = self.__sort_order(index)
+
+        pool, columns = self.__pool, self.__columns
+        for i in order:
+            yield [pool[column[i]] for column in columns]
+
+    def __sort_order(self, index: int) -> Sequence[int]:
+        values = self.column(index)
+        if all(a <= b for a, b in zip(values, values[1:])):
+            return range(len(values))
+        return array("I", sorted(range(len(values)), key=values.__getitem__))
+
+    def __len__(self) -> int:
+        return self.n_rows + 1
+
+    @overload
+    def __getitem__(self, i: int) -> list[str]: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> list[list[str]]: ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("MetadataTable index out of range")
+
+        return self.header if i == 0 else self.row(i - 1)
+
+    def __iter__(self) -> Iterator[list[str]]:
+        yield self.header
+        yield from self.rows()
@@ -0,0 +1,37 @@
+from __future__ import annotations
+import dataclasses
+
+
+@dataclasses.dataclass(frozen=True)
+class PrimerPair:
+    """
+    16S rRNA遺伝子の領域を増幅するプライマーの組
+
+    配列はIUPACの縮重塩基表記を含む5'->3'の向きで保持する。
+
+    Attributes:
+        region_name: 増幅される領域の名前 (Regionsのキーと一致させる)
+        forward: フォワードプライマーの配列
+        reverse: リバースプライマーの配列
+    """
+
+    region_name: str
+    forward: str
+    reverse: str
+
+
+# 341F / 805R (db_generateでのリード抽出と同じプライマー)
+V3V4_PRIMERS = PrimerPair(
+    region_name="V3V4",
+    forward="CCTACGGGNGGCWGCAG",
+    reverse="GACTACHVGGGTATCTAATCC",
+)
+
+# 515F (Parada) / 806R (Apprill)
+V4_PRIMERS = PrimerPair(
+    region_name="V4",
+    forward="GTGYCAGCMGCCGCGGTAA",
+    reverse="GGACTACNVGGGTWTCTAAT",
+)
+
+KNOWN_PRIMERS: tuple[PrimerPair, ...] = (V3V4_PRIMERS, V4_PRIMERS)
@@ -9,6 +9,13 @@ import tomlkit
 # 	--p-trunc-len-f 250 \
 # 	--p-trunc-len-r 250 \
 
+# プライマーを含むアンプリコン長 (E. coli 16S rRNA遺伝子の位置から算出)
+# trunc_len_f + trunc_len_r がこの長さを下回ると、ペアエンドリードを結合できない
+AMPLICON_LENGTHS = {
+    "V3V4": 465,
+    "V4": 292,
+}
+
 
 class Region:
     def __init__(
@@ -92,6 +99,17 @@ class V3V4(Region):
         )
 
 
+class V4(Region):
+    def __init__(self):
+        super().__init__(
+            name="V4",
+            trim_left_f=19,
+            trim_left_r=20,
+            trunc_len_f=150,
+            trunc_len_r=150,
+        )
+
+
 class Debug(Region):
     def __init__(self):
         super().__init__(
@@ -107,6 +125,7 @@ class Regions(dict[str, Region]):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self["V3V4"] = V3V4()
+        self["V4"] = V4()
         self["Debug"] = Debug()
 
     def add_region(self, region: Region):
@@ -0,0 +1,62 @@
+from __future__ import annotations
+import sqlite3
+from pathlib import Path
+
+
+class SampleIdRegistry:
+    """
+    RawIDとSampleIDの対応を保持するレジストリ
+
+    対応はSQLiteのファイルに保存されるため、実行をまたいでも
+    既存のサンプルには常に同じSampleIDが割り当てられる。
+    新しいサンプルには、これまでに割り当てた番号の最大値+1が割り当てられる。
+    サンプルを削除しても番号は再利用しない。
+    """
+
+    def __init__(self, path: Path, id_prefix: str = "id"):
+        self.path = Path(path)
+        self.id_prefix = id_prefix
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.__conn = sqlite3.connect(self.path)
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            " raw_id TEXT PRIMARY KEY,"
+            " number INTEGER NOT NULL UNIQUE)"
+        )
+        self.__numbers: dict[str, int] = dict(
+            self.__conn.execute("SELECT raw_id, number FROM samples")
+        )
+        self.__next = max(self.__numbers.values(), default=0) + 1
+
+    def number(self, raw_id: str) -> int:
+        """RawIDに対応する番号を返す。未登録であれば新しい番号を割り当てる"""
+        number = self.__numbers.get(raw_id)
+        if number is None:
+            number = self.__numbers[raw_id] = self.__next
+            self.__next += 1
+            self.__conn.execute(
+                "INSERT INTO samples (raw_id, number) VALUES (?, ?)",
+                (raw_id, number),
+            )
+        return number
+
+    def sample_id(self, raw_id: str) -> str:
+        """RawIDに対応するSampleIDを返す"""
+        return self.id_prefix + str(self.number(raw_id))
+
+    def commit(self) -> None:
+        self.__conn.commit()
+
+    def close(self) -> None:
+        self.__conn.commit()
+        self.__conn.close()
+
+    def __enter__(self) -> SampleIdRegistry:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            # 失敗した実行で割り当てた番号は保存しない
+            self.__conn.rollback()
+        self.close()
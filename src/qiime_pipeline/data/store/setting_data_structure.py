@@ -6,6 +6,7 @@
 
 from __future__ import annotations
 import dataclasses
+from enum import Enum
 from pathlib import Path
 from typing import Callable
 from .dataset import Datasets
@@ -16,6 +17,46 @@ from .generate_id import generate_id
 DEFAULT_SAMPLING_DEPTH = 10000
 
 
+class PullPolicy(Enum):
+    """
+    イメージを取得する方針
+
+    always: 常にレジストリから取得する\n
+    if-not-present: ローカルに存在しない場合のみ取得する\n
+    never: 取得せず、ローカルのイメージのみを使用する
+    """
+
+    ALWAYS = "always"
+    IF_NOT_PRESENT = "if-not-present"
+    NEVER = "never"
+
+
+class OutputMode(Enum):
+    """
+    コンテナの出力をローカルに取り出す方法
+
+    copy: 実行後にdocker cpで出力ディレクトリをコピーする\n
+    bind: バッチごとの出力ディレクトリをバインドマウントし、生成と同時にローカルへ書き出す
+    """
+
+    COPY = "copy"
+    BIND = "bind"
+
+
+class ReapMode(Enum):
+    """
+    後続のコマンドに使われなくなった中間生成物の扱い
+
+    off: 実行終了まで残す\n
+    delete: 最後の利用者が終了した時点で削除する\n
+    archive: 最後の利用者が終了した時点で出力ディレクトリのarchiveに移動する
+    """
+
+    OFF = "off"
+    DELETE = "delete"
+    ARCHIVE = "archive"
+
+
 # --- Value Objects ---
 @dataclasses.dataclass(frozen=True)
 class PairPath:
@@ -70,6 +111,56 @@ class PairPath:
         ]
 
 
+@dataclasses.dataclass(frozen=True)
+class ScratchData:
+    """
+    中間生成物とQIIMEの一時ファイル(TMPDIR)を置く高速な領域
+
+    host_pathを指定した場合はホストのディレクトリ(NVMeなど)を、
+    指定しない場合はtmpfsをctn_pathにマウントする。
+
+    Attributes:
+        ctn_path: コンテナ内のマウント先
+        host_path: ホスト側のディレクトリ（Noneの場合はtmpfs）
+        tmpfs_size: tmpfsの上限サイズ（バイト、Noneの場合は既定値）
+    """
+
+    ctn_path: Path = Path("/scratch")
+    host_path: Path | None = None
+    tmpfs_size: int | None = None
+
+    @property
+    def is_tmpfs(self) -> bool:
+        return self.host_path is None
+
+    @property
+    def tmpdir(self) -> Path:
+        """コンテナ内でTMPDIRに設定するパス"""
+        return self.ctn_path
+
+    @property
+    def intermediate_path(self) -> Path:
+        """中間生成物を置くコンテナ内のディレクトリ"""
+        return self.ctn_path / "intermediate"
+
+    def to_mount_option(self, batch_id: str) -> list[str]:
+        """
+        Dockerマウントオプションを生成する
+        ホストのディレクトリは実行ごとにbatch_idのサブディレクトリを使う
+        """
+        if self.is_tmpfs:
+            option = ["type=tmpfs", f"dst={self.ctn_path}"]
+            if self.tmpfs_size is not None:
+                option.append(f"tmpfs-size={self.tmpfs_size}")
+            return option
+
+        local = self.host_path / str(batch_id)
+        local.mkdir(parents=True, exist_ok=True)
+        return PairPath(local_pos=local, ctn_pos=self.ctn_path).to_mount_option(
+            readonly=False
+        )
+
+
 @dataclasses.dataclass(frozen=True)
 class ContainerData:
     """
@@ -82,12 +173,18 @@ class ContainerData:
         workspace_path: コンテナ内のワークスペースディレクトリ
         output_path: 出力ディレクトリのパス（ローカル/コンテナ）
         database_path: データベースファイルのパス（ローカル/コンテナ）
+        pull_policy: イメージの取得方針（always / if-not-present / never）
+        output_mode: 出力をローカルに取り出す方法
+        scratch: 中間生成物とTMPDIRを置く領域（Noneの場合は出力ディレクトリに置く）
     """
 
     image_or_dockerfile: str | Path
     workspace_path: Path
     output_path: PairPath
     database_path: PairPath
+    pull_policy: PullPolicy = PullPolicy.IF_NOT_PRESENT
+    output_mode: OutputMode = OutputMode.COPY
+    scratch: ScratchData | None = None
 
 
 @dataclasses.dataclass(frozen=True)
@@ -103,6 +200,9 @@ class SettingData:
         datasets: 解析対象のデータセット
         sampling_depth: サンプリング深度（デフォルト: 10000）
         batch_id: バッチ実行の識別子（自動生成）
+        reap_mode: 使われなくなった中間生成物の扱い
+        keep_results: reap_modeに関わらず残す結果の名前またはファイル名のパターン
+        workers: 同時に実行するコマンドの最大数
 
     Example:
         >>> setting = SettingData(
@@ -118,6 +218,9 @@ class SettingData:
     datasets: Datasets
     sampling_depth: int = DEFAULT_SAMPLING_DEPTH
     batch_id: str = dataclasses.field(default_factory=generate_id)
+    reap_mode: ReapMode = ReapMode.OFF
+    keep_results: tuple[str, ...] = ()
+    workers: int = 1
 
     # ========================================
     # 便利なアクセサプロパティ
@@ -153,6 +256,38 @@ class SettingData:
         """Dockerイメージまたは Dockerfile"""
         return self.container_data.image_or_dockerfile
 
+    @property
+    def local_batch_output_path(self) -> Path:
+        """バッチごとのローカルの出力ディレクトリパス"""
+        return self.local_output_path / str(self.batch_id)
+
+    @property
+    def scratch(self) -> ScratchData | None:
+        """中間生成物とTMPDIRを置く領域"""
+        return self.container_data.scratch
+
+    @property
+    def ctn_intermediate_path(self) -> Path:
+        """コンテナ内の中間生成物のディレクトリパス"""
+        if self.scratch is None:
+            return self.ctn_output_path
+        return self.scratch.intermediate_path
+
+    @property
+    def ctn_archive_path(self) -> Path:
+        """reap_modeがarchiveの場合に中間生成物を移動するコンテナ内のディレクトリ"""
+        return self.ctn_output_path / "archive"
+
+    @property
+    def output_mode(self) -> OutputMode:
+        """出力をローカルに取り出す方法"""
+        return self.container_data.output_mode
+
+    @property
+    def pull_policy(self) -> PullPolicy:
+        """イメージの取得方針"""
+        return self.container_data.pull_policy
+
     @property
     def output_pair(self) -> PairPath:
         """出力パスのペア（ローカル/コンテナ）"""
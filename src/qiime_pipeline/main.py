@@ -1,9 +1,26 @@
 #!/usr/bin/env python
 
+import socket
+import sys
+from argparse import Namespace
+from dataclasses import replace
+from .data.store import OutputMode
 from .pipeline import commands
-from .pipeline.main.setup import setup
+from .pipeline.main.exporter import ArtifactExporter
+from .pipeline.main.history import (
+    DEFAULT_HISTORY_PATH,
+    FeatureCounter,
+    RunHistory,
+    RunInfo,
+    count_samples,
+)
+from .pipeline.main.profiling import CommandProfiler
+from .pipeline.main.resources import ResourceSampler
+from .pipeline.main.setup import setup_context
+from .pipeline.main.telemetry import TELEMETRY_FILE_NAME, TelemetryRecorder
 from .pipeline.main.util import copy_from_container
-from .pipeline.support import PipelineType
+from .pipeline.support import PipelineContext, PipelineType, argument_parser
+from .pipeline.support.trace import Tracer, get_tracer, set_tracer, span
 
 
 def _pipeline_func(pipeline_type: PipelineType) -> callable:
@@ -18,12 +35,181 @@ def _pipeline_func(pipeline_type: PipelineType) -> callable:
             raise ValueError(f"Unsupported pipeline type: {pipeline_type}")
 
 
-def main():
-    context = setup()
+def _attach_exporter(context: PipelineContext) -> ArtifactExporter | None:
+    """
+    バインドマウントしていない場合、終了したコマンドの出力を逐次ローカルに書き出す
+    """
+    if context.setting.output_mode is OutputMode.BIND:
+        return None
+
+    exporter = ArtifactExporter(
+        executor=context.executor,
+        container_id=context.executor.id(),
+        ctn_root=context.setting.ctn_output_path,
+        local_root=context.setting.local_batch_output_path,
+    )
+    context.events.subscribe(exporter)
+    return exporter
+
+
+def _attach_telemetry(
+    context: PipelineContext,
+    sampler: ResourceSampler | None,
+    profiler: CommandProfiler | None = None,
+) -> TelemetryRecorder:
+    """コマンドごとの実行記録をバッチの出力ディレクトリに書き出す"""
+    recorder = TelemetryRecorder(
+        executor=context.executor,
+        path=context.setting.local_batch_output_path / TELEMETRY_FILE_NAME,
+        sampler=sampler,
+        profiler=profiler,
+    )
+    context.events.subscribe(recorder)
+    return recorder
+
+
+def _open_history(
+    args: Namespace, context: PipelineContext
+) -> tuple[RunHistory | None, PipelineContext]:
+    """
+    実行履歴を開き、履歴があれば予測実行時間をコンテキストに設定する
+    予測は残り時間の表示と並列実行の優先度に使われる
+    """
+    if args.no_history:
+        return None, context
+    history = RunHistory(args.history or DEFAULT_HISTORY_PATH)
+    model = history.model()
+    if model.commands:
+        samples = count_samples(context.setting.datasets)
+        context = replace(context, cost_model=model.for_run(samples))
+    return history, context
+
+
+def _save_history(
+    history: RunHistory,
+    context: PipelineContext,
+    counter: FeatureCounter,
+    recorder: TelemetryRecorder,
+) -> None:
+    """
+    実行記録を履歴に追加する
+    パイプラインの例外を置き換えないよう、失敗しても警告を表示するだけにする
+    （既定の履歴は同時に実行した他のバッチと共有され、ロックされている場合がある）
+    """
+    # image_idはCommandExecutorのインターフェースに含まれない
+    image_id = getattr(context.executor, "image_id", None)
+    try:
+        run = RunInfo(
+            batch_id=str(context.setting.batch_id),
+            host=socket.gethostname(),
+            image=None if image_id is None else image_id(),
+            samples=count_samples(context.setting.datasets),
+            features=counter.features,
+        )
+        history.add(run, recorder.records)
+    except Exception as e:
+        print(f"Warning: failed to save the run history: {e}", file=sys.stderr)
+    finally:
+        history.close()
+
+
+def _clean_scratch(context: PipelineContext) -> None:
+    """
+    ホストのディレクトリをスクラッチに使った場合、中間生成物を削除する
+    tmpfsはコンテナの停止とともに破棄される
+    """
+    scratch = context.setting.scratch
+    if scratch is None or scratch.is_tmpfs:
+        return
+    context.executor.run(["find", str(scratch.ctn_path), "-mindepth", "1", "-delete"])
 
-    _pipeline_func(context.pipeline_type)(context)
-    copy_from_container(context, context.setting.ctn_output_path)
-    context.executor.stop()
+
+def _shutdown(
+    context: PipelineContext, exporter: ArtifactExporter | None, failed: bool
+) -> None:
+    """
+    実行の成否にかかわらず、書き出しの完了を待ち、スクラッチとコンテナを片付ける
+
+    いずれかの手順が失敗しても残りの手順は実行する。
+    パイプラインが失敗している場合は、元の例外を置き換えないよう警告の表示のみとする。
+    """
+    steps = []
+    if exporter is not None:
+        steps.append(("export close", exporter.close))
+    steps.append(("clean scratch", lambda: _clean_scratch(context)))
+    steps.append(("container stop", context.executor.stop))
+
+    error = None
+    for name, step in steps:
+        try:
+            with span(name):
+                step()
+        except Exception as e:
+            if failed:
+                print(f"Warning: {name} failed: {e}", file=sys.stderr)
+            elif error is None:
+                error = e
+    if error is not None:
+        raise error
+
+
+def _run(args: Namespace) -> None:
+    context = setup_context(args)
+    history, context = _open_history(args, context)
+    exporter = _attach_exporter(context)
+    sampler = (
+        ResourceSampler(context.executor, interval=args.sample_interval)
+        if args.sample_interval > 0
+        else None
+    )
+    profiler = (
+        CommandProfiler(
+            context.executor,
+            args.profile,
+            local_root=context.setting.local_batch_output_path,
+            python=args.profile_python,
+        )
+        if args.profile
+        else None
+    )
+    recorder = _attach_telemetry(context, sampler, profiler)
+    counter = context.events.subscribe(FeatureCounter(context.executor))
+    context.events.subscribe(get_tracer())
+
+    failed = True
+    try:
+        try:
+            _pipeline_func(context.pipeline_type)(context)
+        finally:
+            if sampler is not None:
+                sampler.close()
+            if recorder.records:
+                print(recorder.summary())
+                print(f"Telemetry: {recorder.path}")
+            if history is not None:
+                _save_history(history, context, counter, recorder)
+        if exporter is None:
+            with span("copy_from_container"):
+                copy_from_container(context, context.setting.ctn_output_path)
+        else:
+            # イベントに現れなかった出力のみを回収する
+            with span("export sync"):
+                exporter.sync()
+        failed = False
+    finally:
+        _shutdown(context, exporter, failed)
+
+
+def main():
+    args = argument_parser().parse_args()
+    tracer = None if args.trace is None else Tracer()
+    set_tracer(tracer)
+    try:
+        _run(args)
+    finally:
+        if tracer is not None:
+            tracer.write(args.trace)
+            print(f"Trace: {args.trace}")
 
 
 if __name__ == "__main__":
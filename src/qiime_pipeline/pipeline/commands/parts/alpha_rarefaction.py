@@ -10,9 +10,12 @@ class alpha_rarefaction(support.Pipeline):
             self._assembly.new_cmd("qiime phylogeny align-to-tree-mafft-fasttree")
             .add_option("quiet")
             .add_input("sequences", inputs["denoised_seq"])
-            .add_output("alignment", self._output / "aligned-rep-seqs.qza")
-            .add_output("masked-alignment", self._output / "masked-aligned-rep-seq.qza")
-            .add_output("tree", self._output / "unrooted-tree.qza")
+            .add_output("alignment", self._intermediate_output("aligned-rep-seqs.qza"))
+            .add_output(
+                "masked-alignment",
+                self._intermediate_output("masked-aligned-rep-seq.qza"),
+            )
+            .add_output("tree", self._intermediate_output("unrooted-tree.qza"))
             .add_output("rooted-tree", self._output / "rooted-tree.qza")
             .get_outputs()
         )
@@ -1,4 +1,5 @@
 from qiime_pipeline.pipeline import support
+from qiime_pipeline.data.store.primers import V3V4_PRIMERS
 
 
 class db_generate(support.Pipeline):
@@ -19,8 +20,8 @@ class db_generate(support.Pipeline):
             .add_input("sequences", silva_seq)
             .add_parameter("min-length", "350")
             .add_parameter("max-length", "500")
-            .add_parameter("f-primer", "CCTACGGGNGGCWGCAG")
-            .add_parameter("r-primer", "GACTACHVGGGTATCTAATCC")
+            .add_parameter("f-primer", V3V4_PRIMERS.forward)
+            .add_parameter("r-primer", V3V4_PRIMERS.reverse)
             .add_output("reads", self._output / "silva-reads.qza")
             .get_outputs()
         )
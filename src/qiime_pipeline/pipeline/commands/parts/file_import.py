@@ -10,7 +10,9 @@ class file_import(support.Pipeline):
             .add_option("type", "SampleData[PairedEndSequencesWithQuality]")
             .add_option("input-format", "PairedEndFastqManifestPhred33V2")
             .add_option("input-path", self._context.paths.manifest)
-            .add_option("output-path", self._output / "paired_end_demux.qza")
+            .add_option(
+                "output-path", self._intermediate_output("paired_end_demux.qza")
+            )
             .get_outputs()
         )
 
@@ -26,8 +28,11 @@ class file_import(support.Pipeline):
             .add_parameter("trim-left-r", str(region.trim_left_r))
             .add_parameter("trunc-len-f", str(region.trunc_len_f))
             .add_parameter("trunc-len-r", str(region.trunc_len_r))
-            .add_output("table", self._output / "denoised_table.qza")
-            .add_output("representative-sequences", self._output / "denoised_seq.qza")
+            .add_output("table", self._intermediate_output("denoised_table.qza"))
+            .add_output(
+                "representative-sequences",
+                self._intermediate_output("denoised_seq.qza"),
+            )
             .add_output("denoising-stats", self._output / "denoised_stats.qza")
             .add_output("base-transition-stats", self._output / "base-transition-stats.qza")
             .get_outputs()
@@ -8,12 +8,17 @@ class phylogeny(support.Pipeline):
             self._assembly.new_cmd("qiime phylogeny align-to-tree-mafft-fasttree")
             .add_option("quiet")
             .add_input("sequences", inputs["bio_free_seq"])
-            .add_output("alignment", self._output / "biology_free_aligned_rep_seqs.qza")
+            .add_output(
+                "alignment",
+                self._intermediate_output("biology_free_aligned_rep_seqs.qza"),
+            )
             .add_output(
                 "masked-alignment",
-                self._output / "biology_free_masked_aligned_rep_seqs.qza",
+                self._intermediate_output("biology_free_masked_aligned_rep_seqs.qza"),
+            )
+            .add_output(
+                "tree", self._intermediate_output("biology_free_unrooted_tree.qza")
             )
-            .add_output("tree", self._output / "biology_free_unrooted_tree.qza")
             .add_output("rooted-tree", self._output / "biology_free_rooted_tree.qza")
             .get_outputs()
         )
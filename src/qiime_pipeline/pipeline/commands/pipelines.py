@@ -1,62 +1,78 @@
+from qiime_pipeline.pipeline.support.progress import ProgressReporter
+from qiime_pipeline.pipeline.support.trace import span
 from . import parts
 
+ALPHA_RAREFACTION_PARTS = [
+    parts.file_import,
+    parts.alpha_rarefaction,
+]
+
+DB_PARTS = [parts.file_import, parts.db_generate]
+
+BASIC_PARTS = [
+    parts.file_import,
+    parts.filtering,
+    parts.classified,
+    parts.remove_biology,
+    parts.phylogeny,
+    parts.core_metrics,
+    parts.taxonomy,
+    parts.alpha_analysis,
+    parts.beta_analysis,
+]
+
+ANCOM_PARTS = [
+    parts.file_import,
+    parts.filtering,
+    parts.classified,
+    parts.remove_biology,
+    parts.phylogeny,
+    parts.core_metrics,
+    parts.taxa_collapse,
+    parts.ancombc,
+    lambda context: parts.adonis(
+        context, beta_index="unweighted_unifrac_distance_matrix"
+    ),
+    lambda context: parts.adonis(
+        context, beta_index="weighted_unifrac_distance_matrix"
+    ),
+]
+
+
+def pipeline_build(context, cmd_parts: list):
+    """パーツを連結し、実行せずにパイプラインを返す"""
+    with span("plan build"):
+        first_one = cmd_parts[0](context)
+        return sum(map(lambda part: part(context), cmd_parts[1:]), first_one)
+
 
 def pipeline_run(context, cmd_parts: list):
-    first_one = cmd_parts[0](context)
-    pipeline = sum(map(lambda part: part(context), cmd_parts[1:]), first_one)
-    return pipeline.run()
+    pipeline = pipeline_build(context, cmd_parts)
+    workers, cost = context.setting.workers, context.cost_model
+    if cost is None:
+        return pipeline.run(workers=workers)
+
+    # 予測実行時間がある場合は、残り時間を表示し、並列実行の優先度にも使う
+    progress = context.events.subscribe(
+        ProgressReporter(pipeline.assembly, cost, workers)
+    )
+    try:
+        return pipeline.run(workers=workers, cost=cost)
+    finally:
+        context.events.unsubscribe(progress)
 
 
 def pipeline_alpha_rarefaction(context):
-    return pipeline_run(
-        context,
-        [
-            parts.file_import,
-            parts.alpha_rarefaction,
-        ],
-    )
+    return pipeline_run(context, ALPHA_RAREFACTION_PARTS)
 
 
 def pipeline_db(context):
-    return pipeline_run(
-        context,
-        [parts.file_import, parts.db_generate],
-    )
+    return pipeline_run(context, DB_PARTS)
 
 
 def pipeline_basic(context):
-    return pipeline_run(
-        context,
-        [
-            parts.file_import,
-            parts.filtering,
-            parts.classified,
-            parts.remove_biology,
-            parts.phylogeny,
-            parts.core_metrics,
-            parts.taxonomy,
-            parts.alpha_analysis,
-            parts.beta_analysis,
-        ],
-    )
+    return pipeline_run(context, BASIC_PARTS)
 
 
 def pipeline_ancom(context):
-    cmds = [
-        parts.file_import,
-        parts.filtering,
-        parts.classified,
-        parts.remove_biology,
-        parts.phylogeny,
-        parts.core_metrics,
-        parts.taxa_collapse,
-        parts.ancombc,
-        lambda context: parts.adonis(
-            context, beta_index="unweighted_unifrac_distance_matrix"
-        ),
-        lambda context: parts.adonis(
-            context, beta_index="weighted_unifrac_distance_matrix"
-        ),
-    ]
-
-    return pipeline_run(context, cmds)
+    return pipeline_run(context, ANCOM_PARTS)
@@ -0,0 +1,246 @@
+"""
+成果物の逐次書き出し
+
+コマンドの終了イベントを受け取るたびに、その出力をバックグラウンドのスレッドで
+コンテナからローカルへコピーする。パイプラインの実行とコピーが重なるため、
+実行終了後に残るのは最後の成果物のコピー程度になる。
+
+コピーは `docker cp CONTAINER:PATH -` のtarストリームを読みながら展開し、
+コンテナ内で計算したsha256とサイズを照合してから配置する。
+ローカルに同じ内容のファイルが既にある場合はコピーしない。
+
+中間生成物の早期削除(ArtifactReaper)と併用する場合に備え、終了したコマンドの
+入力の書き出しが完了するまでイベントの処理を返さない。ArtifactReaperより先に
+登録しておけば、書き出し中のファイルが削除されることはない。
+
+同じパスに出力するコマンドが複数ある場合、後のコマンドの開始時にそのパスの書き出しの
+完了を待ち、後のコマンドの実行中に終了した前のコマンドの出力は書き出さない
+（上書き中のファイルをコピーしないため。最後に書いたコマンドの出力が書き出される）。
+"""
+
+from __future__ import annotations
+import hashlib
+import subprocess
+import sys
+import tarfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path, PurePosixPath
+from qiime_pipeline.pipeline.support.context import CommandExecutor
+from qiime_pipeline.pipeline.support.events import (
+    FAILED,
+    FINISHED,
+    STARTED,
+    CommandEvent,
+)
+
+
+class ExportError(RuntimeError):
+    """成果物の書き出しに失敗した場合のエラー"""
+
+    pass
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_sha256sum(output: str) -> dict[str, str]:
+    """sha256sumの出力を {パス: ダイジェスト} の辞書に変換する"""
+    digests = {}
+    for line in output.splitlines():
+        digest, _, path = line.strip().partition("  ")
+        if path:
+            digests[path] = digest
+    return digests
+
+
+class ArtifactExporter:
+    """
+    コマンドの終了イベントを受け取り、出力をローカルに書き出すリスナー
+
+    ctn_root以下の出力のみを対象とし、ローカルでは
+    local_root / (ctn_rootの名前) / (ctn_rootからの相対パス) に配置する。
+    これはcopy_from_containerやバインドマウントの場合と同じ配置である。
+    """
+
+    def __init__(
+        self,
+        executor: CommandExecutor,
+        container_id: str,
+        ctn_root: Path,
+        local_root: Path,
+        max_workers: int = 4,
+    ):
+        self.__executor = executor
+        self.__container_id = container_id
+        self.__ctn_root = PurePosixPath(ctn_root)
+        self.__local_root = local_root
+        self.__pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="exporter"
+        )
+        self.__futures: list[Future] = []
+        self.__pending: dict[str, Future] = {}
+        # 実行中のコマンドの出力パスと、そのパスに出力中のコマンドの数
+        self.__writers: dict[int, list[str]] = {}
+        self.__writing: dict[str, int] = {}
+        self.__lock = threading.Lock()
+        self.exported: list[Path] = []
+        self.skipped: list[Path] = []
+
+    def __call__(self, event: CommandEvent) -> None:
+        if event.kind == STARTED:
+            # 出力先のファイルを書き出している途中で上書きしないよう、完了を待つ
+            with self.__lock:
+                self.__writers[event.index] = event.outputs
+                for path in event.outputs:
+                    self.__writing[path] = self.__writing.get(path, 0) + 1
+            self.__wait_for(event.outputs)
+            return
+        if event.kind not in (FINISHED, FAILED):
+            return
+
+        with self.__lock:
+            for path in self.__writers.pop(event.index, []):
+                self.__writing[path] -= 1
+                if not self.__writing[path]:
+                    del self.__writing[path]
+            # 実行中の他のコマンドが上書きする出力は、そのコマンドの終了時に書き出す
+            outputs = [path for path in event.outputs if path not in self.__writing]
+        if event.kind == FAILED:
+            return
+
+        # 入力が後続のリスナーに削除される前に書き出しを終える
+        self.__wait_for(event.command.get_inputs())
+
+        for output in outputs:
+            if PurePosixPath(output).is_relative_to(self.__ctn_root):
+                self.submit(output)
+
+    def __wait_for(self, paths: list[str]) -> None:
+        """pathsの書き出しのうち、実行中のものの完了を待つ"""
+        with self.__lock:
+            pending = [self.__pending.get(path) for path in paths]
+        wait([future for future in pending if future is not None])
+
+    def local_path(self, ctn_path: str) -> Path:
+        relative = PurePosixPath(ctn_path).relative_to(self.__ctn_root.parent)
+        return self.__local_root / relative
+
+    def submit(self, ctn_path: str, digest: str | None = None) -> Future:
+        future = self.__pool.submit(self.export, ctn_path, digest)
+        with self.__lock:
+            self.__futures.append(future)
+            self.__pending[str(ctn_path)] = future
+        return future
+
+    def remote_digests(self, ctn_path: str) -> dict[str, str]:
+        """コンテナ内のctn_path以下の全てのファイルのsha256を、1回のexecで取得する"""
+        output = self.__executor.run(
+            ["find", str(ctn_path), "-type", "f", "-exec", "sha256sum", "{}", "+"]
+        )
+        return parse_sha256sum(output)
+
+    def export(self, ctn_path: str, digest: str | None = None) -> Path | None:
+        """
+        1つのファイルまたはディレクトリを書き出す
+
+        Returns:
+            書き出し先のパス（コンテナ内に存在しない場合はNone）
+        """
+        if digest is None:
+            try:
+                digests = self.remote_digests(ctn_path)
+            except RuntimeError:
+                # 拡張子が付与されるなど、宣言とは異なるパスに出力された場合
+                print(f"Warning: {ctn_path} not found in container", file=sys.stderr)
+                return None
+        else:
+            digests = {ctn_path: digest}
+
+        for path, expected in digests.items():
+            local = self.local_path(path)
+            if local.exists() and file_digest(local) == expected:
+                with self.__lock:
+                    self.skipped.append(local)
+                continue
+
+            self.__stream_copy(path, local, expected)
+            with self.__lock:
+                self.exported.append(local)
+
+        return self.local_path(ctn_path)
+
+    def __stream_copy(self, ctn_path: str, local: Path, expected: str) -> None:
+        """tarストリームを展開しながら1つのファイルを書き出し、サイズとダイジェストを検証する"""
+        local.parent.mkdir(parents=True, exist_ok=True)
+        part = local.with_name(local.name + ".part")
+
+        proc = subprocess.Popen(
+            ["docker", "cp", f"{self.__container_id}:{ctn_path}", "-"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        member, tar_error = None, None
+        digest, written = hashlib.sha256(), 0
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+                member = next((m for m in tar if m.isfile()), None)
+                if member is not None:
+                    source = tar.extractfile(member)
+                    with part.open("wb") as out:
+                        for chunk in iter(lambda: source.read(1 << 20), b""):
+                            digest.update(chunk)
+                            written += len(chunk)
+                            out.write(chunk)
+        except tarfile.TarError as e:
+            tar_error = e
+        finally:
+            proc.stdout.close()
+            stderr = proc.stderr.read().decode()
+            proc.stderr.close()
+            returncode = proc.wait()
+
+        if returncode != 0 or tar_error is not None or member is None:
+            part.unlink(missing_ok=True)
+            reason = stderr.strip() or tar_error or "no file in archive"
+            raise ExportError(f"{ctn_path}: docker cp failed: {reason}")
+        if written != member.size or digest.hexdigest() != expected:
+            part.unlink(missing_ok=True)
+            raise ExportError(f"{ctn_path}: size or digest mismatch after copy")
+
+        part.replace(local)
+
+    def sync(self) -> None:
+        """
+        ctn_root以下の全てのファイルのうち、ローカルと内容が異なるものを書き出す
+        イベントに現れなかった出力を最後に回収するために使う
+        """
+        # 実行中の書き出しと同じファイルを同時に書かないよう、先に完了を待つ
+        with self.__lock:
+            pending = list(self.__futures)
+        wait(pending)
+
+        for path, digest in self.remote_digests(str(self.__ctn_root)).items():
+            self.submit(path, digest)
+
+    def close(self) -> None:
+        """
+        全ての書き出しの完了を待つ
+
+        Raises:
+            ExportError: 書き出しに失敗したファイルがある場合
+        """
+        with self.__lock:
+            futures = list(self.__futures)
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        self.__pool.shutdown(wait=True)
+
+        if errors:
+            raise ExportError(
+                "Failed to export artifacts:\n" + "\n".join(str(e) for e in errors)
+            )
@@ -0,0 +1,343 @@
+"""
+実行をまたいだコマンドの実行履歴
+
+実行したコマンドを、実行時間の予測に使う特徴（基本コマンド、パラメーター、
+サンプル数、特徴量(ASV)数、入力のバイト数、イメージ、ホスト）とともに
+SQLiteのファイルに蓄積する。
+
+DurationModelは履歴から基本コマンドごとに実行時間を回帰する。
+予測は進捗の残り時間の表示と、並列実行時の優先度（Pipeline.runのcost）に使う。
+"""
+
+from __future__ import annotations
+import dataclasses
+import json
+import math
+import sqlite3
+import statistics
+from pathlib import Path
+from typing import Callable, Iterable
+from qiime_pipeline.data.store import Datasets
+from qiime_pipeline.pipeline.support.context import CommandExecutor
+from qiime_pipeline.pipeline.support.events import FINISHED, CommandEvent
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+from .telemetry import CommandRecord
+
+DEFAULT_HISTORY_PATH = Path.home() / ".cache" / "qiime_pipeline" / "history.sqlite"
+
+# 特徴量(ASV)数はデノイズの代表配列に含まれる配列の数とする
+FEATURE_OUTPUT_OPTION = "--o-representative-sequences"
+COUNT_FEATURES_SCRIPT = r"""
+import sys, zipfile
+with zipfile.ZipFile(sys.argv[1]) as z:
+    name = next(n for n in z.namelist() if n.endswith("/data/dna-sequences.fasta"))
+    print(sum(line.startswith(b">") for line in z.open(name)))
+"""
+
+# 回帰に使う特徴。いずれもlog(1 + x)に変換する
+FEATURES = ("samples", "features", "input_bytes")
+MIN_WALL_TIME = 1e-3
+
+
+@dataclasses.dataclass(frozen=True)
+class RunInfo:
+    """
+    1回の実行に共通する特徴
+
+    Attributes:
+        batch_id: バッチ実行の識別子
+        host: 実行したホスト名
+        image: コンテナのイメージのID
+        samples: サンプル数
+        features: 特徴量(ASV)数（デノイズしていない場合はNone）
+    """
+
+    batch_id: str
+    host: str
+    image: str | None
+    samples: int
+    features: int | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class HistoryRow:
+    """履歴に記録された1つのコマンド"""
+
+    batch_id: str
+    host: str
+    image: str | None
+    command: str
+    part: str | None
+    parameters: dict[str, str]
+    samples: int
+    features: int | None
+    input_bytes: int
+    output_bytes: int
+    wall_time: float
+    exit_status: int
+    start: float
+
+
+def count_samples(datasets: Datasets) -> int:
+    """データセットのR1/R2の組の数"""
+    return sum(len(dataset.fastq_files) // 2 for dataset in datasets.sets)
+
+
+def count_features(executor: CommandExecutor, path: str) -> int | None:
+    """代表配列のアーティファクトに含まれる配列の数。数えられない場合はNone"""
+    try:
+        output = executor.run(["python", "-c", COUNT_FEATURES_SCRIPT, path])
+    except RuntimeError:
+        return None
+    output = (output or "").strip()
+    return int(output) if output.isdigit() else None
+
+
+class FeatureCounter:
+    """
+    デノイズが終了した時点で特徴量(ASV)数を数えるリスナー
+
+    代表配列は中間生成物として削除されることがあるため、
+    ArtifactReaperより先に登録しておく必要がある。
+    """
+
+    def __init__(self, executor: CommandExecutor):
+        self.__executor = executor
+        self.features: int | None = None
+
+    def __call__(self, event: CommandEvent) -> None:
+        if event.kind != FINISHED:
+            return
+        parts = event.command.command_parts
+        if FEATURE_OUTPUT_OPTION in parts[:-1]:
+            path = parts[parts.index(FEATURE_OUTPUT_OPTION) + 1]
+            self.features = count_features(self.__executor, path)
+
+
+class RunHistory:
+    """
+    実行したコマンドの履歴を保持するSQLiteのストア
+    """
+
+    def __init__(self, path: Path = DEFAULT_HISTORY_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.__conn = sqlite3.connect(self.path)
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS commands ("
+            " id INTEGER PRIMARY KEY,"
+            " batch_id TEXT NOT NULL,"
+            " host TEXT NOT NULL,"
+            " image TEXT,"
+            " command TEXT NOT NULL,"
+            " part TEXT,"
+            " parameters TEXT NOT NULL,"
+            " samples INTEGER NOT NULL,"
+            " features INTEGER,"
+            " input_bytes INTEGER NOT NULL,"
+            " output_bytes INTEGER NOT NULL,"
+            " wall_time REAL NOT NULL,"
+            " exit_status INTEGER NOT NULL,"
+            " start REAL NOT NULL)"
+        )
+        self.__conn.execute(
+            "CREATE INDEX IF NOT EXISTS commands_command ON commands (command)"
+        )
+
+    def add(self, run: RunInfo, records: Iterable[CommandRecord]) -> int:
+        """1回の実行の記録を追加し、追加した件数を返す"""
+        rows = [
+            (
+                run.batch_id,
+                run.host,
+                run.image,
+                record.command,
+                record.part,
+                json.dumps(record.parameters, sort_keys=True),
+                run.samples,
+                run.features,
+                record.input_bytes,
+                record.output_bytes,
+                record.wall_time,
+                record.exit_status,
+                record.start,
+            )
+            for record in records
+        ]
+        with self.__conn:
+            self.__conn.executemany(
+                "INSERT INTO commands (batch_id, host, image, command, part,"
+                " parameters, samples, features, input_bytes, output_bytes,"
+                " wall_time, exit_status, start)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def rows(
+        self, command: str | None = None, image: str | None = None
+    ) -> list[HistoryRow]:
+        """条件に一致する履歴を古い順に返す"""
+        conditions, values = [], []
+        if command is not None:
+            conditions.append("command = ?")
+            values.append(command)
+        if image is not None:
+            conditions.append("image = ?")
+            values.append(image)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self.__conn.execute(
+            "SELECT batch_id, host, image, command, part, parameters, samples,"
+            " features, input_bytes, output_bytes, wall_time, exit_status, start"
+            f" FROM commands{where} ORDER BY start, id",
+            values,
+        )
+        return [HistoryRow(*row[:5], json.loads(row[5]), *row[6:]) for row in cursor]
+
+    def model(self, image: str | None = None) -> DurationModel:
+        """履歴から実行時間のモデルを作る。imageを指定した場合はそのイメージの履歴のみ使う"""
+        return DurationModel.fit(self.rows(image=image))
+
+    def close(self) -> None:
+        self.__conn.close()
+
+    def __enter__(self) -> RunHistory:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def _transform(row: HistoryRow) -> list[float | None]:
+    values = [getattr(row, name) for name in FEATURES]
+    return [None if v is None else math.log1p(v) for v in values]
+
+
+def _solve(matrix: list[list[float]], vector: list[float]) -> list[float]:
+    """連立一次方程式をガウスの消去法（部分ピボット選択）で解く"""
+    n = len(vector)
+    a = [row[:] + [b] for row, b in zip(matrix, vector)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(a[r][col]))
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(col + 1, n):
+            factor = a[r][col] / a[col][col]
+            for c in range(col, n + 1):
+                a[r][c] -= factor * a[col][c]
+    solution = [0.0] * n
+    for r in reversed(range(n)):
+        total = a[r][n] - sum(a[r][c] * solution[c] for c in range(r + 1, n))
+        solution[r] = total / a[r][r]
+    return solution
+
+
+@dataclasses.dataclass(frozen=True)
+class _Regression:
+    """log(実行時間) = intercept + Σ slope * (log(1 + 特徴) - mean)"""
+
+    intercept: float
+    means: list[float]
+    slopes: list[float]
+
+    @classmethod
+    def fit(cls, rows: list[HistoryRow], alpha: float) -> _Regression:
+        xs = [_transform(row) for row in rows]
+        ys = [math.log(max(row.wall_time, MIN_WALL_TIME)) for row in rows]
+
+        # 欠けている特徴は、その特徴の平均値で補う
+        means = []
+        for j in range(len(FEATURES)):
+            present = [x[j] for x in xs if x[j] is not None]
+            means.append(statistics.fmean(present) if present else 0.0)
+        centered = [
+            [(means[j] if v is None else v) - means[j] for j, v in enumerate(x)]
+            for x in xs
+        ]
+        intercept = statistics.fmean(ys)
+
+        # 説明変数の数に対して履歴が少ない場合は平均のみを使う
+        if len(rows) < len(FEATURES) + 2:
+            return cls(intercept, means, [0.0] * len(FEATURES))
+
+        k = len(FEATURES)
+        gram = [
+            [
+                sum(x[i] * x[j] for x in centered) + (alpha if i == j else 0.0)
+                for j in range(k)
+            ]
+            for i in range(k)
+        ]
+        moment = [
+            sum(x[i] * (y - intercept) for x, y in zip(centered, ys)) for i in range(k)
+        ]
+        return cls(intercept, means, _solve(gram, moment))
+
+    def predict(self, values: list[float | None]) -> float:
+        log_time = self.intercept + sum(
+            slope * ((mean if v is None else v) - mean)
+            for slope, mean, v in zip(self.slopes, self.means, values)
+        )
+        return math.exp(log_time)
+
+
+class DurationModel:
+    """
+    基本コマンドごとの実行時間の回帰モデル
+
+    成功したコマンドの履歴から、log(実行時間)をサンプル数、特徴量数、入力のバイト数
+    （いずれも対数）の一次式としてリッジ回帰する。
+    履歴のない基本コマンドには、全ての履歴の実行時間の中央値（履歴が空であればdefault）を使う。
+    基本コマンドの文字列を渡して呼び出せるため、simulationのCostModelの代わりにも使える。
+    """
+
+    def __init__(self, regressions: dict[str, _Regression], default: float):
+        self.__regressions = regressions
+        self.default = default
+
+    @classmethod
+    def fit(
+        cls, rows: Iterable[HistoryRow], default: float = 1.0, alpha: float = 1e-3
+    ) -> DurationModel:
+        grouped: dict[str, list[HistoryRow]] = {}
+        for row in rows:
+            if row.exit_status == 0:
+                grouped.setdefault(row.command, []).append(row)
+        times = [row.wall_time for group in grouped.values() for row in group]
+        return cls(
+            {
+                command: _Regression.fit(group, alpha)
+                for command, group in grouped.items()
+            },
+            statistics.median(times) if times else default,
+        )
+
+    @property
+    def commands(self) -> set[str]:
+        """履歴のある基本コマンド"""
+        return set(self.__regressions)
+
+    def predict(
+        self,
+        command: str,
+        samples: int | None = None,
+        features: int | None = None,
+        input_bytes: int | None = None,
+    ) -> float:
+        """実行時間（秒）を予測する。省略した特徴には履歴の平均値を使う"""
+        regression = self.__regressions.get(command)
+        if regression is None:
+            return self.default
+        values = [
+            None if v is None else math.log1p(v)
+            for v in (samples, features, input_bytes)
+        ]
+        return regression.predict(values)
+
+    def __call__(self, command: str) -> float:
+        return self.predict(command)
+
+    def for_run(
+        self, samples: int | None = None, features: int | None = None
+    ) -> Callable[[Q2Cmd], float]:
+        """Pipeline.runのcostとして使える、この実行の特徴を固定した予測関数"""
+        return lambda cmd: self.predict(str(cmd), samples=samples, features=features)
@@ -0,0 +1,209 @@
+"""
+選択したコマンドのコンテナ内でのプロファイリング
+
+基本コマンドのパターンに一致するQ2Cmdを、実行時に/usr/bin/time -vで包み、
+ユーザー/システムCPU時間、最大RSS、ページフォールト、コンテキストスイッチなどを記録する。
+python=Trueの場合は、q2cliのプロセスをcProfileの下で実行し、統計ファイル(.prof)も取得する。
+
+プロファイルはバッチの出力ディレクトリのprofiles/に書き出し、
+その要約とファイル名はtelemetry.jsonlの各コマンドの記録(profile)に含める。
+cProfileはPythonの処理を遅くするため、記録される実行時間も長くなる点に注意する。
+"""
+
+from __future__ import annotations
+import base64
+import sys
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Iterable
+from qiime_pipeline.pipeline.support.context import CommandExecutor
+from qiime_pipeline.pipeline.support.events import CommandEvent
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+
+PROFILE_DIR_NAME = "profiles"
+CTN_PROFILE_DIR = "/tmp/qiime_pipeline_profiles"
+TIME_BINARY = "/usr/bin/time"
+
+
+def _parse_clock(value: str) -> float:
+    """h:mm:ss または m:ss.ss を秒数にする"""
+    seconds = 0.0
+    for part in value.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+# /usr/bin/time -v の項目名と、記録する名前・変換
+TIME_FIELDS = {
+    "User time (seconds)": ("user_seconds", float),
+    "System time (seconds)": ("system_seconds", float),
+    "Percent of CPU this job got": ("cpu_percent", lambda v: int(v.rstrip("%"))),
+    "Elapsed (wall clock) time (h:mm:ss or m:ss)": ("elapsed_seconds", _parse_clock),
+    "Maximum resident set size (kbytes)": ("max_rss_bytes", lambda v: int(v) * 1024),
+    "Major (requiring I/O) page faults": ("major_page_faults", int),
+    "Minor (reclaiming a frame) page faults": ("minor_page_faults", int),
+    "Voluntary context switches": ("voluntary_context_switches", int),
+    "Involuntary context switches": ("involuntary_context_switches", int),
+    "File system inputs": ("fs_inputs", int),
+    "File system outputs": ("fs_outputs", int),
+    "Exit status": ("exit_status", int),
+}
+
+
+def parse_time_output(text: str) -> dict[str, float]:
+    """/usr/bin/time -v の出力から数値の項目を取り出す。解釈できない行は無視する"""
+    metrics = {}
+    for line in text.splitlines():
+        key, _, value = line.strip().rpartition(": ")
+        if key not in TIME_FIELDS:
+            continue
+        name, convert = TIME_FIELDS[key]
+        try:
+            metrics[name] = convert(value.strip())
+        except ValueError:
+            continue
+    return metrics
+
+
+def command_slug(cmd: Q2Cmd) -> str:
+    """基本コマンドをファイル名に使える形にする（dada2-denoise-pairedなど）"""
+    return str(cmd).removeprefix("qiime ").replace(" ", "-")
+
+
+class CommandProfiler:
+    """
+    パターンに一致するコマンドをプロファイリングする
+
+    start()はコマンドの実行前（STARTEDのイベント）に呼び出し、Q2Cmd.wrapperを設定する。
+    stop()はコマンドの終了後に呼び出し、wrapperを外してプロファイルを回収する。
+    TelemetryRecorderに渡すと、これらが実行記録とともに呼び出される。
+
+    パターンはfnmatchの形式で、"qiime "を含む基本コマンドと含まないものの両方に照合する
+    （"dada2 *"、"qiime diversity core-metrics-phylogenetic"など）。
+    """
+
+    def __init__(
+        self,
+        executor: CommandExecutor,
+        patterns: Iterable[str],
+        local_root: Path,
+        python: bool = False,
+    ):
+        """
+        Args:
+            executor: コマンドを実行するコンテナ
+            patterns: プロファイリングする基本コマンドのパターン
+            local_root: バッチの出力ディレクトリ（PROFILE_DIR_NAMEの下に書き出す）
+            python: q2cliのプロセスをcProfileの下で実行する
+        """
+        self.__executor = executor
+        self.patterns = list(patterns)
+        self.local_root = local_root
+        self.python = python
+        self.__prepared = False
+        self.__time: str | None = None
+        self.__qiime: str | None = None
+        self.__active: dict[int, tuple[Q2Cmd, str]] = {}
+
+    def matches(self, cmd: Q2Cmd) -> bool:
+        command = str(cmd)
+        return any(
+            fnmatch(command, p) or fnmatch(command.removeprefix("qiime "), p)
+            for p in self.patterns
+        )
+
+    def __which(self, name: str) -> str | None:
+        output = self.__executor.run(
+            ["sh", "-c", 'command -v "$1" || true', "which", name]
+        )
+        return (output or "").strip() or None
+
+    def __prepare(self) -> None:
+        """最初のプロファイリングの前に、コンテナ内の出力先と必要なコマンドを確認する"""
+        self.__prepared = True
+        self.__executor.run(["mkdir", "-p", CTN_PROFILE_DIR])
+        self.__time = self.__which(TIME_BINARY)
+        if self.__time is None:
+            print(
+                f"Warning: {TIME_BINARY} not found in container;"
+                " resource usage is not profiled",
+                file=sys.stderr,
+            )
+        if self.python:
+            self.__qiime = self.__which("qiime")
+            if self.__qiime is None:
+                print(
+                    "Warning: qiime not found in container; cProfile is disabled",
+                    file=sys.stderr,
+                )
+
+    def __wrap(self, stem: str, command: list[str]) -> list[str]:
+        prefix = []
+        if self.__time is not None:
+            prefix = [self.__time, "-v", "-o", f"{stem}.time.txt"]
+        if self.__qiime is not None and command[:1] == ["qiime"]:
+            python = ["python", "-m", "cProfile", "-o", f"{stem}.prof", self.__qiime]
+            command = python + command[1:]
+        return prefix + command
+
+    def start(self, cmd: Q2Cmd, index: int) -> bool:
+        """一致するコマンドにwrapperを設定し、プロファイリングするかどうかを返す"""
+        if not self.matches(cmd):
+            return False
+        if not self.__prepared:
+            self.__prepare()
+        if self.__time is None and self.__qiime is None:
+            return False
+
+        stem = f"{CTN_PROFILE_DIR}/{index:03d}-{command_slug(cmd)}"
+        cmd.wrapper = lambda command: self.__wrap(stem, command)
+        self.__active[index] = (cmd, stem)
+        return True
+
+    def stop(self, event: CommandEvent) -> dict | None:
+        """
+        wrapperを外し、プロファイルをローカルに回収する
+
+        Returns:
+            {"metrics": /usr/bin/time -vの項目, "files": 出力ディレクトリからの相対パス}
+            プロファイリングしていないコマンドの場合はNone
+        """
+        active = self.__active.pop(event.index, None)
+        if active is None:
+            return None
+        cmd, stem = active
+        cmd.wrapper = None
+
+        local_dir = self.local_root / PROFILE_DIR_NAME
+        local_dir.mkdir(parents=True, exist_ok=True)
+        name = Path(stem).name
+        metrics, files = {}, []
+        remove = []
+
+        if self.__time is not None:
+            remove.append(f"{stem}.time.txt")
+            try:
+                text = self.__executor.run(["cat", f"{stem}.time.txt"]) or ""
+            except RuntimeError:
+                text = ""
+            if text:
+                (local_dir / f"{name}.time.txt").write_text(text + "\n")
+                files.append(f"{PROFILE_DIR_NAME}/{name}.time.txt")
+                metrics = parse_time_output(text)
+
+        if self.__qiime is not None:
+            remove.append(f"{stem}.prof")
+            # 統計ファイルはバイナリのため、base64で受け取る
+            try:
+                encoded = self.__executor.run(["base64", f"{stem}.prof"]) or ""
+            except RuntimeError:
+                encoded = ""
+            if encoded:
+                (local_dir / f"{name}.prof").write_bytes(base64.b64decode(encoded))
+                files.append(f"{PROFILE_DIR_NAME}/{name}.prof")
+
+        try:
+            self.__executor.run(["rm", "-f", *remove])
+        except RuntimeError:
+            pass
+        return {"metrics": metrics, "files": files}
@@ -0,0 +1,228 @@
+"""
+コンテナの資源使用量の計測
+
+実行中のコマンドがある間、バックグラウンドのスレッドで一定間隔ごとにコンテナの
+cgroupの統計（CPU使用時間、メモリ、ブロックI/O）を読み取り、その時点で
+実行中の全てのコマンドに割り当てる。コマンドの終了時に、コマンドごとの
+平均値と最大値をまとめて返す。
+
+cgroup v2とv1の両方に対応する。統計はコンテナ全体の値であるため、
+複数のコマンドが同時に実行されている場合はそれらの合計となる。
+"""
+
+from __future__ import annotations
+import dataclasses
+import threading
+import time
+from typing import TYPE_CHECKING
+
+# parse_argumentsがDEFAULT_SAMPLE_INTERVALを参照するため、型注釈のみで読み込む
+if TYPE_CHECKING:
+    from qiime_pipeline.pipeline.support.context import CommandExecutor
+
+# cgroupの統計を "名前 値" の行として出力するスクリプト
+# rssはページキャッシュを含まない匿名メモリ、memoryはページキャッシュを含む使用量
+CGROUP_STAT_SCRIPT = r"""
+cg=/sys/fs/cgroup
+if [ -f $cg/cgroup.controllers ]; then
+  awk '$1=="usage_usec"{print "cpu_usec", $2}' $cg/cpu.stat
+  echo memory $(cat $cg/memory.current)
+  awk '$1=="anon"{print "rss", $2}' $cg/memory.stat
+  [ -f $cg/memory.peak ] && echo memory_peak $(cat $cg/memory.peak)
+  awk '{for(i=2;i<=NF;i++){split($i,kv,"=");
+        if(kv[1]=="rbytes")r+=kv[2]; if(kv[1]=="wbytes")w+=kv[2]}}
+       END{print "io_read", r+0; print "io_write", w+0}' $cg/io.stat
+else
+  echo cpu_usec $(( $(cat $cg/cpuacct/cpuacct.usage) / 1000 ))
+  echo memory $(cat $cg/memory/memory.usage_in_bytes)
+  awk '$1=="total_rss"{print "rss", $2}' $cg/memory/memory.stat
+  echo memory_peak $(cat $cg/memory/memory.max_usage_in_bytes)
+  awk '$2=="Read"{r+=$3} $2=="Write"{w+=$3}
+       END{print "io_read", r+0; print "io_write", w+0}' \
+      $cg/blkio/blkio.throttle.io_service_bytes
+fi
+"""
+
+DEFAULT_SAMPLE_INTERVAL = 5.0
+
+
+@dataclasses.dataclass(frozen=True)
+class CgroupSample:
+    """ある時点のcgroupの統計（累積値はコンテナの起動からの合計）"""
+
+    time: float
+    cpu_usec: int
+    memory: int
+    rss: int
+    io_read: int
+    io_write: int
+    memory_peak: int | None = None
+
+    @classmethod
+    def parse(cls, output: str, at: float) -> CgroupSample:
+        values = {}
+        for line in output.splitlines():
+            name, _, value = line.strip().partition(" ")
+            if value.strip().isdigit():
+                values[name] = int(value)
+        return cls(
+            time=at,
+            cpu_usec=values.get("cpu_usec", 0),
+            memory=values.get("memory", 0),
+            rss=values.get("rss", values.get("memory", 0)),
+            io_read=values.get("io_read", 0),
+            io_write=values.get("io_write", 0),
+            memory_peak=values.get("memory_peak"),
+        )
+
+
+@dataclasses.dataclass
+class ResourceUsage:
+    """
+    1つのコマンドの実行中の資源使用量
+
+    Attributes:
+        samples: 計測した回数（開始時と終了時を含む）
+        cpu_seconds: 使用したCPU時間（秒）
+        cpu_avg: 平均のCPU使用数（コア数換算）
+        cpu_peak: 計測間隔ごとのCPU使用数の最大値
+        rss_avg: 平均の匿名メモリ使用量（バイト）
+        rss_peak: 匿名メモリ使用量の最大値
+        memory_peak: ページキャッシュを含むメモリ使用量の最大値
+        io_read_bytes: ブロックデバイスから読み込んだバイト数
+        io_write_bytes: ブロックデバイスに書き込んだバイト数
+    """
+
+    samples: int
+    cpu_seconds: float
+    cpu_avg: float
+    cpu_peak: float
+    rss_avg: int
+    rss_peak: int
+    memory_peak: int
+    io_read_bytes: int
+    io_write_bytes: int
+
+
+class _Accumulator:
+    """1つのコマンドに割り当てられた計測値を集計する"""
+
+    def __init__(self, first: CgroupSample):
+        self.first = first
+        self.last = first
+        self.samples = 1
+        self.rss_sum = first.rss
+        self.rss_peak = first.rss
+        self.memory_peak = first.memory
+        self.cpu_peak = 0.0
+
+    def add(self, sample: CgroupSample) -> None:
+        elapsed = sample.time - self.last.time
+        if elapsed <= 0:
+            # 計測開始より前に読み取られた値は使わない
+            return
+        cores = (sample.cpu_usec - self.last.cpu_usec) / 1e6 / elapsed
+        self.cpu_peak = max(self.cpu_peak, cores)
+        self.samples += 1
+        self.rss_sum += sample.rss
+        self.rss_peak = max(self.rss_peak, sample.rss)
+        self.memory_peak = max(self.memory_peak, sample.memory)
+        self.last = sample
+
+    def usage(self) -> ResourceUsage:
+        elapsed = self.last.time - self.first.time
+        cpu_seconds = (self.last.cpu_usec - self.first.cpu_usec) / 1e6
+        memory_peak = self.memory_peak
+        # memory.peakはコンテナの起動からの最大値のため、実行中に増えた場合のみ使う
+        first_peak, last_peak = self.first.memory_peak, self.last.memory_peak
+        if first_peak is not None and last_peak is not None and last_peak > first_peak:
+            memory_peak = max(memory_peak, last_peak)
+        return ResourceUsage(
+            samples=self.samples,
+            cpu_seconds=cpu_seconds,
+            cpu_avg=cpu_seconds / elapsed if elapsed > 0 else 0.0,
+            cpu_peak=self.cpu_peak,
+            rss_avg=self.rss_sum // self.samples,
+            rss_peak=self.rss_peak,
+            memory_peak=memory_peak,
+            io_read_bytes=self.last.io_read - self.first.io_read,
+            io_write_bytes=self.last.io_write - self.first.io_write,
+        )
+
+
+class ResourceSampler:
+    """
+    実行中のコマンドの資源使用量を一定間隔で計測する
+
+    start(key)でコマンドの計測を始め、stop(key)で集計結果を受け取る。
+    計測中のコマンドがない間はcgroupを読みに行かない。
+    """
+
+    def __init__(
+        self,
+        executor: CommandExecutor,
+        interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ):
+        if interval <= 0:
+            raise ValueError(f"Sampling interval must be positive: {interval}")
+        self.__executor = executor
+        self.__interval = interval
+        self.__active: dict[int, _Accumulator] = {}
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread: threading.Thread | None = None
+
+    def sample(self) -> CgroupSample | None:
+        """コンテナのcgroupの統計を読み取る。読み取れない場合はNone"""
+        try:
+            output = self.__executor.run(["sh", "-c", CGROUP_STAT_SCRIPT])
+        except RuntimeError:
+            return None
+        return CgroupSample.parse(output or "", time.monotonic())
+
+    def start(self, key: int) -> None:
+        """keyのコマンドの計測を始める"""
+        sample = self.sample()
+        if sample is None:
+            return
+        with self.__lock:
+            self.__active[key] = _Accumulator(sample)
+        self.__ensure_thread()
+
+    def stop(self, key: int) -> ResourceUsage | None:
+        """keyのコマンドの計測を終え、集計結果を返す"""
+        with self.__lock:
+            accumulator = self.__active.pop(key, None)
+        if accumulator is None:
+            return None
+        sample = self.sample()
+        if sample is not None:
+            accumulator.add(sample)
+        return accumulator.usage()
+
+    def __ensure_thread(self) -> None:
+        if self.__thread is not None and self.__thread.is_alive():
+            return
+        self.__stopped.clear()
+        self.__thread = threading.Thread(
+            target=self.__loop, name="resource-sampler", daemon=True
+        )
+        self.__thread.start()
+
+    def __loop(self) -> None:
+        while not self.__stopped.wait(self.__interval):
+            with self.__lock:
+                if not self.__active:
+                    continue
+            sample = self.sample()
+            if sample is None:
+                continue
+            with self.__lock:
+                for accumulator in self.__active.values():
+                    accumulator.add(sample)
+
+    def close(self) -> None:
+        """計測のスレッドを終了する"""
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
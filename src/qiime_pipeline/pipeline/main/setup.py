@@ -1,25 +1,60 @@
+import tomlkit
 from pathlib import Path
-from typing import Tuple
+from typing import Iterable, Tuple
 from argparse import Namespace
-from qiime_pipeline.data.control import check_manifest, create_Mfiles
+from qiime_pipeline.data.control import (
+    create_Mfiles,
+    detect_regions,
+    fastq_pairs,
+    preflight,
+    preview_datasets,
+    propose_region,
+    validate_manifest,
+)
+from qiime_pipeline.data.control.fastq_scan import dataset_pairs
 from qiime_pipeline.data.store import (
     Datasets,
     Dataset,
     ContainerData,
+    OutputMode,
+    PullPolicy,
+    ReapMode,
+    ScratchData,
     SettingData,
+    SampleIdRegistry,
     PairPath,
     Regions,
 )
 from qiime_pipeline.pipeline.support import (
     Executor,
     Provider,
+    ContainerPool,
     argument_parser,
     PipelineType,
 )
 from qiime_pipeline.pipeline.support.context import PipelineContext
+from qiime_pipeline.pipeline.support.trace import span
+
+
+AUTO_REGION = "auto"
+FASTQ_SCAN_CACHE_NAME = ".fastq_scan_cache.json"
+REGIONS_FILE_NAME = "regions.toml"
+
+
+def write_regions(datasets: Iterable[Dataset], path: Path) -> Path:
+    """データセットごとの領域を、データセット名をキーとしてRegion.to_tomlの形式で書き出す"""
+    doc = tomlkit.document()
+    for dataset in sorted(datasets, key=lambda d: d.name):
+        doc.add(dataset.name, dataset.region.to_toml())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(tomlkit.dumps(doc))
+    return path
 
 
 def setup_datasets(arg: Namespace) -> Datasets:
+    regions = Regions()
+    auto_region = arg.dataset_region == AUTO_REGION
+
     data = []
     for metadata_path, fastq_folder in arg.data:
         # Use the basename of the metadata path as the dataset name
@@ -28,14 +63,73 @@ def setup_datasets(arg: Namespace) -> Datasets:
                 name=fastq_folder.stem,
                 fastq_folder=fastq_folder,
                 metadata_path=metadata_path,
-                region=Regions()[arg.dataset_region],
+                # autoの場合は、下でプライマー配列から推定した領域を設定する
+                region=None if auto_region else regions[arg.dataset_region],
             )
         )
 
+    if auto_region or arg.auto_truncation:
+        # 領域の推定や品質の読み取りでFASTQを読む前に、壊れたFASTQをまとめて検出する
+        # 結果はキャッシュされるため、setup_filesでの検査は読み直さない
+        with span("preflight"):
+            preflight(
+                fastq_pairs(Datasets(sets=set(data))),
+                cache_path=arg.local_output / FASTQ_SCAN_CACHE_NAME,
+            )
+
+    if auto_region:
+        detected = detect_regions([dataset_pairs(dataset) for dataset in data])
+        for dataset, region_name in zip(data, detected):
+            if region_name is None:
+                raise ValueError(
+                    f"Could not detect the region of {dataset.name} from primers."
+                )
+            dataset.region = regions.get_region(region_name)
+
+    for dataset in data:
+        if arg.auto_truncation:
+            dataset.region = propose_region(
+                dataset_pairs(dataset),
+                base=dataset.region,
+                sample_size=arg.quality_sample_size,
+            )
+
+    if auto_region or arg.auto_truncation:
+        # 推定・提案した領域を出力ディレクトリに記録する
+        write_regions(data, arg.local_output / REGIONS_FILE_NAME)
+
     return Datasets(sets=set(data))
 
 
+def setup_scratch(arg: Namespace) -> ScratchData | None:
+    """--scratchの指定からスクラッチ領域の設定を作る"""
+    if arg.scratch is None:
+        if arg.scratch_size is not None:
+            raise ValueError("--scratch-size requires --scratch tmpfs")
+        return None
+    if arg.scratch == "tmpfs":
+        return ScratchData(tmpfs_size=arg.scratch_size)
+    if arg.scratch_size is not None:
+        raise ValueError("--scratch-size is only valid with --scratch tmpfs")
+    return ScratchData(host_path=Path(arg.scratch).resolve())
+
+
 def setup_config(arg: Namespace) -> SettingData:
+    datasets = setup_datasets(arg)
+    if arg.preview is not None:
+        # サブサンプリングの前に元のFASTQを検査する。
+        # キャッシュに残るリード数は、リード数で指定したサブサンプリングにも使う
+        cache_path = arg.local_output / FASTQ_SCAN_CACHE_NAME
+        with span("preflight"):
+            preflight(fastq_pairs(datasets), cache_path=cache_path)
+        # サブサンプリングしたFASTQを参照するデータセットに置き換える
+        datasets = preview_datasets(
+            datasets,
+            arg.preview,
+            scratch_dir=arg.local_output / "preview",
+            cache_path=cache_path,
+        )
+
     ctn_workspace = Path("/workspace")
     ctn_data = ContainerData(
         image_or_dockerfile=arg.image,
@@ -48,24 +142,52 @@ def setup_config(arg: Namespace) -> SettingData:
             local_pos=arg.local_database,
             ctn_pos=Path("/db") / arg.local_database.name,
         ),
+        pull_policy=PullPolicy(arg.pull_policy),
+        output_mode=OutputMode(arg.output_mode),
+        scratch=setup_scratch(arg),
     )
     setting = SettingData(
         container_data=ctn_data,
-        datasets=setup_datasets(arg),
+        datasets=datasets,
         sampling_depth=arg.sampling_depth,
+        reap_mode=ReapMode(arg.reap),
+        keep_results=tuple(arg.keep),
+        workers=arg.workers,
     )
     return setting
 
 
 def setup_files(setting: SettingData) -> Tuple[PairPath, PairPath]:
-    local_metafile, local_manifest = create_Mfiles(
-        local_output=setting.local_output_path,
-        container_fastq_path=(setting.ctn_workspace_path / "data"),
-        data=setting.datasets,
-    )
+    # コンテナを起動する前に、壊れたFASTQやR1/R2の不一致を検出する
+    with span("preflight"):
+        preflight(
+            fastq_pairs(setting.datasets),
+            cache_path=setting.local_output_path / FASTQ_SCAN_CACHE_NAME,
+        )
 
-    if not check_manifest(local_manifest):
-        raise ValueError("Manifest file is invalid")
+    # 実行をまたいで同じサンプルに同じIDを割り当てる
+    with (
+        span("create_Mfiles"),
+        SampleIdRegistry(setting.local_output_path / "sample_ids.sqlite") as registry,
+    ):
+        local_metafile, local_manifest = create_Mfiles(
+            local_output=setting.local_output_path,
+            container_fastq_path=(setting.ctn_workspace_path / "data"),
+            data=setting.datasets,
+            registry=registry,
+        )
+
+    # マニフェストのコンテナ内のパスを、マウント元のローカルのパスに対応づけて検証する
+    path_map = {
+        setting.ctn_workspace_path / "data" / dataset.fastq_folder.name: (
+            dataset.fastq_folder
+        )
+        for dataset in setting.datasets.sets
+    }
+    with span("validate_manifest"):
+        report = validate_manifest(local_manifest, path_map=path_map)
+    if not report.ok:
+        raise ValueError(f"Manifest file is invalid\n{report}")
 
     def __builder(p: Path) -> PairPath:
         return PairPath(
@@ -81,42 +203,123 @@ def setup_mounts(
     db_pairpath: PairPath,
     ctn_workspace_dir: Path,
     datasets: Datasets,
+    output_pairpath: PairPath | None = None,
 ) -> list[str]:
 
     def __convert_path_into_mount_format(pairpath: PairPath):
         return pairpath.to_mount_option(readonly=True)
 
-    return [
+    mounts = [
         __convert_path_into_mount_format(metafile_pairpath),
         __convert_path_into_mount_format(manifest_pairpath),
         __convert_path_into_mount_format(db_pairpath),
         *datasets.mounts(ctn_workspace_dir / "data"),
     ]
 
+    # 出力ディレクトリは書き込み可能でマウントし、生成された成果物を直接ローカルに置く
+    if output_pairpath is not None:
+        output_pairpath.local_pos.mkdir(parents=True, exist_ok=True)
+        mounts.append(output_pairpath.to_mount_option(readonly=False))
+
+    return mounts
+
 
 def setup_executor(mounts: list[str], setting: SettingData) -> Executor:
+    mounts = list(mounts)
+    envs = {}
+    if setting.scratch is not None:
+        mounts.append(setting.scratch.to_mount_option(setting.batch_id))
+        envs["TMPDIR"] = str(setting.scratch.tmpdir)
+
     provider = Provider(
         image=setting.image,
         name=setting.batch_id,
         mounts=mounts,
         workspace=setting.ctn_workspace_path,
+        pull_policy=setting.pull_policy,
+        envs=envs,
     )
 
     return Executor(provider.provide())
 
 
+def setup_pooled_executor(
+    metafile_pairpath: PairPath,
+    manifest_pairpath: PairPath,
+    setting: SettingData,
+    pool_size: int,
+    pool_dir: Path,
+) -> Executor:
+    """
+    プールから空いているコンテナを借り、実行に必要なファイルをコピーする
+    Executorの停止時にはコンテナを停止せず、プールに返却する
+    """
+    pool = ContainerPool(
+        image=setting.image,
+        size=pool_size,
+        database=setting.database_pair,
+        workspace=setting.ctn_workspace_path,
+        state_dir=pool_dir,
+        pull_policy=setting.pull_policy,
+    )
+    with span("pool acquire"):
+        lease = pool.acquire()
+    try:
+        lease.stage(
+            [
+                metafile_pairpath,
+                manifest_pairpath,
+                *(
+                    PairPath(
+                        local_pos=dataset.fastq_folder,
+                        ctn_pos=setting.ctn_workspace_path
+                        / "data"
+                        / dataset.fastq_folder.name,
+                    )
+                    for dataset in setting.datasets.sets
+                ),
+            ]
+        )
+    except BaseException:
+        lease.release()
+        raise
+
+    return Executor(lease.container, on_stop=lease.release)
+
+
 def setup_context(args: Namespace) -> PipelineContext:
-    setting = setup_config(args)
+    with span("setup_config"):
+        setting = setup_config(args)
 
     metadata, manifest = setup_files(setting)
-    mounts = setup_mounts(
-        metafile_pairpath=metadata,
-        manifest_pairpath=manifest,
-        ctn_workspace_dir=setting.ctn_workspace_path,
-        db_pairpath=setting.database_pair,
-        datasets=setting.datasets,
-    )
-    executor = setup_executor(mounts, setting)
+    bind_output = setting.output_mode is OutputMode.BIND
+    if args.pool and bind_output:
+        raise ValueError("--output-mode bind cannot be used with --pool")
+    if args.pool and setting.scratch is not None:
+        raise ValueError("--scratch cannot be used with --pool")
+
+    if args.pool:
+        executor = setup_pooled_executor(
+            metadata, manifest, setting, args.pool, args.pool_dir
+        )
+    else:
+        mounts = setup_mounts(
+            metafile_pairpath=metadata,
+            manifest_pairpath=manifest,
+            ctn_workspace_dir=setting.ctn_workspace_path,
+            db_pairpath=setting.database_pair,
+            datasets=setting.datasets,
+            output_pairpath=(
+                PairPath(
+                    local_pos=setting.local_batch_output_path
+                    / setting.ctn_output_path.name,
+                    ctn_pos=setting.ctn_output_path,
+                )
+                if bind_output
+                else None
+            ),
+        )
+        executor = setup_executor(mounts, setting)
 
     return PipelineContext.create(
         ctn_metadata=metadata.ctn_pos,
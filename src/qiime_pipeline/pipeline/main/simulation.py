@@ -0,0 +1,311 @@
+"""
+QIIMEのコマンドを実際には実行しないシミュレーション
+
+SimulatedExecutorはCommandExecutorとして振る舞い、QIIMEのコマンドの出力パスに
+プレースホルダーのファイルを作り、基本コマンドごとのコストモデルに従って待機する。
+time_scaleを0にすると待機せず、コストは仮想的な時間として集計するだけになる。
+スケジューリングや中間生成物の扱いの変更を、実際の計算を行わずに評価するために使う。
+
+コストモデルは実行記録（telemetry.jsonl）から推定できる。
+simulate_scheduleは同じコストモデルで、ワーカー数ごとの所要時間を仮想時間で見積もる。
+"""
+
+from __future__ import annotations
+import dataclasses
+import heapq
+import random
+import shutil
+import statistics
+import threading
+import time
+from fnmatch import fnmatch
+from itertools import takewhile
+from pathlib import Path, PurePosixPath
+from typing import Callable, Iterable, Mapping, Sequence
+from qiime_pipeline.pipeline.support.qiime_command import Q2CmdAssembly
+from .telemetry import CommandRecord, read_telemetry
+
+DEFAULT_COST = 1.0
+OUTPUT_OPTIONS = ("--o-", "--output-path")
+
+
+def base_command(command: Sequence) -> str:
+    """最初のオプションより前の部分（qiime dada2 denoise-pairedなど）を返す"""
+    return " ".join(
+        takewhile(lambda part: not part.startswith("--"), map(str, command))
+    )
+
+
+def output_paths(command: Sequence) -> list[str]:
+    """--o-*と--output-pathに渡されたパスを返す"""
+    parts = list(map(str, command))
+    return [
+        parts[i + 1]
+        for i, part in enumerate(parts[:-1])
+        if part.startswith(OUTPUT_OPTIONS)
+    ]
+
+
+class CostModel:
+    """
+    基本コマンドごとの実行時間（秒）のモデル
+
+    costsにない基本コマンドにはdefaultを使う。
+    """
+
+    def __init__(
+        self, costs: Mapping[str, float] | None = None, default: float = DEFAULT_COST
+    ):
+        self.costs = dict(costs or {})
+        self.default = default
+
+    def __call__(self, command: str) -> float:
+        return self.costs.get(command, self.default)
+
+    @classmethod
+    def fit(
+        cls, records: Iterable[CommandRecord], default: float | None = None
+    ) -> CostModel:
+        """
+        成功したコマンドの実行時間の中央値を、基本コマンドごとのコストとする
+        defaultを省略した場合は、全てのコマンドの実行時間の中央値を使う
+        """
+        times: dict[str, list[float]] = {}
+        for record in records:
+            if record.exit_status == 0:
+                times.setdefault(record.command, []).append(record.wall_time)
+        if default is None:
+            every = [t for values in times.values() for t in values]
+            default = statistics.median(every) if every else DEFAULT_COST
+        return cls(
+            {command: statistics.median(values) for command, values in times.items()},
+            default,
+        )
+
+    @classmethod
+    def from_telemetry(cls, *paths: Path, default: float | None = None) -> CostModel:
+        """1つ以上の実行記録のファイルからコストを推定する"""
+        return cls.fit(
+            (record for path in paths for record in read_telemetry(path)), default
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class FailureRule:
+    """
+    基本コマンドがpattern（fnmatch形式）に一致する場合に、probabilityの確率で失敗させる
+    """
+
+    pattern: str
+    probability: float = 1.0
+    return_code: int = 1
+
+
+class SimulatedCommandError(Exception):
+    """注入された失敗（CommandRunnerのDockerExceptionに相当する）"""
+
+    def __init__(self, message: str, return_code: int):
+        super().__init__(message)
+        self.return_code = return_code
+
+
+@dataclasses.dataclass(frozen=True)
+class SimulatedCall:
+    """SimulatedExecutorが受け付けた1つのQIIMEのコマンド"""
+
+    command: str
+    cost: float
+    outputs: list[str]
+    failed: bool = False
+
+
+class SimulatedExecutor:
+    """
+    QIIMEのコマンドを実行せず、出力のプレースホルダーを作って待機するエグゼキューター
+
+    コンテナ内のパスはrootの下に対応付ける。mkdir、rm、mvはroot以下で実際に行い、
+    それ以外のQIIME以外のコマンドは何もせずに空の出力を返す。
+    各コマンドの待機時間はcost_modelのコストにtime_scaleを掛けた秒数となる。
+    複数のスレッドから同時に呼び出せる。
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        cost_model: CostModel | None = None,
+        time_scale: float = 0.0,
+        failures: Iterable[FailureRule] = (),
+        seed: int | None = 0,
+    ):
+        self.root = root
+        self.cost_model = cost_model or CostModel()
+        self.time_scale = time_scale
+        self.failures = list(failures)
+        self.calls: list[SimulatedCall] = []
+        self.peak_concurrency = 0
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__running = 0
+        self.__stopped = False
+
+    @property
+    def work(self) -> float:
+        """受け付けたコマンドのコストの合計（仮想時間の秒数）"""
+        with self.__lock:
+            return sum(call.cost for call in self.calls)
+
+    def local_path(self, path: str | Path) -> Path:
+        """コンテナ内のパスをroot以下のパスに対応付ける"""
+        path = PurePosixPath(path)
+        return self.root / (path.relative_to("/") if path.is_absolute() else path)
+
+    def run(self, command: list[str]) -> str:
+        if self.__stopped:
+            raise RuntimeError("The simulated container has been stopped")
+
+        command = list(map(str, command))
+        if command[0] != "qiime":
+            self.__run_host(command)
+            return ""
+
+        base = base_command(command)
+        cost = self.cost_model(base)
+        outputs = output_paths(command)
+        failure = self.__failure(base)
+
+        with self.__lock:
+            self.__running += 1
+            self.peak_concurrency = max(self.peak_concurrency, self.__running)
+        try:
+            if self.time_scale > 0:
+                time.sleep(cost * self.time_scale)
+        finally:
+            with self.__lock:
+                self.__running -= 1
+                self.calls.append(
+                    SimulatedCall(base, cost, outputs, failure is not None)
+                )
+
+        if failure is not None:
+            message = f"Simulated failure of {base} (exit {failure.return_code})"
+            raise RuntimeError(
+                f"Command failed with error:\n {message}"
+            ) from SimulatedCommandError(message, failure.return_code)
+
+        for path in outputs:
+            local = self.local_path(path)
+            local.parent.mkdir(parents=True, exist_ok=True)
+            local.write_text(f"{base}\n")
+        return ""
+
+    def __failure(self, base: str) -> FailureRule | None:
+        for rule in self.failures:
+            if not fnmatch(base, rule.pattern):
+                continue
+            with self.__lock:
+                if self.__random.random() < rule.probability:
+                    return rule
+        return None
+
+    def __run_host(self, command: list[str]) -> None:
+        """mkdir、rm、mvをroot以下で行う"""
+        name, *args = command
+        paths = [self.local_path(arg) for arg in args if not arg.startswith("-")]
+        match name:
+            case "mkdir":
+                for path in paths:
+                    path.mkdir(parents=True, exist_ok=True)
+            case "rm":
+                for path in paths:
+                    if path.is_dir():
+                        shutil.rmtree(path)
+                    else:
+                        path.unlink(missing_ok=True)
+            case "mv" if len(paths) >= 2:
+                *sources, destination = paths
+                for source in sources:
+                    shutil.move(source, destination)
+
+    def stop(self) -> None:
+        self.__stopped = True
+
+
+@dataclasses.dataclass(frozen=True)
+class Schedule:
+    """
+    simulate_scheduleの結果
+
+    Attributes:
+        workers: ワーカー数
+        starts: 各コマンドの開始時刻（仮想時間の秒数）
+        finishes: 各コマンドの終了時刻
+        makespan: 全てのコマンドが終了するまでの時間
+        work: 全てのコマンドのコストの合計
+    """
+
+    workers: int
+    starts: list[float]
+    finishes: list[float]
+    makespan: float
+    work: float
+
+    @property
+    def utilization(self) -> float:
+        """ワーカーが稼働していた時間の割合"""
+        if self.makespan == 0:
+            return 0.0
+        return self.work / (self.makespan * self.workers)
+
+
+def simulate_schedule(
+    assembly: Q2CmdAssembly,
+    cost_model: Callable[[str], float],
+    workers: int = 1,
+    priority: Callable[[str], float] | None = None,
+) -> Schedule:
+    """
+    Pipeline.runと同じ方針でコマンドを割り当てた場合の各コマンドの開始・終了時刻を、
+    仮想時間で求める
+
+    priorityはPipeline.runのcostに渡す予測実行時間で、省略した場合は順番の早い
+    コマンドを優先する。cost_model（実際の実行時間）と別に指定することで、
+    予測の誤差がスケジュールに与える影響を評価できる。
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1: {workers}")
+
+    commands = list(assembly)
+    costs = [cost_model(str(cmd)) for cmd in commands]
+    waiting = assembly.dependencies()
+    dependents: dict[int, list[int]] = {i: [] for i in range(len(commands))}
+    for i, dependencies in enumerate(waiting):
+        for dependency in dependencies:
+            dependents[dependency].append(i)
+    priorities = assembly.priorities(
+        None if priority is None else lambda cmd: priority(str(cmd))
+    )
+    ready = [
+        priorities[i] for i, dependencies in enumerate(waiting) if not dependencies
+    ]
+    heapq.heapify(ready)
+
+    starts = [0.0] * len(commands)
+    finishes = [0.0] * len(commands)
+    running: list[tuple[float, int]] = []
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < workers:
+            _, i = heapq.heappop(ready)
+            starts[i] = now
+            heapq.heappush(running, (now + costs[i], i))
+
+        now, _ = running[0]
+        while running and running[0][0] == now:
+            _, i = heapq.heappop(running)
+            finishes[i] = now
+            for dependent in dependents[i]:
+                waiting[dependent].discard(i)
+                if not waiting[dependent]:
+                    heapq.heappush(ready, priorities[dependent])
+
+    return Schedule(workers, starts, finishes, max(finishes, default=0.0), sum(costs))
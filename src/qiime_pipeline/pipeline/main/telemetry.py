@@ -0,0 +1,249 @@
+"""
+コマンドごとの実行記録
+
+コマンドの開始・終了イベントを受け取り、開始・終了時刻、実行時間、終了コード、
+入出力アーティファクトのサイズを、生成元のパーツ名とともにJSON Linesとして
+バッチの出力ディレクトリに書き出す。実行終了時には要約の表を表示する。
+"""
+
+from __future__ import annotations
+import dataclasses
+import json
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator
+from qiime_pipeline.pipeline.support.context import CommandExecutor
+from qiime_pipeline.pipeline.support.events import (
+    FAILED,
+    FINISHED,
+    STARTED,
+    CommandEvent,
+)
+from .profiling import CommandProfiler
+from .resources import ResourceSampler
+
+TELEMETRY_FILE_NAME = "telemetry.jsonl"
+
+
+@dataclasses.dataclass
+class CommandRecord:
+    """
+    1つのコマンドの実行記録
+
+    Attributes:
+        index: パイプライン内でのコマンドの順番
+        part: コマンドを生成したPipelineのパーツ名
+        command: 基本コマンド（qiime dada2 denoise-pairedなど）
+        start: 開始時刻（UNIX時間）
+        end: 終了時刻（UNIX時間）
+        wall_time: 実行にかかった秒数
+        exit_status: 終了コード（成功した場合は0）
+        inputs: 入力パスとそのバイト数（存在しないパスは含まない）
+        outputs: 出力パスとそのバイト数（存在しないパスは含まない）
+        error: 失敗した場合のエラーメッセージ
+        resources: 実行中の資源使用量（ResourceUsageの各項目、計測しない場合はNone）
+        parameters: --p-で指定したパラメーター
+        profile: プロファイリングした場合の/usr/bin/time -vの項目と、
+            出力ディレクトリに書き出したファイル（CommandProfiler.stopの結果）
+    """
+
+    index: int
+    part: str | None
+    command: str
+    start: float
+    end: float
+    wall_time: float
+    exit_status: int
+    inputs: dict[str, int] = dataclasses.field(default_factory=dict)
+    outputs: dict[str, int] = dataclasses.field(default_factory=dict)
+    error: str | None = None
+    resources: dict[str, float] | None = None
+    parameters: dict[str, str] = dataclasses.field(default_factory=dict)
+    profile: dict | None = None
+
+    @property
+    def input_bytes(self) -> int:
+        return sum(self.inputs.values())
+
+    @property
+    def output_bytes(self) -> int:
+        return sum(self.outputs.values())
+
+    def to_json(self) -> str:
+        return json.dumps(dataclasses.asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, line: str) -> CommandRecord:
+        fields = {f.name for f in dataclasses.fields(cls)}
+        data = json.loads(line)
+        return cls(**{k: v for k, v in data.items() if k in fields})
+
+
+def read_telemetry(path: Path) -> Iterator[CommandRecord]:
+    """JSON Lines形式の実行記録を読み込む"""
+    with path.open() as f:
+        for line in f:
+            if line.strip():
+                yield CommandRecord.from_json(line)
+
+
+def exit_status(error: BaseException | None) -> int:
+    """例外から終了コードを取り出す。コンテナの終了コードが不明な場合は1とする"""
+    if error is None:
+        return 0
+    return_code = getattr(error.__cause__, "return_code", None)
+    return return_code if isinstance(return_code, int) else 1
+
+
+def parse_du(output: str) -> dict[str, int]:
+    """du -sbの出力を {パス: バイト数} の辞書に変換する"""
+    sizes = {}
+    for line in output.splitlines():
+        size, _, path = line.partition("\t")
+        if path and size.isdigit():
+            sizes[path] = int(size)
+    return sizes
+
+
+def artifact_sizes(executor: CommandExecutor, paths: Iterable[str]) -> dict[str, int]:
+    """
+    コンテナ内のファイルまたはディレクトリのバイト数を、1回のexecで取得する
+    存在しないパスは結果に含めない
+    """
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+    output = executor.run(
+        ["sh", "-c", 'du -sb -- "$@" 2>/dev/null; true', "du", *paths]
+    )
+    return parse_du(output or "")
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def format_summary(records: Iterable[CommandRecord]) -> str:
+    """実行記録を表形式の文字列にする"""
+    header = ("#", "part", "command", "wall[s]", "status", "in", "out", "cpu", "rss")
+    rows = [
+        (
+            str(r.index),
+            r.part or "-",
+            r.command.removeprefix("qiime "),
+            f"{r.wall_time:.1f}",
+            "ok" if r.exit_status == 0 else f"exit {r.exit_status}",
+            format_bytes(r.input_bytes),
+            format_bytes(r.output_bytes),
+            "-" if r.resources is None else f"{r.resources['cpu_avg']:.1f}",
+            "-" if r.resources is None else format_bytes(r.resources["rss_peak"]),
+        )
+        for r in records
+    ]
+    total = sum(float(row[3]) for row in rows)
+    footer = ("", "total", "", f"{total:.1f}", "", "", "", "", "")
+
+    table = [header, *rows, footer]
+    widths = [max(len(row[i]) for row in table) for i in range(len(header))]
+    numeric = {0, 3, 5, 6, 7, 8}
+
+    def line(row) -> str:
+        return "  ".join(
+            cell.rjust(w) if i in numeric else cell.ljust(w)
+            for i, (cell, w) in enumerate(zip(row, widths))
+        ).rstrip()
+
+    separator = "  ".join("-" * w for w in widths)
+    return "\n".join(
+        [line(header), separator, *map(line, rows), separator, line(footer)]
+    )
+
+
+class TelemetryRecorder:
+    """
+    コマンドの実行イベントを受け取り、実行記録をJSON Linesとして書き出すリスナー
+
+    入出力のサイズはコマンドの終了時に取得するため、中間生成物を削除する
+    ArtifactReaperより先に登録しておく必要がある。
+    samplerを渡した場合は、コマンドごとの資源使用量も記録する。
+    profilerを渡した場合は、一致するコマンドのプロファイルも記録する。
+    並列実行では、終了イベントは実行可能になったコマンドを開始した後に通知されるため、
+    ここでのコンテナ内の計測が後続のコマンドの開始を遅らせることはない。
+    """
+
+    def __init__(
+        self,
+        executor: CommandExecutor,
+        path: Path,
+        sampler: ResourceSampler | None = None,
+        profiler: CommandProfiler | None = None,
+    ):
+        self.__executor = executor
+        self.__sampler = sampler
+        self.__profiler = profiler
+        self.path = path
+        self.__started: dict[int, float] = {}
+        self.__lock = threading.Lock()
+        self.records: list[CommandRecord] = []
+
+    def __call__(self, event: CommandEvent) -> None:
+        if event.kind == STARTED:
+            self.__started[event.index] = event.timestamp
+            if self.__sampler is not None:
+                self.__sampler.start(event.index)
+            if self.__profiler is not None:
+                self.__profiler.start(event.command, event.index)
+        elif event.kind in (FINISHED, FAILED):
+            self.record(event)
+
+    def record(self, event: CommandEvent) -> CommandRecord:
+        start = self.__started.pop(event.index, None)
+        if start is None:
+            start = event.timestamp - (event.duration or 0.0)
+        usage = None if self.__sampler is None else self.__sampler.stop(event.index)
+        profile = None if self.__profiler is None else self.__profiler.stop(event)
+
+        inputs = event.command.get_inputs()
+        outputs = event.outputs
+        try:
+            sizes = artifact_sizes(self.__executor, [*inputs, *outputs])
+        except RuntimeError:
+            # コンテナが停止しているなど、サイズが取得できない場合も記録は残す
+            sizes = {}
+
+        record = CommandRecord(
+            index=event.index,
+            part=event.command.origin,
+            command=str(event.command),
+            start=start,
+            end=event.timestamp,
+            wall_time=(
+                event.duration
+                if event.duration is not None
+                else event.timestamp - start
+            ),
+            exit_status=exit_status(event.error),
+            inputs={p: sizes[p] for p in inputs if p in sizes},
+            outputs={p: sizes[p] for p in outputs if p in sizes},
+            error=None if event.error is None else str(event.error),
+            resources=None if usage is None else dataclasses.asdict(usage),
+            parameters=event.command.get_parameters(),
+            profile=profile,
+        )
+        self.write(record)
+        return record
+
+    def write(self, record: CommandRecord) -> None:
+        with self.__lock:
+            self.records.append(record)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a") as f:
+                f.write(record.to_json() + "\n")
+
+    def summary(self) -> str:
+        with self.__lock:
+            return format_summary(sorted(self.records, key=lambda r: r.index))
@@ -1,5 +1,6 @@
 import python_on_whales
 from pathlib import Path
+from qiime_pipeline.data.store import OutputMode
 from qiime_pipeline.pipeline.support import PipelineContext
 
 
@@ -10,14 +11,22 @@ def find(key: str, iterable: list) -> str:
 
 
 def copy_from_container(context: PipelineContext, ctn_target_file: Path) -> Path:
-    out_dir = context.setting.local_output_path.joinpath(
-        str(context.setting.batch_id)
-    )
+    out_dir = context.setting.local_batch_output_path
     out_dir.mkdir(parents=True, exist_ok=True)
 
+    # バインドマウントした出力ディレクトリの成果物は既にローカルにある
+    if (
+        context.setting.output_mode is OutputMode.BIND
+        and ctn_target_file.is_relative_to(context.setting.ctn_output_path)
+    ):
+        return out_dir / ctn_target_file.relative_to(
+            context.setting.ctn_output_path.parent
+        )
+
     # Copy QZV file from container
+    # プールのコンテナはbatch_idとは別の名前を持つため、IDで指定する
     python_on_whales.docker.copy(
-        source=f"{context.setting.batch_id}:{ctn_target_file}", destination=str(out_dir)
+        source=f"{context.executor.id()}:{ctn_target_file}", destination=str(out_dir)
     )
 
     return out_dir / ctn_target_file.name
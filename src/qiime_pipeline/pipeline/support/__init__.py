@@ -1,4 +1,5 @@
-from .executor import Executor, Provider
+from .executor import Executor, Provider, PullPolicy
+from .container_pool import ContainerPool, PoolLease
 from .parse_arguments import argument_parser
 from .support_class import Pipeline, RequiresDirectory
 from .context import (
@@ -16,3 +17,6 @@ from .qiime_command import (
     IsolatedCommandError,
 )
 from .view import QzvViewer
+from .events import CommandEvent, EventBus
+from .reaper import ArtifactReaper
+from .progress import ProgressReporter
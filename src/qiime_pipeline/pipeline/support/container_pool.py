@@ -0,0 +1,179 @@
+"""
+実行をまたいで再利用するコンテナのプール
+
+プールのコンテナはデータベースのみをマウントした状態で起動したままにしておく。
+各実行は空いているコンテナを1つ借り、メタデータ・マニフェスト・FASTQを
+コンテナ内にコピーして使用し、終了後にワークスペースを空にしてプールに返す。
+
+コンテナの貸し出しはスロットごとのロックファイル(flock)で管理するため、
+複数のプロセスから同時に実行しても同じコンテナが二重に使われることはない。
+実行中のプロセスが異常終了した場合も、ロックはOSにより自動的に解放される。
+"""
+
+from __future__ import annotations
+import fcntl
+import hashlib
+import time
+from pathlib import Path
+from typing import Iterable, TextIO
+from python_on_whales import docker, Container
+from qiime_pipeline.data.store import PairPath
+from .executor import Provider, PullPolicy
+
+POOL_PREFIX = "qiime-pipeline-pool"
+DEFAULT_POOL_DIR = Path.home() / ".cache" / "qiime_pipeline" / "pool"
+
+
+class PoolExhaustedError(TimeoutError):
+    """空いているコンテナが時間内に見つからなかった場合のエラー"""
+
+    pass
+
+
+class PoolLease:
+    """
+    プールから借りたコンテナ
+
+    release()を呼ぶまでスロットのロックを保持する。
+    """
+
+    def __init__(self, container: Container, lock: TextIO, workspace: Path):
+        self.container = container
+        self.__lock = lock
+        self.__workspace = workspace
+
+    @property
+    def released(self) -> bool:
+        return self.__lock.closed
+
+    def stage(self, files: Iterable[PairPath]) -> None:
+        """ローカルのファイルやディレクトリをコンテナ内のctn_posにコピーする"""
+        for pair in files:
+            self.container.execute(["mkdir", "-p", str(pair.ctn_pos.parent)])
+            docker.copy(
+                source=str(pair.local_resolved),
+                destination=(self.container.name, str(pair.ctn_pos)),
+            )
+
+    def clean(self) -> None:
+        """前の実行が残したワークスペースの中身を削除する"""
+        self.container.execute(
+            ["find", str(self.__workspace), "-mindepth", "1", "-delete"]
+        )
+
+    def release(self) -> None:
+        """ワークスペースを空にしてコンテナをプールに返す"""
+        if self.released:
+            return
+        try:
+            self.clean()
+        finally:
+            fcntl.flock(self.__lock, fcntl.LOCK_UN)
+            self.__lock.close()
+
+
+class ContainerPool:
+    """
+    データベースをマウントした状態で起動し続けるコンテナのプール
+
+    コンテナ名はイメージとデータベースの組から決まるため、
+    設定の異なる実行が同じコンテナを使うことはない。
+    """
+
+    def __init__(
+        self,
+        image: str,
+        size: int,
+        database: PairPath,
+        workspace: Path,
+        state_dir: Path = DEFAULT_POOL_DIR,
+        pull_policy: PullPolicy | str = PullPolicy.IF_NOT_PRESENT,
+    ):
+        if size < 1:
+            raise ValueError(f"Pool size must be >= 1: {size}")
+
+        self.image = image
+        self.size = size
+        self.database = database
+        self.workspace = workspace
+        self.state_dir = state_dir
+        self.pull_policy = pull_policy
+
+        key = hashlib.sha256(
+            f"{image}|{database.local_resolved}|{database.ctn_pos}".encode()
+        ).hexdigest()[:8]
+        self.names = [f"{POOL_PREFIX}-{key}-{i}" for i in range(size)]
+
+    def __start(self, name: str) -> Container:
+        """スロットのコンテナを起動した状態で返す。存在しなければ作成する"""
+        if docker.container.exists(name):
+            container = docker.container.inspect(name)
+            if Provider.get_status(container) != "running":
+                container.start()
+            return container
+
+        provider = Provider(
+            image=self.image,
+            name=name,
+            mounts=[self.database.to_mount_option(readonly=True)],
+            workspace=self.workspace,
+            remove=False,
+            pull_policy=self.pull_policy,
+        )
+        container = provider.provide()
+        # 初回の呼び出しで作られるプラグインのキャッシュを作っておく
+        container.execute(["micromamba", "run", "-n", "base", "qiime", "info"])
+        return container
+
+    def warm(self) -> list[Container]:
+        """全てのスロットのコンテナを起動する"""
+        return [self.__start(name) for name in self.names]
+
+    def __try_lock(self, name: str) -> TextIO | None:
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        lock = (self.state_dir / f"{name}.lock").open("w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    def acquire(
+        self, timeout: float | None = None, poll_interval: float = 1.0
+    ) -> PoolLease:
+        """
+        空いているコンテナを借りる
+
+        Args:
+            timeout: 空きを待つ最大の秒数（Noneの場合は待ち続ける）
+            poll_interval: 空きを確認する間隔（秒）
+
+        Raises:
+            PoolExhaustedError: timeout秒以内に空きが見つからなかった場合
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for name in self.names:
+                lock = self.__try_lock(name)
+                if lock is None:
+                    continue
+                try:
+                    lease = PoolLease(self.__start(name), lock, self.workspace)
+                    lease.clean()
+                except BaseException:
+                    lock.close()
+                    raise
+                return lease
+
+            if deadline is not None and time.monotonic() >= deadline:
+                raise PoolExhaustedError(
+                    f"No free container in pool within {timeout} seconds."
+                )
+            time.sleep(poll_interval)
+
+    def shutdown(self) -> None:
+        """プールの全てのコンテナを削除する"""
+        for name in self.names:
+            if docker.container.exists(name):
+                docker.container.remove(name, force=True)
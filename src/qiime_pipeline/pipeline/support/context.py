@@ -6,12 +6,14 @@ Pipeline context classes with improved architecture.
 """
 
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Protocol
+from typing import Callable, Protocol
 
 from qiime_pipeline.data.store import SettingData, Datasets
+from .events import EventBus
+from .qiime_command import Q2Cmd
 
 
 # --- Enums ---
@@ -110,12 +112,16 @@ class PipelineContext:
         config: 実行設定
         executor: コマンド実行インターフェース
         setting: 完全な設定データ (後方互換性のため保持)
+        events: コマンド実行イベントの通知先
+        cost_model: コマンドの予測実行時間（秒）。並列実行の優先度と残り時間の表示に使う
     """
 
     paths: ContainerPaths
     config: ExecutionConfig
     executor: CommandExecutor
     setting: SettingData  # 後方互換性のため保持
+    events: EventBus = field(default_factory=EventBus, compare=False)
+    cost_model: Callable[[Q2Cmd], float] | None = field(default=None, compare=False)
 
     @classmethod
     def create(
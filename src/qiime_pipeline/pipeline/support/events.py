@@ -0,0 +1,67 @@
+"""
+パイプラインのコマンド実行イベント
+
+Pipeline.runは各コマンドの開始・終了・失敗をCommandEventとして通知する。
+成果物の書き出しや計測などの処理は、EventBusにリスナーを登録して行う。
+"""
+
+from __future__ import annotations
+import dataclasses
+import time
+from typing import Callable
+from .qiime_command import Q2Cmd
+
+STARTED = "started"
+FINISHED = "finished"
+FAILED = "failed"
+
+
+@dataclasses.dataclass(frozen=True)
+class CommandEvent:
+    """
+    1つのコマンドの実行状態の変化
+
+    Attributes:
+        kind: started / finished / failed
+        command: 実行されたコマンド
+        index: パイプライン内でのコマンドの順番（0始まり）
+        total: パイプラインのコマンドの総数
+        timestamp: イベントが発生した時刻（UNIX時間）
+        duration: 実行にかかった秒数（startedではNone）
+        error: 失敗した場合の例外
+    """
+
+    kind: str
+    command: Q2Cmd
+    index: int
+    total: int
+    timestamp: float = dataclasses.field(default_factory=time.time)
+    duration: float | None = None
+    error: BaseException | None = None
+
+    @property
+    def outputs(self) -> list[str]:
+        """コマンドの出力パスのリスト"""
+        outputs = self.command.get_outputs()
+        return [outputs] if isinstance(outputs, str) else list(outputs)
+
+
+CommandListener = Callable[[CommandEvent], None]
+
+
+class EventBus:
+    """コマンドイベントのリスナーを保持し、イベントを通知する"""
+
+    def __init__(self):
+        self.__listeners: list[CommandListener] = []
+
+    def subscribe(self, listener: CommandListener) -> CommandListener:
+        self.__listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener: CommandListener) -> None:
+        self.__listeners.remove(listener)
+
+    def emit(self, event: CommandEvent) -> None:
+        for listener in list(self.__listeners):
+            listener(event)
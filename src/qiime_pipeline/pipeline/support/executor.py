@@ -1,8 +1,121 @@
 import re
+import hashlib
+from fnmatch import fnmatch
 from pathlib import Path
-from typing import Iterable, List
+from typing import Callable, Iterable, List
 from python_on_whales import docker, exceptions
 from python_on_whales import Container, Image
+from qiime_pipeline.data.store import PullPolicy
+from .trace import span
+
+
+def resolve_image(
+    image: str, policy: PullPolicy | str = PullPolicy.IF_NOT_PRESENT
+) -> Image:
+    """
+    取得方針に従ってイメージを用意する
+
+    ローカルのイメージはイメージ名またはダイジェスト(name@sha256:...)で検索されるため、
+    既にイメージがある場合はレジストリへの問い合わせが発生しない。
+    """
+    policy = PullPolicy(policy)
+    if policy is PullPolicy.ALWAYS:
+        with span("image pull", image=image):
+            return docker.image.pull(image)
+
+    if docker.image.exists(image):
+        return docker.image.inspect(image)
+
+    if policy is PullPolicy.NEVER:
+        raise RuntimeError(
+            f"Image {image} is not present locally and pull policy is 'never'."
+        )
+    with span("image pull", image=image):
+        return docker.image.pull(image)
+
+
+# from_dockerfileでビルドしたイメージに付けるリポジトリ名
+BUILD_CACHE_REPOSITORY = "qiime-pipeline-build"
+
+
+def _dockerignore_patterns(context: Path) -> list[tuple[bool, str]]:
+    """.dockerignoreのパターンを (否定かどうか, パターン) のリストとして返す"""
+    ignore_file = context / ".dockerignore"
+    if not ignore_file.exists():
+        return []
+
+    patterns = []
+    for line in ignore_file.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        patterns.append((negate, line.lstrip("!").strip("/")))
+    return patterns
+
+
+def _is_ignored(relative: str, patterns: list[tuple[bool, str]]) -> bool:
+    """パスまたはその親ディレクトリが.dockerignoreのパターンに一致するか（後勝ち）"""
+    parts = relative.split("/")
+    candidates = ["/".join(parts[: i + 1]) for i in range(len(parts))]
+
+    ignored = False
+    for negate, pattern in patterns:
+        if any(fnmatch(candidate, pattern) for candidate in candidates):
+            ignored = not negate
+    return ignored
+
+
+def dockerfile_fingerprint(dockerfile: Path, context: Path | None = None) -> str:
+    """
+    Dockerfileとビルドコンテキストの内容から、ビルド結果を識別するハッシュを計算する
+
+    .dockerignoreで除外されたファイルは含めない。
+    ファイルの相対パスと内容のみを用いるため、更新日時が変わっても値は変わらない。
+    """
+    context = dockerfile.parent if context is None else context
+    patterns = _dockerignore_patterns(context)
+
+    digest = hashlib.sha256()
+    digest.update(b"Dockerfile\0" + dockerfile.read_bytes() + b"\0")
+    for path in sorted(context.rglob("*")):
+        relative = path.relative_to(context).as_posix()
+        if not path.is_file() or _is_ignored(relative, patterns):
+            continue
+        digest.update(relative.encode() + b"\0")
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+# q2cliのプラグインキャッシュを保存するボリューム名の接頭辞
+PLUGIN_CACHE_VOLUME_PREFIX = "qiime-pipeline-q2cli-cache"
+
+
+def _conda_prefix(image: Image) -> str:
+    """イメージの環境変数からconda環境のパスを取得する"""
+    env = dict(item.split("=", 1) for item in (image.config.env or []) if "=" in item)
+    return env.get("CONDA_PREFIX") or env.get("MAMBA_ROOT_PREFIX") or "/opt/conda"
+
+
+def plugin_cache_mount(image: Image) -> list[str]:
+    """
+    q2cliのプラグインキャッシュ($CONDA_PREFIX/var/q2cli/cache)に
+    イメージのIDごとの名前付きボリュームをマウントする設定を返す
+
+    空の名前付きボリュームは初回のマウント時にイメージの内容で初期化され、
+    以降はコンテナをまたいで再構築されたキャッシュが引き継がれる。
+    イメージが変わればボリュームも変わるため、古いキャッシュが使われることはない。
+    """
+    digest = image.id.split(":")[-1][:12]
+    return [
+        "type=volume",
+        f"src={PLUGIN_CACHE_VOLUME_PREFIX}-{digest}",
+        f"dst={_conda_prefix(image)}/var/q2cli/cache",
+    ]
 
 
 class Provider:
@@ -13,29 +126,37 @@ class Provider:
         mounts: Iterable[List[str]] = (),
         workspace: Path = Path("."),
         remove=True,
+        pull_policy: PullPolicy | str = PullPolicy.IF_NOT_PRESENT,
+        plugin_cache: bool = True,
+        envs: dict[str, str] | None = None,
     ):
         if isinstance(image, str):
-            self.__image = docker.image.pull(image)
+            self.__image = resolve_image(image, pull_policy)
         else:
             self.__image = image
 
         self.__name = name
-        self.__mounts = mounts
+        self.__mounts = list(mounts)
+        if plugin_cache and isinstance(self.__image, Image):
+            self.__mounts.append(plugin_cache_mount(self.__image))
         self.__workspace = workspace
         self.__remove = remove
+        self.__envs = dict(envs or {})
 
         self.__container: Container = None
 
     def provide(self) -> Container:
-        self.__container = docker.container.run(
-            image=self.__image,
-            name=self.__name,
-            mounts=self.__mounts,
-            workdir=self.__workspace.absolute(),
-            command=["tail", "-f", "/dev/null"],
-            detach=True,
-            remove=self.__remove,
-        )
+        with span("container start", name=self.__name):
+            self.__container = docker.container.run(
+                image=self.__image,
+                name=self.__name,
+                mounts=self.__mounts,
+                workdir=self.__workspace.absolute(),
+                envs=self.__envs,
+                command=["tail", "-f", "/dev/null"],
+                detach=True,
+                remove=self.__remove,
+            )
 
         return self.__container
 
@@ -48,7 +169,20 @@ class Provider:
         workspace: Path = Path("."),
         remove=True,
     ):
-        image = docker.image.build(context_path=dockerfile.parent, file=dockerfile)
+        """
+        Dockerfileからイメージを用意する
+
+        イメージにはDockerfileとビルドコンテキストのハッシュをタグとして付けるため、
+        内容が変わっていなければ前回ビルドしたイメージをそのまま使用する。
+        """
+        tag = f"{BUILD_CACHE_REPOSITORY}:{dockerfile_fingerprint(dockerfile)[:16]}"
+        if docker.image.exists(tag):
+            image = docker.image.inspect(tag)
+        else:
+            with span("image build", tag=tag):
+                image = docker.image.build(
+                    context_path=dockerfile.parent, file=dockerfile, tags=[tag]
+                )
         return cls(
             image=image, name=name, mounts=mounts, workspace=workspace, remove=remove
         )
@@ -78,8 +212,15 @@ class Provider:
 
 
 class Executor:
-    def __init__(self, container: Container):
+    def __init__(self, container: Container, on_stop: Callable[[], None] | None = None):
+        """
+        Args:
+            container: コマンドを実行するコンテナ
+            on_stop: 指定した場合、stop()でコンテナを停止する代わりに呼び出される
+                （プールから借りたコンテナを返却する場合など）
+        """
         self.__container = container
+        self.__on_stop = on_stop
 
     def __enter__(self):
         """コンテナの起動"""
@@ -93,6 +234,10 @@ class Executor:
 
     def stop(self):
         """コンテナを停止する"""
+        if self.__on_stop is not None:
+            self.__on_stop()
+            return
+
         try:
             self.__container.stop()
         except exceptions.NoSuchContainer:
@@ -108,6 +253,10 @@ class Executor:
         self.__container.reload()
         return self.__container.id
 
+    def image_id(self) -> str:
+        """コンテナのイメージのID（sha256:...）を取得"""
+        return self.__container.image
+
     def run(self, command: list[str]) -> tuple[str, str]:
         """コンテナ内でコマンドを実行する
 
@@ -144,11 +293,12 @@ class CommandRunner:
         成功すれば標準出力を返し、失敗すれば例外を投げる
         """
 
-        out, err = "", ""
+        out, err, cause = "", "", None
         try:
             out = self.__container.execute(command)
         except exceptions.DockerException as e:
             err = e.__str__()
+            cause = e
 
         if err:
             err = f"Command failed with error:\n {err}"
@@ -157,7 +307,8 @@ class CommandRunner:
                 log_file = re.findall(r"/tmp/qiime2-q2cli-err-[\w]+\.log", err).pop()
                 log_content = self.run(["cat", log_file])
                 err += f"\nLog content:\n{log_content}"
-            raise RuntimeError(err)
+            # 終了コードはcause(DockerException.return_code)から参照できる
+            raise RuntimeError(err) from cause
 
         return out
 
@@ -1,6 +1,11 @@
 from pathlib import Path
 import argparse
 from textwrap import dedent
+from qiime_pipeline.data.control.subsample import parse_preview
+from qiime_pipeline.data.store import OutputMode, ReapMode
+from qiime_pipeline.pipeline.main.resources import DEFAULT_SAMPLE_INTERVAL
+from .executor import PullPolicy
+from .container_pool import DEFAULT_POOL_DIR
 
 
 def parse_pair(pair: str) -> tuple[Path, Path]:
@@ -21,6 +26,48 @@ def parse_pair(pair: str) -> tuple[Path, Path]:
     return Path(metadata_path_str.strip()), Path(fastq_folder_str.strip())
 
 
+SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as '512m' or '8G' into a number of bytes."""
+    text = size.strip().lower().removesuffix("b")
+    number, unit = text, ""
+    if text and text[-1] in SIZE_UNITS:
+        number, unit = text[:-1], text[-1]
+    try:
+        value = float(number)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size: {size}") from None
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"Size must be positive: {size}")
+    return int(value * SIZE_UNITS[unit])
+
+
+def parse_workers(workers: str) -> int:
+    """Parse the number of concurrent commands, which must be at least 1."""
+    try:
+        value = int(workers)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid number: {workers}") from None
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"Workers must be at least 1: {workers}")
+    return value
+
+
+def parse_sample_interval(interval: str) -> float:
+    """Parse the sampling interval in seconds, where 0 disables sampling."""
+    try:
+        value = float(interval)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid number: {interval}") from None
+    if not value >= 0:
+        raise argparse.ArgumentTypeError(
+            f"Sample interval must not be negative: {interval}"
+        )
+    return value
+
+
 def argument_parser():
     """Create and return an argument parser for the QIIME pipeline."""
     parser = argparse.ArgumentParser(
@@ -61,7 +108,29 @@ def argument_parser():
         "--dataset-region",
         type=str,
         default="V3V4",
-        help="Region of the 16S rRNA gene for the dataset (default: V3V4).",
+        help=dedent(
+            """
+            Region of the 16S rRNA gene for the dataset (default: V3V4).
+            Specify "auto" to detect the region of each dataset
+            from the primer sequences at the start of its reads.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--auto-truncation",
+        action="store_true",
+        help=dedent(
+            """
+            Estimate trunc-len-f/trunc-len-r of each dataset from the per-position
+            quality profile of its reads instead of using the region defaults.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--quality-sample-size",
+        type=int,
+        default=10000,
+        help="Number of reads sampled from each fastq for --auto-truncation.",
     )
     parser.add_argument(
         "--image",
@@ -69,6 +138,179 @@ def argument_parser():
         default="quay.io/qiime2/amplicon:2024.10",
         help="Docker image to use for the QIIME pipeline.",
     )
+    parser.add_argument(
+        "--pull-policy",
+        choices=[policy.value for policy in PullPolicy],
+        default=PullPolicy.IF_NOT_PRESENT.value,
+        help=dedent(
+            """
+            When to pull the Docker image from the registry.
+            'if-not-present' reuses a local image with the same name or digest,
+            'never' fails instead of pulling (for air-gapped nodes).
+            """
+        ),
+    )
+    parser.add_argument(
+        "--output-mode",
+        choices=[mode.value for mode in OutputMode],
+        default=OutputMode.COPY.value,
+        help=dedent(
+            """
+            How results reach --local-output.
+            'copy' (default) copies the output directory out of the container
+            after the pipeline finishes. 'bind' mounts the per-batch output
+            directory into the container so artifacts land on the host as they
+            are produced (not available with --pool).
+            """
+        ),
+    )
+    parser.add_argument(
+        "--scratch",
+        type=str,
+        default=None,
+        metavar="tmpfs|PATH",
+        help=dedent(
+            """
+            Place intermediate artifacts and QIIME's TMPDIR on fast scratch space.
+            'tmpfs' mounts a RAM-backed tmpfs; a PATH (e.g. on local NVMe) is
+            bind-mounted per batch. Final artifacts are still written to the
+            output directory. Not available with --pool.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--scratch-size",
+        type=parse_size,
+        default=None,
+        metavar="SIZE",
+        help="Upper limit of the tmpfs scratch, e.g. '16G' (default: Docker's).",
+    )
+    parser.add_argument(
+        "--reap",
+        choices=[mode.value for mode in ReapMode],
+        default=ReapMode.OFF.value,
+        help=dedent(
+            """
+            Free intermediate artifacts as soon as their last consumer finishes.
+            'delete' removes them, 'archive' moves them to the 'archive'
+            directory of the output. 'off' (default) keeps them until the end.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--keep",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help=dedent(
+            """
+            Result name (e.g. 'denoised_table') or file name pattern
+            (e.g. '*_demux.qza') that --reap must not remove. Repeatable.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=parse_workers,
+        default=1,
+        metavar="N",
+        help=dedent(
+            """
+            Maximum number of QIIME commands run at the same time in the
+            container. Commands start as soon as the commands producing their
+            inputs have finished (default: 1, one after another).
+            """
+        ),
+    )
+    parser.add_argument(
+        "--history",
+        type=Path,
+        default=None,
+        metavar="PATH",
+        help=dedent(
+            """
+            SQLite file accumulating every executed command across runs
+            (default: ~/.cache/qiime_pipeline/history.sqlite). Durations
+            predicted from it drive the progress/ETA display and the order
+            in which --workers picks ready commands.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="Neither read nor record the run history.",
+    )
+    parser.add_argument(
+        "--sample-interval",
+        type=parse_sample_interval,
+        default=DEFAULT_SAMPLE_INTERVAL,
+        metavar="SECONDS",
+        help=dedent(
+            """
+            Interval for sampling the container's cgroup stats (CPU, memory,
+            block I/O) while commands run. The per-command averages and peaks
+            are saved in telemetry.jsonl. 0 disables sampling.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help=dedent(
+            """
+            Profile commands whose base command matches PATTERN (e.g.
+            'dada2 *') with /usr/bin/time -v inside the container. The reports
+            are saved under profiles/ and summarized in telemetry.jsonl.
+            Repeatable.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--profile-python",
+        action="store_true",
+        help=dedent(
+            """
+            Also run the profiled commands under cProfile and save the .prof
+            files next to the /usr/bin/time reports. This slows the commands.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        metavar="OUT.json",
+        help=dedent(
+            """
+            Write a Trace Event Format file of the run (setup phases, image
+            pull, container start and one span per command on worker tracks).
+            Open it in https://ui.perfetto.dev or chrome://tracing.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--pool",
+        type=int,
+        default=0,
+        metavar="N",
+        help=dedent(
+            """
+            Run in a pool of N warm containers that are kept running between runs.
+            Each run borrows a free container, copies its metadata, manifest and
+            fastq files into it, and returns it to the pool afterwards.
+            0 (default) starts a dedicated container for this run.
+            """
+        ),
+    )
+    parser.add_argument(
+        "--pool-dir",
+        type=Path,
+        default=DEFAULT_POOL_DIR,
+        help="Directory holding the lock files of the container pool.",
+    )
     parser.add_argument(
         "--dockerfile",
         type=Path,
@@ -87,6 +329,19 @@ def argument_parser():
         default=Path("./classifier.qza"),
         help="Path to the local database file.",
     )
+    parser.add_argument(
+        "--preview",
+        type=parse_preview,
+        default=None,
+        metavar="FRACTION|N",
+        help=dedent(
+            """
+            Run on a deterministic subsample of the reads for a quick check.
+            A value with a decimal point is the fraction of read pairs to keep
+            (e.g. 0.05), an integer is the number of read pairs per sample.
+            """
+        ),
+    )
     parser.add_argument(
         "--sampling_depth",
         type=int,
@@ -0,0 +1,85 @@
+"""
+コマンドの進捗と残り時間の表示
+
+各コマンドの予測実行時間から、終了したコマンドの割合と残り時間を見積もり、
+コマンドの開始・終了のたびに1行ずつ表示する。
+"""
+
+from __future__ import annotations
+import sys
+import time
+from typing import Callable, TextIO
+from .events import FAILED, FINISHED, STARTED, CommandEvent
+from .qiime_command import Q2Cmd, Q2CmdAssembly
+
+
+def format_duration(seconds: float) -> str:
+    """秒数をH:MM:SSの形式にする"""
+    minutes, second = divmod(round(max(seconds, 0.0)), 60)
+    hour, minute = divmod(minutes, 60)
+    return f"{hour}:{minute:02d}:{second:02d}"
+
+
+class ProgressReporter:
+    """
+    コマンドの進捗と残り時間を表示するリスナー
+
+    残り時間は、まだ終わっていないコマンドの予測実行時間の合計をworkersで割った値と、
+    最後のコマンドまでの最長経路のうち大きい方とする。
+    実行中のコマンドは経過した分を差し引く。
+    """
+
+    def __init__(
+        self,
+        assembly: Q2CmdAssembly,
+        cost: Callable[[Q2Cmd], float],
+        workers: int = 1,
+        stream: TextIO | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.__predicted = [cost(cmd) for cmd in assembly]
+        self.__ranks = assembly.critical_path(cost)
+        self.__workers = workers
+        self.__stream = stream
+        self.__clock = clock
+        self.__started: dict[int, float] = {}
+        self.__done: set[int] = set()
+
+    @property
+    def fraction(self) -> float:
+        """終了したコマンドの予測実行時間の割合"""
+        total = sum(self.__predicted)
+        if total == 0:
+            return len(self.__done) / max(len(self.__predicted), 1)
+        return sum(self.__predicted[i] for i in self.__done) / total
+
+    def eta(self) -> float:
+        """全てのコマンドが終了するまでの残り秒数の見積もり"""
+        now = self.__clock()
+        work, path = 0.0, 0.0
+        for i, predicted in enumerate(self.__predicted):
+            if i in self.__done:
+                continue
+            elapsed = now - self.__started[i] if i in self.__started else 0.0
+            work += max(predicted - elapsed, 0.0)
+            path = max(path, self.__ranks[i] - elapsed)
+        return max(work / self.__workers, path)
+
+    def __call__(self, event: CommandEvent) -> None:
+        if event.kind == STARTED:
+            self.__started[event.index] = self.__clock()
+            detail = f"~{format_duration(self.__predicted[event.index])}"
+        elif event.kind in (FINISHED, FAILED):
+            self.__started.pop(event.index, None)
+            self.__done.add(event.index)
+            detail = format_duration(event.duration or 0.0)
+        else:
+            return
+
+        print(
+            f"[{len(self.__done)}/{event.total}] {self.fraction:4.0%}"
+            f" ETA {format_duration(self.eta())}"
+            f"  {event.kind} {str(event.command).removeprefix('qiime ')} ({detail})",
+            file=self.__stream or sys.stderr,
+            flush=True,
+        )
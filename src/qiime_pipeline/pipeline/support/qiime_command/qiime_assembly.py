@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Iterable
+from typing import Callable, Iterable
 from .qiime_command import Q2Cmd
 from .qiime_error import CircularDependencyError, IsolatedCommandError
 
@@ -86,6 +86,77 @@ class Q2CmdAssembly(Iterable[Q2Cmd]):
         # ソート済みのリストで更新
         self.commands = sorted_commands
 
+    def dependencies(self) -> list[set[int]]:
+        """
+        現在の順序で各コマンドが待つ必要のあるコマンドの番号を返す
+
+        コマンドの入力（メタデータとして渡されたアーティファクトを含む）を、
+        それより前にその入力を出力したコマンドに対応付ける。
+        同じパスに出力するコマンドは、そのパスを前に出力したコマンドと、
+        その後にそれを読んだコマンドの終了を待つ（同じファイルへの同時書き込みを防ぐ）。
+        ソート済みであれば、順番に実行した場合と同じ依存関係になる。
+
+        Returns:
+            list[set[int]]: i番目のコマンドが依存するコマンドの番号の集合
+        """
+        producers: dict[str, int] = {}
+        readers: dict[str, set[int]] = {}
+        dependencies = []
+        for i, cmd in enumerate(self.commands):
+            inputs = cmd.get_inputs()
+            outputs = cmd.get_outputs()
+            outputs = [outputs] if isinstance(outputs, str) else outputs
+
+            dependency = {producers[path] for path in inputs if path in producers}
+            for path in outputs:
+                if path in producers:
+                    dependency.add(producers[path])
+                dependency |= readers.get(path, set())
+            dependency.discard(i)
+            dependencies.append(dependency)
+
+            for path in inputs:
+                readers.setdefault(path, set()).add(i)
+            for path in outputs:
+                producers[path] = i
+                readers[path] = set()
+        return dependencies
+
+    def critical_path(self, cost: Callable[[Q2Cmd], float]) -> list[float]:
+        """
+        各コマンドから最後のコマンドまでの最長経路のコストを返す
+
+        コマンド自身のコストと、それに依存するコマンドの最長経路のコストの最大値の和で、
+        大きいコマンドほど遅らせると全体の終了が遅れる。
+
+        Args:
+            cost: コマンドの予測実行時間
+
+        Returns:
+            list[float]: i番目のコマンドの最長経路のコスト
+        """
+        dependencies = self.dependencies()
+        ranks = [cost(cmd) for cmd in self.commands]
+        tails = [0.0] * len(self.commands)
+        for i in reversed(range(len(self.commands))):
+            ranks[i] += tails[i]
+            for dependency in dependencies[i]:
+                tails[dependency] = max(tails[dependency], ranks[i])
+        return ranks
+
+    def priorities(
+        self, cost: Callable[[Q2Cmd], float] | None = None
+    ) -> list[tuple[float, int]]:
+        """
+        同時に実行できるコマンドのうち、どれを先に実行するかの優先度（小さいほど先）
+
+        costを指定した場合は最長経路のコストが大きいものを、
+        指定しない場合は順番の早いものを優先する。
+        """
+        if cost is None:
+            return [(0.0, i) for i in range(len(self.commands))]
+        return [(-rank, i) for i, rank in enumerate(self.critical_path(cost))]
+
     def new_cmd(self, base_command: str) -> Q2Cmd:
         """
         新しいQ2Cmdインスタンスを作成し、アセンブリに追加する
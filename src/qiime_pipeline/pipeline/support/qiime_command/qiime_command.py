@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import Union
+from typing import Callable, Union
 
 
 class Q2Cmd:
@@ -10,6 +10,10 @@ class Q2Cmd:
         """
         self.__base_cmd = base_command.split(" ")
         self.command_parts = []
+        # コマンドを生成したPipelineのパーツ名（core_metricsなど）
+        self.origin: str | None = None
+        # 実行時にコマンドの引数を書き換える関数（/usr/bin/time -vで包むなど）
+        self.wrapper: Callable[[list[str]], list[str]] | None = None
 
     def __str__(self):
         return " ".join(self.__base_cmd)
@@ -84,6 +88,26 @@ class Q2Cmd:
         else:
             return outputs
 
+    def get_inputs(self) -> list[str]:
+        """
+        コマンドが読み込むパスを取得する
+        メタデータとして渡されたアーティファクトも含む
+        """
+        inputs = self._get_paths_from_parts("--i-")
+        inputs += self._get_paths_from_parts("--input-path")
+        inputs += self._get_paths_from_parts("--m-")
+        return inputs
+
+    def get_parameters(self) -> dict[str, str]:
+        """
+        --p-で指定したパラメーターを {名前: 値} として取得する
+        """
+        return {
+            part.removeprefix("--p-"): self.command_parts[i + 1]
+            for i, part in enumerate(self.command_parts)
+            if part.startswith("--p-") and i + 1 < len(self.command_parts)
+        }
+
     def has_dependency(self, other: Q2Cmd) -> bool:
         return self < other or self > other
 
@@ -142,4 +166,5 @@ class Q2Cmd:
         Returns:
             list[str]: コマンドのリスト
         """
-        return self.__base_cmd + self.command_parts
+        command = self.__base_cmd + self.command_parts
+        return command if self.wrapper is None else self.wrapper(command)
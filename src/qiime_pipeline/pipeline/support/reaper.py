@@ -0,0 +1,79 @@
+"""
+中間生成物の早期削除
+
+コマンドの依存関係から、各出力を読み込む後続のコマンドの数を数えておき、
+最後の利用者が終了した時点でその出力を削除（またはアーカイブに移動）する。
+これにより、実行中に同時に存在する中間生成物の量を抑える。
+"""
+
+from __future__ import annotations
+import threading
+from collections import Counter
+from pathlib import Path, PurePosixPath
+from typing import Iterable
+from .context import CommandExecutor
+from .events import FINISHED, CommandEvent
+from .qiime_command import Q2Cmd
+
+
+class ArtifactReaper:
+    """
+    コマンドの終了イベントを受け取り、使われなくなった中間生成物を削除するリスナー
+
+    削除の対象はcandidatesに含まれ、かつ少なくとも1つのコマンドが読み込む出力のみ。
+    どのコマンドにも読み込まれない出力は成果物として残す。
+    """
+
+    def __init__(
+        self,
+        executor: CommandExecutor,
+        commands: Iterable[Q2Cmd],
+        candidates: Iterable[str],
+        archive_path: Path | None = None,
+    ):
+        self.__executor = executor
+        self.__archive_path = archive_path
+        self.__lock = threading.Lock()
+
+        candidates = {str(path) for path in candidates}
+        self.__remaining: Counter[str] = Counter(
+            path
+            for cmd in commands
+            # 同じパスを2回読み込むコマンドも1回と数える
+            for path in set(cmd.get_inputs())
+            if path in candidates
+        )
+        self.reaped: list[str] = []
+
+    @property
+    def remaining(self) -> dict[str, int]:
+        """削除を待っているパスと、残りの利用者の数"""
+        with self.__lock:
+            return dict(self.__remaining)
+
+    def __call__(self, event: CommandEvent) -> None:
+        if event.kind != FINISHED:
+            return
+
+        released = []
+        with self.__lock:
+            for path in set(event.command.get_inputs()):
+                if path not in self.__remaining:
+                    continue
+                self.__remaining[path] -= 1
+                if self.__remaining[path] == 0:
+                    del self.__remaining[path]
+                    released.append(path)
+
+        for path in released:
+            self.reap(path)
+
+    def reap(self, path: str) -> None:
+        """1つの中間生成物を削除、またはアーカイブに移動する"""
+        if self.__archive_path is None:
+            self.__executor.run(["rm", "-rf", path])
+        else:
+            archive = PurePosixPath(self.__archive_path)
+            self.__executor.run(["mkdir", "-p", str(archive)])
+            self.__executor.run(["mv", path, str(archive / PurePosixPath(path).name)])
+        self.reaped.append(path)
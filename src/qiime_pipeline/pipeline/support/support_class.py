@@ -1,11 +1,18 @@
 from __future__ import annotations
+import heapq
+import time
 from abc import ABC
-from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from qiime_pipeline.data.store import ReapMode
+from .events import STARTED, FINISHED, FAILED, CommandEvent
 from .executor import Executor
-from .qiime_command import Q2CmdAssembly
+from .qiime_command import Q2Cmd, Q2CmdAssembly
+from .reaper import ArtifactReaper
 
 # PipelineContext と PipelineType は context.py に移動
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable
 
 if TYPE_CHECKING:
     from .context import PipelineContext
@@ -34,11 +41,16 @@ class Pipeline(ABC):
         self._assembly = Q2CmdAssembly()
         self._requires = RequiresDirectory()
         self._result = {}
+        self._intermediates: set[str] = set()
 
         if ctn_output is None:
             self._output = self._context.setting.ctn_output_path
 
+        # 最終成果物ではない中間生成物は、設定されていればスクラッチ領域に置く
+        self._intermediate = self._context.setting.ctn_intermediate_path
+
         self._requires.add(self._output)
+        self._requires.add(self._intermediate)
 
     def __call__(
         self,
@@ -49,25 +61,207 @@ class Pipeline(ABC):
 
     def __add__(self, other: Pipeline) -> Pipeline:
         self_result = self._cmd_build()
+        self._tag_origin()
         other_result = other._cmd_build(self_result)  #
+        other._tag_origin()
 
         new_pipeline = Pipeline(self._context)
         new_pipeline._assembly = self._assembly + other._assembly
         new_pipeline._requires = self._requires + other._requires
         new_pipeline._result = {**self_result, **other_result}
+        new_pipeline._intermediates = self._intermediates | other._intermediates
 
         self._assembly.sort_commands()
         return new_pipeline
 
+    def _tag_origin(self) -> None:
+        """まだ生成元が記録されていないコマンドに、このパーツのクラス名を記録する"""
+        for cmd in self._assembly:
+            if cmd.origin is None:
+                cmd.origin = type(self).__name__
+
+    def _intermediate_output(self, name: str) -> Path:
+        """
+        中間生成物の出力パスを返し、中間生成物として記録する
+        最終成果物にはself._output / nameを使う
+        """
+        path = self._intermediate / name
+        self._intermediates.add(str(path))
+        return path
+
+    @property
+    def intermediates(self) -> set[str]:
+        """中間生成物として記録された出力パス"""
+        return set(self._intermediates)
+
+    @property
+    def assembly(self) -> Q2CmdAssembly:
+        """実行するコマンド"""
+        return self._assembly
+
     def _cmd_build(self, inputs: dict[str] = None) -> dict[str]:
         if inputs is None:
             inputs = self._result
 
         return self._result
 
-    def run(self):
+    def _reap_candidates(self) -> set[str]:
+        """
+        早期削除の対象となる中間生成物
+        keep_resultsに結果の名前またはファイル名が一致するものは除く
+        """
+        keep = self._context.setting.keep_results
+        kept = {str(path) for name, path in self._result.items() if name in keep}
+        return {
+            path
+            for path in self._intermediates
+            if path not in kept
+            and not any(fnmatch(PurePosixPath(path).name, pattern) for pattern in keep)
+        }
+
+    def _reaper(self) -> ArtifactReaper | None:
+        setting = self._context.setting
+        if setting.reap_mode is ReapMode.OFF:
+            return None
+        return ArtifactReaper(
+            executor=self._context.executor,
+            commands=self._assembly,
+            candidates=self._reap_candidates(),
+            archive_path=(
+                setting.ctn_archive_path
+                if setting.reap_mode is ReapMode.ARCHIVE
+                else None
+            ),
+        )
+
+    def run(self, workers: int = 1, cost: Callable[[Q2Cmd], float] | None = None):
+        """
+        コマンドを実行する
+
+        workersが2以上の場合、依存するコマンドが全て終了したコマンドから
+        最大workers個を同時に実行する。実行できるコマンドが複数ある場合は
+        順番の早いものを優先する。costに予測実行時間を渡した場合は、
+        最後のコマンドまでの最長経路が長いものを優先する。
+        イベントは全て呼び出し元のスレッドから通知する。
+        """
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1: {workers}")
+
         self._requires.ensure(self._context.executor)
-        for cmd in self._assembly.build_all():
-            self._context.executor.run(cmd)
+        self._tag_origin()
+
+        events = self._context.events
+        reaper = self._reaper()
+        if reaper is not None:
+            events.subscribe(reaper)
+
+        try:
+            if workers == 1:
+                self._run_sequential()
+            else:
+                self._run_parallel(workers, cost)
+        finally:
+            if reaper is not None:
+                events.unsubscribe(reaper)
 
         return self._result
+
+    def _execute(self, cmd) -> tuple[float, Exception | None]:
+        """コマンドを実行し、実行時間と失敗した場合の例外を返す"""
+        start = time.perf_counter()
+        try:
+            self._context.executor.run(cmd.build())
+        except Exception as e:
+            return time.perf_counter() - start, e
+        return time.perf_counter() - start, None
+
+    def _run_sequential(self) -> None:
+        events = self._context.events
+        commands = list(self._assembly)
+        for i, cmd in enumerate(commands):
+            events.emit(CommandEvent(STARTED, cmd, i, len(commands)))
+            duration, error = self._execute(cmd)
+            if error is not None:
+                events.emit(
+                    CommandEvent(
+                        FAILED, cmd, i, len(commands), duration=duration, error=error
+                    )
+                )
+                raise error
+            events.emit(
+                CommandEvent(FINISHED, cmd, i, len(commands), duration=duration)
+            )
+
+    def _run_parallel(
+        self, workers: int, cost: Callable[[Q2Cmd], float] | None = None
+    ) -> None:
+        """
+        依存関係のグラフに沿ってコマンドを並列に実行する
+        失敗した場合は新しいコマンドを開始せず、実行中のコマンドの終了を待って例外を送出する
+
+        イベントは全てこのスレッドから通知する。終了イベントのリスナーはコンテナ内で
+        計測などを行うことがあるため、終了によって実行可能になったコマンドを先に開始してから
+        終了イベントを通知し、リスナーの処理中もワーカーが空かないようにする。
+        """
+        events = self._context.events
+        commands = list(self._assembly)
+        total = len(commands)
+
+        waiting = self._assembly.dependencies()
+        dependents: dict[int, list[int]] = {i: [] for i in range(total)}
+        for i, dependencies in enumerate(waiting):
+            for dependency in dependencies:
+                dependents[dependency].append(i)
+        priorities = self._assembly.priorities(cost)
+        ready = [
+            priorities[i] for i, dependencies in enumerate(waiting) if not dependencies
+        ]
+        heapq.heapify(ready)
+
+        running: dict[Future, int] = {}
+        failure: Exception | None = None
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+
+            def dispatch() -> None:
+                while ready and len(running) < workers and failure is None:
+                    _, i = heapq.heappop(ready)
+                    events.emit(CommandEvent(STARTED, commands[i], i, total))
+                    running[pool.submit(self._execute, commands[i])] = i
+
+            while True:
+                dispatch()
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                finished = []
+                for future in sorted(done, key=running.get):
+                    i = running.pop(future)
+                    duration, error = future.result()
+                    if error is not None:
+                        events.emit(
+                            CommandEvent(
+                                FAILED,
+                                commands[i],
+                                i,
+                                total,
+                                duration=duration,
+                                error=error,
+                            )
+                        )
+                        failure = failure or error
+                        continue
+                    finished.append(
+                        CommandEvent(FINISHED, commands[i], i, total, duration=duration)
+                    )
+                    for dependent in dependents[i]:
+                        waiting[dependent].discard(i)
+                        if not waiting[dependent]:
+                            heapq.heappush(ready, priorities[dependent])
+
+                dispatch()
+                for event in finished:
+                    events.emit(event)
+
+        if failure is not None:
+            raise failure
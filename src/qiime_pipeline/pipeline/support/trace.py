@@ -0,0 +1,158 @@
+"""
+実行のトレース（Trace Event Format）
+
+設定の読み込みやイメージの取得などホスト側の処理と、各コマンドの実行を
+区間(span)として記録し、Chrome TracingやPerfettoで読み込めるJSONに書き出す。
+
+ホスト側の処理は "host" のトラックに、コマンドは実行したワーカーごとの
+トラック（worker-0, worker-1, ...）に並べる。トレースを有効にしない場合は
+NullTracerが使われ、記録は行われない。
+"""
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import ContextManager, Iterator
+from .events import FAILED, FINISHED, STARTED, CommandEvent
+
+HOST_TID = 0
+
+
+class NullTracer:
+    """何も記録しないトレーサー"""
+
+    def span(self, name: str, category: str = "host", **args) -> ContextManager:
+        return nullcontext()
+
+    def __call__(self, event: CommandEvent) -> None:
+        pass
+
+
+class Tracer(NullTracer):
+    """
+    区間を記録し、Trace Event Format(JSON)として書き出す
+
+    コマンドの実行イベントのリスナーとしても使える。
+    同時に実行されているコマンドには、それぞれ空いているワーカーのトラックを割り当てる。
+    """
+
+    def __init__(self):
+        self.__origin = time.perf_counter()
+        self.__pid = os.getpid()
+        self.__lock = threading.Lock()
+        self.__events: list[dict] = []
+        self.__running: dict[int, tuple[int, float]] = {}
+        self.__workers: set[int] = set()
+
+    def __now(self) -> float:
+        """トレース開始からの経過時間（マイクロ秒）"""
+        return (time.perf_counter() - self.__origin) * 1e6
+
+    def __complete(
+        self, name: str, category: str, tid: int, start: float, args: dict
+    ) -> None:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round(start, 3),
+            "dur": round(self.__now() - start, 3),
+            "pid": self.__pid,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = args
+        with self.__lock:
+            self.__events.append(event)
+
+    @contextmanager
+    def span(self, name: str, category: str = "host", **args) -> Iterator[None]:
+        """withブロックの区間をホストのトラックに記録する"""
+        start = self.__now()
+        try:
+            yield
+        finally:
+            self.__complete(name, category, HOST_TID, start, args)
+
+    def __call__(self, event: CommandEvent) -> None:
+        if event.kind == STARTED:
+            with self.__lock:
+                busy = {worker for worker, _ in self.__running.values()}
+                worker = next(i for i in range(len(busy) + 1) if i not in busy)
+                self.__workers.add(worker)
+                self.__running[event.index] = (worker, self.__now())
+        elif event.kind in (FINISHED, FAILED):
+            with self.__lock:
+                running = self.__running.pop(event.index, None)
+            if running is None:
+                return
+            worker, start = running
+            args = {
+                "index": event.index,
+                "part": event.command.origin,
+                "outputs": event.outputs,
+            }
+            if event.error is not None:
+                args["error"] = str(event.error)
+            self.__complete(
+                str(event.command).removeprefix("qiime "),
+                "command" if event.kind == FINISHED else "failed",
+                worker + 1,
+                start,
+                args,
+            )
+
+    def to_dict(self) -> dict:
+        """Trace Event Formatの辞書を返す"""
+        with self.__lock:
+            events = list(self.__events)
+            workers = sorted(self.__workers)
+
+        def thread_name(tid: int, name: str) -> dict:
+            return {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self.__pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+
+        metadata = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": self.__pid,
+                "args": {"name": "qiime_pipeline"},
+            },
+            thread_name(HOST_TID, "host"),
+            *(thread_name(worker + 1, f"worker-{worker}") for worker in workers),
+        ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w") as f:
+            json.dump(self.to_dict(), f)
+
+
+_tracer: NullTracer = NullTracer()
+
+
+def get_tracer() -> NullTracer:
+    """現在有効なトレーサーを返す"""
+    return _tracer
+
+
+def set_tracer(tracer: NullTracer | None) -> None:
+    """トレーサーを切り替える。Noneの場合は記録しない"""
+    global _tracer
+    _tracer = NullTracer() if tracer is None else tracer
+
+
+def span(name: str, category: str = "host", **args) -> ContextManager:
+    """現在のトレーサーで区間を記録する"""
+    return _tracer.span(name, category, **args)
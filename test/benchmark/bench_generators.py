@@ -0,0 +1,133 @@
+"""
+ベンチマーク用の合成データ
+"""
+
+from __future__ import annotations
+import random
+from pathlib import Path
+import pytest
+from qiime_pipeline.data.store import (
+    ContainerData,
+    Dataset,
+    Datasets,
+    PairPath,
+    Region,
+    SettingData,
+)
+from qiime_pipeline.pipeline.support import (
+    Pipeline,
+    PipelineContext,
+    PipelineType,
+    Q2CmdAssembly,
+)
+
+REGION = Region("V3V4", 17, 21, 280, 220)
+
+
+def scales(*values: int) -> list:
+    """規模のパラメータを作る。10²を超える規模はslowとしてマークする"""
+    return [pytest.param(v, marks=pytest.mark.slow) if v > 10**2 else v for v in values]
+
+
+def command_chains(n: int, length: int = 10, seed: int = 0) -> Q2CmdAssembly:
+    """
+    長さlengthのコマンドの連鎖を合計n個含むアセンブリを、順序を崩して作る
+    """
+    assembly = Q2CmdAssembly()
+    for i in range(n):
+        chain, step = divmod(i, length)
+        cmd = assembly.new_cmd("qiime synthetic step")
+        if step:
+            cmd.add_input("data", f"/out/{chain}/{step - 1}.qza")
+        cmd.add_output("data", f"/out/{chain}/{step}.qza")
+    random.Random(seed).shuffle(assembly.commands)
+    return assembly
+
+
+class SyntheticPart(Pipeline):
+    """前のパーツの出力を読み込み、length個のコマンドの連鎖を作るパーツ"""
+
+    length = 10
+
+    def _cmd_build(self, inputs: dict[str] = None) -> dict[str]:
+        previous = (inputs or {}).get("last")
+        name = f"{type(self).__name__}_{id(self)}"
+        for step in range(self.length):
+            cmd = self._assembly.new_cmd("qiime synthetic step")
+            if previous is not None:
+                cmd.add_input("data", previous)
+            previous = cmd.add_output("data", f"/out/{name}/{step}.qza").get_outputs()
+        self._result["last"] = previous
+        return self._result
+
+
+def fastq_paths(n: int) -> list[Path]:
+    """n個のサンプルのR1/R2のFASTQのパス"""
+    return [
+        Path(f"/data/batch/s{i}_S1_L001_{direction}_001.fastq.gz")
+        for i in range(n)
+        for direction in ("R1", "R2")
+    ]
+
+
+def write_datasets(root: Path, n: int, batches: int = 4) -> Datasets:
+    """合計n個のサンプルを、空のFASTQとメタデータのCSVとしてbatches個に分けて書き出す"""
+    sets = set()
+    for b in range(batches):
+        samples = range(b, n, batches)
+        folder = root / f"batch{b}"
+        folder.mkdir(parents=True)
+        for i in samples:
+            for direction in ("R1", "R2"):
+                (folder / f"s{i:07d}_S1_L001_{direction}_001.fastq.gz").touch()
+        metadata = root / f"batch{b}.csv"
+        metadata.write_text(
+            "#SampleID,Batch,Depth\n"
+            + "".join(f"s{i:07d},batch{b},{i % 97}\n" for i in samples)
+        )
+        sets.add(Dataset(f"batch{b}", folder, metadata, REGION))
+    return Datasets(sets=sets)
+
+
+def write_manifest(path: Path, n: int) -> Path:
+    """n行のマニフェストを書き出す"""
+    with path.open("w") as f:
+        f.write("sample-id\tforward-absolute-filepath\treverse-absolute-filepath\n")
+        for i in range(n):
+            base = f"/workspace/data/batch/s{i}_S1_L001"
+            f.write(f"id{i}\t{base}_R1_001.fastq.gz\t{base}_R2_001.fastq.gz\n")
+    return path
+
+
+def write_id_table(path: Path, n: int, columns: int = 6) -> Path:
+    """先頭の列にIDを持つn行のタブ区切りの表を書き出す"""
+    with path.open("w") as f:
+        f.write("\t".join(["#SampleID", *(f"c{j}" for j in range(columns))]) + "\n")
+        for i in range(n):
+            f.write("\t".join([f"id{i}", *(str(i * j) for j in range(columns))]))
+            f.write("\n")
+    return path
+
+
+def simulated_context(
+    executor, datasets: Datasets, root: Path, workers: int = 1
+) -> PipelineContext:
+    """executorでコマンドを実行するパイプラインのコンテキスト"""
+    setting = SettingData(
+        container_data=ContainerData(
+            image_or_dockerfile="simulated",
+            workspace_path=Path("/workspace"),
+            output_path=PairPath(root / "out", Path("/workspace/out")),
+            database_path=PairPath(root / "db.qza", Path("/db/db.qza")),
+        ),
+        datasets=datasets,
+        sampling_depth=1000,
+        workers=workers,
+    )
+    return PipelineContext.create(
+        ctn_metadata=Path("/workspace/metadata.tsv"),
+        ctn_manifest=Path("/workspace/manifest.tsv"),
+        executor=executor,
+        setting=setting,
+        pipeline_type=PipelineType.BASIC,
+    )
@@ -0,0 +1,70 @@
+"""
+マニフェストとメタデータの作成・検証・抽出のベンチマーク
+
+create_Mfilesは実際のFASTQファイル（空ファイル）を必要とするため、
+規模は10⁴サンプルまでとする。
+"""
+
+import io
+import pytest
+from bench_generators import (
+    fastq_paths,
+    scales,
+    write_datasets,
+    write_id_table,
+    write_manifest,
+)
+from qiime_pipeline.data.control import check_manifest, validate_manifest
+from qiime_pipeline.data.control.create_Mfiles import create_Mfiles, pairwised_files
+from qiime_pipeline.data.control.extract_id import extract_id, extract_id_bulk
+
+
+@pytest.mark.parametrize("n", scales(10**2, 10**4, 10**6))
+def test_pairwised_files(benchmark, n):
+    files = fastq_paths(n)
+    benchmark(pairwised_files, setup=lambda: files)
+    assert len(pairwised_files(files)) == n
+
+
+@pytest.mark.parametrize("n", scales(10**2, 10**4))
+def test_create_Mfiles(benchmark, tmp_path, n):
+    datasets = write_datasets(tmp_path / "data", n)
+    out = tmp_path / "out"
+
+    benchmark(lambda: create_Mfiles(out, out / "ctn", datasets))
+
+    with (out / "manifest.tsv").open() as f:
+        assert sum(1 for _ in f) == n + 1
+
+
+@pytest.mark.parametrize("n", scales(10**2, 10**4, 10**6))
+def test_validate_manifest(benchmark, tmp_path, n):
+    manifest = write_manifest(tmp_path / "manifest.tsv", n)
+
+    benchmark(lambda: validate_manifest(manifest))
+
+    assert check_manifest(str(manifest))
+
+
+@pytest.mark.parametrize("n", scales(10**2, 10**4, 10**6))
+def test_extract_id(benchmark, tmp_path, n):
+    table = write_id_table(tmp_path / "table.tsv", n)
+    targets = [f"id{i}" for i in range(0, n, 10)]
+
+    benchmark(lambda: sum(1 for _ in extract_id(str(table), targets)))
+
+    assert sum(1 for _ in extract_id(str(table), targets)) == len(targets) + 1
+
+
+@pytest.mark.parametrize("n", scales(10**2, 10**4, 10**6))
+def test_extract_id_bulk(benchmark, tmp_path, n):
+    table = write_id_table(tmp_path / "table.tsv", n)
+    targets = [f"id{i}" for i in range(0, n, 10)]
+
+    def extract():
+        return extract_id_bulk(str(table), targets, output=io.BytesIO(), max_workers=2)
+
+    # プロセスプールの起動を含むため、計測回数を減らす
+    benchmark(extract, rounds=1)
+
+    assert extract() == len(targets)
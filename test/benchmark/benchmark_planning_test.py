@@ -0,0 +1,52 @@
+"""
+コマンドの計画（依存関係の解決とパーツの結合）のベンチマーク
+
+sort_commandsはコマンド数の2乗に比例し、連鎖の長さだけ再帰する。
+パーツの結合は結合のたびに全体を並べ替えるため、さらに急に増える。
+そのため規模はコマンド数で、sort_commandsは10²と10³、結合は10²と2×10²とする
+（実際のパイプラインは数十コマンド）。
+"""
+
+from types import SimpleNamespace
+from unittest.mock import Mock
+from pathlib import Path
+import pytest
+from bench_generators import SyntheticPart, command_chains, scales
+from qiime_pipeline.data.store import ReapMode
+from qiime_pipeline.pipeline.support import EventBus
+
+
+def make_context() -> SimpleNamespace:
+    return SimpleNamespace(
+        setting=SimpleNamespace(
+            ctn_output_path=Path("/out"),
+            ctn_intermediate_path=Path("/out"),
+            reap_mode=ReapMode.OFF,
+        ),
+        executor=Mock(),
+        events=EventBus(),
+    )
+
+
+@pytest.mark.parametrize("n", scales(10**2, 10**3))
+def test_sort_commands(benchmark, n):
+    result = benchmark(
+        lambda assembly: assembly.sort_commands(),
+        setup=lambda: command_chains(n),
+        memory=False,
+    )
+    assert result.seconds > 0
+
+
+@pytest.mark.parametrize("n", scales(10**2, 2 * 10**2))
+def test_pipeline_composition(benchmark, n):
+    """n個のコマンドを、10個ずつのパーツの結合として組み立てる"""
+    context = make_context()
+    composed = []
+
+    def compose():
+        parts = [SyntheticPart(context) for _ in range(n // SyntheticPart.length)]
+        composed.append(sum(parts[1:], parts[0]))
+
+    benchmark(compose, rounds=1, memory=False)
+    assert len(list(composed[-1]._assembly)) == n
@@ -0,0 +1,105 @@
+"""
+パイプライン全体のスケジューリングのベンチマーク
+
+SimulatedExecutorでpipeline_basicとpipeline_ancomをワーカー数を変えて実行する。
+仮想時間のスケジュールでは、順番どおりの優先度と最長経路を優先した場合を比べる。
+コストは実際の所要時間の比を模した値（秒）に、TIME_SCALEを掛けた時間だけ待機する。
+環境変数 QIIME_PIPELINE_BENCH_TELEMETRY に実行記録（telemetry.jsonl）を指定した場合は、
+そこから推定したコストを使う。
+"""
+
+import itertools
+import os
+from pathlib import Path
+import pytest
+from bench_generators import simulated_context, write_datasets
+from qiime_pipeline.pipeline.commands import pipelines
+from qiime_pipeline.pipeline.main.simulation import (
+    CostModel,
+    SimulatedExecutor,
+    simulate_schedule,
+)
+
+TELEMETRY_ENV = "QIIME_PIPELINE_BENCH_TELEMETRY"
+TIME_SCALE = 1e-4
+
+COSTS = {
+    "qiime tools import": 60,
+    "qiime dada2 denoise-paired": 900,
+    "qiime feature-classifier classify-sklearn": 600,
+    "qiime phylogeny align-to-tree-mafft-fasttree": 300,
+    "qiime diversity core-metrics-phylogenetic": 120,
+    "qiime diversity alpha-rarefaction": 120,
+    "qiime composition ancombc": 180,
+    "qiime diversity adonis": 90,
+    "qiime diversity beta-group-significance": 60,
+}
+
+GRAPHS = {
+    "basic": pipelines.BASIC_PARTS,
+    "ancom": pipelines.ANCOM_PARTS,
+}
+
+
+@pytest.fixture(scope="module")
+def cost_model() -> CostModel:
+    telemetry = os.environ.get(TELEMETRY_ENV)
+    if telemetry:
+        return CostModel.from_telemetry(Path(telemetry))
+    return CostModel(COSTS, default=20)
+
+
+@pytest.fixture(scope="module")
+def datasets(tmp_path_factory):
+    return write_datasets(tmp_path_factory.mktemp("datasets"), 16)
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4])
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_simulated_pipeline(benchmark, tmp_path, cost_model, datasets, graph, workers):
+    rounds = itertools.count()
+
+    def setup():
+        root = tmp_path / str(next(rounds))
+        executor = SimulatedExecutor(root / "container", cost_model, TIME_SCALE)
+        return simulated_context(executor, datasets, root, workers)
+
+    contexts = []
+
+    def run(context):
+        contexts.append(context)
+        pipelines.pipeline_run(context, GRAPHS[graph])
+
+    benchmark(run, setup=setup, memory=False)
+
+    executor = contexts[-1].executor
+    assert executor.peak_concurrency <= workers
+    assert not any(call.failed for call in executor.calls)
+    for call in executor.calls:
+        for path in call.outputs:
+            assert executor.local_path(path).is_file()
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_schedule_makespan(benchmark, tmp_path, cost_model, datasets, graph):
+    context = simulated_context(SimulatedExecutor(tmp_path), datasets, tmp_path)
+    assembly = pipelines.pipeline_build(context, GRAPHS[graph]).assembly
+
+    schedules, critical = {}, {}
+
+    def simulate():
+        for workers in (1, 2, 4, 8):
+            schedules[workers] = simulate_schedule(assembly, cost_model, workers)
+            # 予測が正確な場合に、最長経路を優先したスケジュール
+            critical[workers] = simulate_schedule(
+                assembly, cost_model, workers, priority=cost_model
+            )
+
+    benchmark(simulate, memory=False)
+
+    assert schedules[1].makespan == pytest.approx(schedules[1].work)
+    makespans = [schedules[w].makespan for w in (1, 2, 4, 8)]
+    assert makespans == sorted(makespans, reverse=True)
+    assert makespans[-1] < makespans[0]
+    for workers, schedule in critical.items():
+        assert schedule.makespan <= schedules[workers].makespan
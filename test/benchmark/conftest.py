@@ -0,0 +1,165 @@
+"""
+ホスト側の処理のベンチマーク
+
+benchmarkフィクスチャは関数の実行時間（複数回の中央値）と、tracemallocで計測した
+メモリ使用量の最大値を記録する。ベースラインのJSONに同じベンチマークの記録がある場合、
+閾値を超えて遅く（または大きく）なっていればテストを失敗させる。
+
+環境変数:
+    QIIME_PIPELINE_BENCH_SAVE: 1の場合、今回の結果をベースラインとして保存する
+    QIIME_PIPELINE_BENCH_THRESHOLD: 許容する増加率（既定値: 0.25 = 25%）
+    QIIME_PIPELINE_BENCH_BASELINE: ベースラインのパス（既定値: test/benchmark/baseline.json）
+
+10²を超える規模のベンチマークはslowとしてマークされ、--slowを指定した場合のみ実行される。
+
+pytest-xdistのワーカー（-n auto など）で実行した場合は、並列に動く他のワーカーの影響で
+計測値が揺らぐため、ベースラインとの比較を行わない。ワーカーごとに結果が分かれるため、
+保存（QIIME_PIPELINE_BENCH_SAVE=1）は -n 0 を指定しない限り失敗させる。
+"""
+
+from __future__ import annotations
+import dataclasses
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+import pytest
+
+SAVE_ENV = "QIIME_PIPELINE_BENCH_SAVE"
+THRESHOLD_ENV = "QIIME_PIPELINE_BENCH_THRESHOLD"
+BASELINE_ENV = "QIIME_PIPELINE_BENCH_BASELINE"
+XDIST_WORKER_ENV = "PYTEST_XDIST_WORKER"
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+# 計測値が小さすぎる場合は揺らぎが大きいため、比較しない
+MIN_COMPARABLE_SECONDS = 1e-3
+MIN_COMPARABLE_BYTES = 64 * 1024
+
+
+@dataclasses.dataclass
+class Measurement:
+    seconds: float
+    peak_bytes: int
+    rounds: int
+
+
+class Benchmark:
+    def __init__(self, name: str, baseline: dict, threshold: float, results: dict):
+        self.name = name
+        self.__baseline = baseline.get(name)
+        self.__threshold = threshold
+        self.__results = results
+
+    def __call__(
+        self,
+        func: Callable,
+        setup: Callable | None = None,
+        rounds: int = 3,
+        memory: bool = True,
+    ) -> Measurement:
+        """
+        funcの実行時間とメモリ使用量を計測する
+
+        setupを指定した場合は各回の前に呼び出し（計測には含めない）、
+        その戻り値をfuncの引数として渡す。
+        tracemallocは割り当ての多い処理を大きく遅くするため、
+        memory=Falseの場合はメモリを計測しない（peak_bytesは0になる）。
+        """
+
+        def call():
+            if setup is None:
+                return func, ()
+            return func, (setup(),)
+
+        times = []
+        for _ in range(rounds):
+            f, args = call()
+            start = time.perf_counter()
+            f(*args)
+            times.append(time.perf_counter() - start)
+
+        peak = 0
+        if memory:
+            f, args = call()
+            tracemalloc.start()
+            try:
+                f(*args)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        measurement = Measurement(statistics.median(times), peak, rounds)
+        self.__results[self.name] = dataclasses.asdict(measurement)
+        self.__check(measurement)
+        return measurement
+
+    def __check(self, measurement: Measurement) -> None:
+        if self.__baseline is None or os.environ.get(SAVE_ENV) == "1":
+            return
+        if _is_xdist_worker():
+            return
+
+        limit = 1 + self.__threshold
+        regressions = []
+        for key, floor in (
+            ("seconds", MIN_COMPARABLE_SECONDS),
+            ("peak_bytes", MIN_COMPARABLE_BYTES),
+        ):
+            base, now = self.__baseline[key], getattr(measurement, key)
+            if base >= floor and now > base * limit:
+                regressions.append(f"{key}: {base:.6g} -> {now:.6g}")
+
+        if regressions:
+            pytest.fail(
+                f"{self.name} regressed by more than {self.__threshold:.0%}: "
+                + ", ".join(regressions)
+            )
+
+
+def _is_xdist_worker() -> bool:
+    return XDIST_WORKER_ENV in os.environ
+
+
+def _baseline_path() -> Path:
+    return Path(os.environ.get(BASELINE_ENV, DEFAULT_BASELINE))
+
+
+@pytest.fixture(scope="session")
+def benchmark_results() -> dict:
+    return {}
+
+
+@pytest.fixture(scope="session")
+def benchmark_baseline() -> dict:
+    path = _baseline_path()
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+@pytest.fixture()
+def benchmark(request, benchmark_baseline, benchmark_results) -> Benchmark:
+    threshold = float(os.environ.get(THRESHOLD_ENV, DEFAULT_THRESHOLD))
+    return Benchmark(
+        request.node.name, benchmark_baseline, threshold, benchmark_results
+    )
+
+
+@pytest.fixture(scope="session", autouse=True)
+def save_benchmark_baseline(benchmark_baseline, benchmark_results):
+    if os.environ.get(SAVE_ENV) == "1" and _is_xdist_worker():
+        # 各ワーカーが同じファイルを上書きし、他のワーカーの結果が失われる
+        pytest.fail(
+            f"{SAVE_ENV}=1 cannot be used with pytest-xdist workers; "
+            "run the benchmarks with -n 0 to save a baseline"
+        )
+    yield
+    if os.environ.get(SAVE_ENV) != "1" or not benchmark_results:
+        return
+    # 今回実行しなかったベンチマークの記録は残す
+    path = _baseline_path()
+    path.write_text(
+        json.dumps({**benchmark_baseline, **benchmark_results}, indent=2) + "\n"
+    )
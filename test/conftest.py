@@ -189,10 +189,28 @@ def namespace(tmp_path, data_path_pairs) -> Namespace:
         pipeline="basic",
         data=data_path_pairs("DEFAULT_TEST_DATA"),
         dataset_region="V3V4",
+        auto_truncation=False,
+        quality_sample_size=10000,
         image="quay.io/qiime2/amplicon:latest",
         dockerfile=Path("dockerfiles/Dockerfile"),
         local_output=Path(tmp_path / "output"),
         local_database=Path("db/classifier.qza"),
+        preview=None,
+        pull_policy="if-not-present",
+        output_mode="copy",
+        scratch=None,
+        scratch_size=None,
+        reap="off",
+        keep=[],
+        workers=1,
+        history=None,
+        no_history=True,
+        sample_interval=5.0,
+        trace=None,
+        profile=[],
+        profile_python=False,
+        pool=0,
+        pool_dir=tmp_path / "pool",
         sampling_depth=5,
     )
 
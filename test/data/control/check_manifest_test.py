@@ -1,5 +1,9 @@
+from pathlib import PurePath
 from tempfile import NamedTemporaryFile
-from qiime_pipeline.data.control.check_manifest import check_manifest
+from qiime_pipeline.data.control.check_manifest import (
+    check_manifest,
+    validate_manifest,
+)
 
 
 def test_can_currentry_check():
@@ -13,3 +17,67 @@ def test_can_currentry_check():
         )
 
         assert check_manifest(f.name) is True
+
+
+def write_manifest(path, rows):
+    path.write_text(
+        "sample-id\tforward-absolute-filepath\treverse-absolute-filepath\n"
+        + "".join("\t".join(row) + "\n" for row in rows)
+    )
+    return path
+
+
+def test_validate_manifest_reports_every_problem(tmp_path):
+    manifest = write_manifest(
+        tmp_path / "manifest.tsv",
+        [
+            ("id1", "/d/t1_R1.fastq.gz", "/d/t1_R2.fastq.gz"),
+            ("id2", "/d/t2_R2.fastq.gz", "/d/t2_R1.fastq.gz"),
+            ("id3", "/d/t3_R1.fastq.gz", "/d/t4_R2.fastq.gz"),
+            ("id1", "/d/t5_R1.fastq.gz", "/d/t5_R2.fastq.gz"),
+        ],
+    )
+
+    report = validate_manifest(str(manifest))
+
+    assert not report.ok
+    assert report.rows == 4
+    assert [(p.line, p.sample_id) for p in report.problems] == [
+        (2, "id1"),
+        (3, "id2"),
+        (3, "id2"),
+        (4, "id3"),
+        (5, "id1"),
+    ]
+    assert "different sample names" in report.problems[3].message
+    assert check_manifest(str(manifest)) is False
+
+
+def test_validate_manifest_checks_files_through_path_map(tmp_path):
+    local = tmp_path / "fastq"
+    local.mkdir()
+    local.joinpath("t1_R1.fastq.gz").touch()
+    local.joinpath("t1_R2.fastq.gz").touch()
+    local.joinpath("t2_R1.fastq.gz").touch()
+    manifest = write_manifest(
+        tmp_path / "manifest.tsv",
+        [
+            (
+                "id1",
+                "/workspace/data/fastq/t1_R1.fastq.gz",
+                "/workspace/data/fastq/t1_R2.fastq.gz",
+            ),
+            (
+                "id2",
+                "/workspace/data/fastq/t2_R1.fastq.gz",
+                "/workspace/data/fastq/t2_R2.fastq.gz",
+            ),
+        ],
+    )
+
+    report = validate_manifest(
+        str(manifest), path_map={PurePath("/workspace/data/fastq"): local}
+    )
+
+    assert [p.sample_id for p in report.problems] == ["id2"]
+    assert "t2_R2.fastq.gz" in report.problems[0].message
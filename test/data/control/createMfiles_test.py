@@ -10,7 +10,10 @@ from qiime_pipeline.data.control.create_Mfiles import (
     pairwised_files,
     pairwise,
     linked_table_expose,
+    iter_all_metadata,
+    create_Mfiles,
 )
+from qiime_pipeline.data.store import Dataset, Datasets, Region, SampleIdRegistry
 
 
 def test_get_header_success(tmp_path):
@@ -108,3 +111,61 @@ def test_linked_table_expose(dummy_datasets):
         assert extract_first_underscore(prob_fwd) == extract_first_underscore(
             prob_rvs
         ), f"{i}行目のファイルパスがペアになっていません。"
+
+
+@pytest.fixture()
+def unsorted_datasets(tmp_path):
+    sets = set()
+    for name, samples in (("b1", ["s3", "s1"]), ("b2", ["s4", "s2", "s0"])):
+        fastq_folder = tmp_path / name
+        fastq_folder.mkdir()
+        for sample in samples:
+            for direction in ("R1", "R2"):
+                fastq_folder.joinpath(f"{sample}_S1_L001_{direction}_001.fastq").touch()
+        metadata = tmp_path / f"{name}.csv"
+        metadata.write_text(
+            "#SampleID,Batch\n" + "".join(f"{s},{name}\n" for s in samples)
+        )
+        sets.add(Dataset(name, fastq_folder, metadata, Region("R", 0, 0, 0, 0)))
+
+    return Datasets(sets=sets)
+
+
+def test_iter_all_metadata_merges_in_rawid_order(unsorted_datasets):
+    rows = list(iter_all_metadata(unsorted_datasets))
+    assert [row[0] for row in rows] == ["s0", "s1", "s2", "s3", "s4"]
+
+
+def test_create_Mfiles_streams_linked_tables(tmp_path, unsorted_datasets):
+    ctn_fastq_path = Path("/workspace/fastq")
+    meta_path, manifest_path = create_Mfiles(
+        tmp_path / "out", ctn_fastq_path, unsorted_datasets
+    )
+
+    meta = [line.split("\t") for line in meta_path.read_text().splitlines()]
+    manifest = [line.split("\t") for line in manifest_path.read_text().splitlines()]
+
+    assert meta[0] == ["#SampleID", "RawID", "Batch"]
+    assert meta[1] == ["id1", "s0", "b2"]
+    assert len(meta) == len(manifest) == 6
+    assert manifest[1][1] == str(ctn_fastq_path / "b2/s0_S1_L001_R1_001.fastq")
+
+
+def test_create_Mfiles_with_registry_keeps_ids_and_files(tmp_path, unsorted_datasets):
+    out = tmp_path / "out"
+    with SampleIdRegistry(out / "sample_ids.sqlite") as registry:
+        meta_path, _ = create_Mfiles(
+            out, Path("/ctn"), unsorted_datasets, registry=registry
+        )
+    mtime = meta_path.stat().st_mtime_ns
+    first = meta_path.read_text()
+
+    with SampleIdRegistry(out / "sample_ids.sqlite") as registry:
+        meta_path, _ = create_Mfiles(
+            out, Path("/ctn"), unsorted_datasets, registry=registry
+        )
+
+    # 内容が変わらないファイルは書き換えられない
+    assert meta_path.read_text() == first
+    assert meta_path.stat().st_mtime_ns == mtime
+    assert not list(out.glob("*.part"))
@@ -0,0 +1,72 @@
+import random
+import pytest
+from pathlib import Path
+from qiime_pipeline.data.store import KNOWN_PRIMERS
+from qiime_pipeline.data.store.primers import V3V4_PRIMERS, V4_PRIMERS
+from qiime_pipeline.data.control.detect_region import (
+    PrimerAutomaton,
+    detect_region,
+    expand_degenerate,
+)
+
+
+def random_seq(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+
+def write_pair(tmp_path: Path, name: str, fwd: list[str], rvs: list[str]):
+    paths = []
+    for direction, seqs in (("R1", fwd), ("R2", rvs)):
+        path = tmp_path / f"{name}_{direction}.fastq"
+        path.write_text(
+            "".join(f"@r{i}\n{s}\n+\n{'I' * len(s)}\n" for i, s in enumerate(seqs))
+        )
+        paths.append(path)
+    return tuple(paths)
+
+
+def test_expand_degenerate():
+    assert sorted(expand_degenerate("ARN")) == sorted(
+        [b"AAA", b"AAC", b"AAG", b"AAT", b"AGA", b"AGC", b"AGG", b"AGT"]
+    )
+
+
+@pytest.mark.parametrize(
+    "seq,expected",
+    [
+        pytest.param("CCTACGGGAGGCAGCAGTTTT", {("V3V4", "forward")}, id="V3V4 fwd"),
+        pytest.param("GGCCTACGGGTGGCTGCAG", {("V3V4", "forward")}, id="offset"),
+        pytest.param("GACTACCAGGGTATCTAATCC", {("V3V4", "reverse")}, id="V3V4 rvs"),
+        pytest.param("GTGTCAGCAGCCGCGGTAAAC", {("V4", "forward")}, id="V4 fwd"),
+        pytest.param("TTTTTTTTTTTTTTTTTTTTT", set(), id="no primer"),
+    ],
+)
+def test_automaton_matches_degenerate_primers(seq, expected):
+    automaton = PrimerAutomaton(KNOWN_PRIMERS)
+    assert automaton.match(seq.encode()) == expected
+
+
+@pytest.mark.parametrize("primers", [V3V4_PRIMERS, V4_PRIMERS])
+def test_detect_region(tmp_path, primers):
+    rng = random.Random(0)
+    fwd = [
+        expand_degenerate(primers.forward)[0].decode() + random_seq(rng, 50)
+        for _ in range(20)
+    ]
+    rvs = [
+        expand_degenerate(primers.reverse)[-1].decode() + random_seq(rng, 50)
+        for _ in range(20)
+    ]
+    pair = write_pair(tmp_path, "s1", fwd, rvs)
+
+    assert detect_region([pair]) == primers.region_name
+    # R1とR2が入れ替わっていても検出できる
+    assert detect_region([pair[::-1]]) == primers.region_name
+
+
+def test_detect_region_returns_none_without_primers(tmp_path):
+    rng = random.Random(0)
+    seqs = [random_seq(rng, 60) for _ in range(20)]
+    pair = write_pair(tmp_path, "s1", seqs, seqs)
+
+    assert detect_region([pair]) is None
@@ -2,7 +2,16 @@
 import pytest
 import tempfile
 import os
-from qiime_pipeline.data.control.extract_id import extract_id, ExtractError
+import io
+from pathlib import Path
+from qiime_pipeline.data.control.extract_id import (
+    extract_id,
+    extract_id_bulk,
+    extract_ids,
+    read_targets,
+    subset_Mfiles,
+    ExtractError,
+)
 
 
 def create_test_file(content: str) -> str:
@@ -126,3 +135,148 @@ def test_generator_behavior(basic_test_data):
     # これ以上sample1は含まれていないはず
     remaining_rows = list(generator)
     assert all("sample1" not in row for row in remaining_rows)
+
+
+def test_extract_by_column_name(species_test_data):
+    """列名による抽出のテスト"""
+    results = list(extract_id(species_test_data, ["Tokyo"], column="Location"))
+    assert len(results) == 3
+    assert "CF001" in results[1]
+    assert "BF001" in results[2]
+
+    # 先頭の"#"を除いた列名でも指定できる
+    results = list(extract_id(species_test_data, ["CF002"], column="SampleID"))
+    assert len(results) == 2
+
+
+def test_unknown_column_name(basic_test_data):
+    """存在しない列名のテスト"""
+    with pytest.raises(ExtractError) as exc_info:
+        list(extract_id(basic_test_data, ["sample1"], column="Unknown"))
+    assert "見つかりません" in str(exc_info.value)
+
+
+def test_read_targets(tmp_path):
+    """ターゲットIDのファイルの読み込みテスト"""
+    targets_file = tmp_path / "targets.txt"
+    targets_file.write_text("sample1\n\n sample3 \n")
+    assert read_targets(str(targets_file)) == ["sample1", "sample3"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 16, 1 << 20])
+@pytest.mark.parametrize("exclude_mode", [False, True])
+@pytest.mark.parametrize(
+    "targets,column,bulk_column",
+    [(["ctenocephalides_felis"], 1, "Species"), (["CF001"], 0, 0)],
+)
+@pytest.mark.parametrize("trailing_newline", [False, True])
+def test_bulk_matches_extract_id(
+    tmp_path,
+    species_test_data,
+    chunk_size,
+    exclude_mode,
+    targets,
+    column,
+    bulk_column,
+    trailing_newline,
+):
+    """バルクモードの結果が通常のモードと一致することのテスト"""
+    input_path = tmp_path / "species.tsv"
+    content = Path(species_test_data).read_text()
+    input_path.write_text(content + "\n" if trailing_newline else content)
+    expected = list(extract_id(str(input_path), targets, column, exclude_mode))
+
+    output = io.BytesIO()
+    written = extract_id_bulk(
+        str(input_path),
+        targets,
+        column=bulk_column,
+        exclude_mode=exclude_mode,
+        output=output,
+        chunk_size=chunk_size,
+        max_workers=2,
+    )
+
+    assert output.getvalue().decode().splitlines() == expected
+    assert written == len(expected) - 1
+
+
+def test_bulk_empty_file(empty_test_data):
+    """バルクモードの空ファイルのテスト"""
+    with pytest.raises(ExtractError) as exc_info:
+        extract_id_bulk(empty_test_data, ["sample1"], output=io.BytesIO())
+    assert "ファイルが空です" in str(exc_info.value)
+
+
+def test_extract_ids_filters_all_files(tmp_path, basic_test_data, species_test_data):
+    """複数ファイルの絞り込みのテスト"""
+    outputs = extract_ids(
+        [basic_test_data, species_test_data],
+        ["sample2", "CF001"],
+        str(tmp_path / "out"),
+    )
+
+    basic = open(outputs[basic_test_data]).read().splitlines()
+    species = open(outputs[species_test_data]).read().splitlines()
+    assert [row.split("\t")[0] for row in basic] == ["#SampleID", "sample2"]
+    assert [row.split("\t")[0] for row in species] == ["#SampleID", "CF001"]
+
+
+def test_extract_ids_rejects_the_input_directory(tmp_path, basic_test_data):
+    """出力先が入力ファイルのディレクトリである場合のテスト"""
+    content = open(basic_test_data).read()
+
+    with pytest.raises(ExtractError) as exc_info:
+        extract_ids([basic_test_data], ["sample2"], os.path.dirname(basic_test_data))
+    assert "入力ファイルと同じです" in str(exc_info.value)
+    assert open(basic_test_data).read() == content
+
+
+def test_extract_ids_keeps_previous_output_on_failure(tmp_path, empty_test_data):
+    """失敗した場合に、以前の出力や一時ファイルを残さないことのテスト"""
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    previous = out_dir / os.path.basename(empty_test_data)
+    previous.write_text("previous\n")
+
+    with pytest.raises(ExtractError):
+        extract_ids([empty_test_data], ["sample1"], str(out_dir))
+    assert previous.read_text() == "previous\n"
+    assert os.listdir(out_dir) == [previous.name]
+
+
+def test_subset_Mfiles_rejects_the_input_directory(tmp_path):
+    """メタデータとマニフェストの出力先が入力のディレクトリである場合のテスト"""
+    metadata = tmp_path / "metadata.tsv"
+    metadata.write_text("#SampleID\tRawID\nid1\tcat1\n")
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text("sample-id\tforward-absolute-filepath\nid1\t/d/s1.fastq\n")
+
+    with pytest.raises(ExtractError):
+        subset_Mfiles(str(metadata), str(manifest), ["cat1"], str(tmp_path))
+    assert metadata.read_text() == "#SampleID\tRawID\nid1\tcat1\n"
+
+
+def test_subset_Mfiles_keeps_pair_consistent(tmp_path):
+    """メタデータとマニフェストの組の絞り込みのテスト"""
+    metadata = tmp_path / "metadata.tsv"
+    metadata.write_text(
+        "#SampleID\tRawID\tSpecies\n"
+        "id1\tcat1\tfelis\n"
+        "id2\tdog1\tcanis\n"
+        "id3\tcat2\tfelis\n"
+    )
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text(
+        "sample-id\tforward-absolute-filepath\treverse-absolute-filepath\n"
+        + "".join(f"id{i}\t/d/s{i}_R1.fastq\t/d/s{i}_R2.fastq\n" for i in (1, 2, 3))
+    )
+
+    sub_metadata, sub_manifest = subset_Mfiles(
+        str(metadata), str(manifest), ["cat1", "cat2"], str(tmp_path / "subset")
+    )
+
+    meta_rows = open(sub_metadata).read().splitlines()
+    manifest_rows = open(sub_manifest).read().splitlines()
+    assert [row.split("\t")[0] for row in meta_rows] == ["#SampleID", "id1", "id3"]
+    assert [row.split("\t")[0] for row in manifest_rows] == ["sample-id", "id1", "id3"]
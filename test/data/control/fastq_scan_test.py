@@ -0,0 +1,86 @@
+import gzip
+import os
+import pytest
+from pathlib import Path
+from qiime_pipeline.data.control.fastq_scan import (
+    FastqIntegrityError,
+    preflight,
+    scan_all,
+    scan_fastq,
+)
+
+
+def write_fastq(path: Path, reads: int) -> Path:
+    """readsの数だけレコードを持つFASTQを作成する"""
+    body = "".join(f"@r{i}\nACGT\n+\nIIII\n" for i in range(reads)).encode()
+    if path.suffix == ".gz":
+        path.write_bytes(gzip.compress(body))
+    else:
+        path.write_bytes(body)
+    return path
+
+
+def test_scan_counts_reads(tmp_path):
+    plain = scan_fastq(write_fastq(tmp_path / "s1_R1.fastq", 3))
+    gz = scan_fastq(write_fastq(tmp_path / "s1_R2.fastq.gz", 5))
+
+    assert plain.ok and plain.reads == 3
+    assert gz.ok and gz.reads == 5
+
+
+def test_scan_detects_truncated_gzip(tmp_path):
+    path = write_fastq(tmp_path / "s1_R1.fastq.gz", 100)
+    path.write_bytes(path.read_bytes()[:-20])
+
+    result = scan_fastq(path)
+    assert not result.ok
+    assert "EOFError" in result.error
+
+
+def test_scan_detects_incomplete_record(tmp_path):
+    path = tmp_path / "s1_R1.fastq"
+    path.write_text("@r1\nACGT\n+\nIIII\n@r2\nACGT\n")
+
+    result = scan_fastq(path)
+    assert not result.ok
+    assert "multiple of 4" in result.error
+
+
+def test_preflight_reports_every_problem(tmp_path):
+    good = (
+        write_fastq(tmp_path / "a_R1.fastq.gz", 4),
+        write_fastq(tmp_path / "a_R2.fastq.gz", 4),
+    )
+    mismatch = (
+        write_fastq(tmp_path / "b_R1.fastq.gz", 4),
+        write_fastq(tmp_path / "b_R2.fastq.gz", 3),
+    )
+    broken = write_fastq(tmp_path / "c_R1.fastq.gz", 10)
+    broken.write_bytes(broken.read_bytes()[:-20])
+    truncated = (broken, write_fastq(tmp_path / "c_R2.fastq.gz", 10))
+
+    assert len(preflight([good], max_workers=1)) == 2
+
+    with pytest.raises(FastqIntegrityError) as exc_info:
+        preflight([good, mismatch, truncated], max_workers=1)
+
+    problems = exc_info.value.problems
+    assert len(problems) == 2
+    assert any("read count mismatch" in p and "b_R1" in p for p in problems)
+    assert any("c_R1" in p for p in problems)
+
+
+def test_cache_is_reused_while_size_and_mtime_are_unchanged(tmp_path):
+    cache = tmp_path / "cache.json"
+    path = write_fastq(tmp_path / "s1_R1.fastq", 2)
+    assert scan_all([path], cache_path=cache, max_workers=1)[str(path)].reads == 2
+
+    # 同じサイズ・同じ更新時刻のまま中身だけ変えると、キャッシュが使われる
+    stat = path.stat()
+    path.write_text(path.read_text().replace("ACGT", "TTTT"))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert scan_all([path], cache_path=cache, max_workers=1)[str(path)].reads == 2
+
+    # 更新時刻が変われば再検査される
+    write_fastq(path, 3)
+    assert scan_all([path], cache_path=cache, max_workers=1)[str(path)].reads == 3
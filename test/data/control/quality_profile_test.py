@@ -0,0 +1,72 @@
+import gzip
+import pytest
+from pathlib import Path
+from qiime_pipeline.data.store import Region
+from qiime_pipeline.data.control.quality_profile import (
+    QualityProfile,
+    propose_region,
+    propose_truncation,
+    reservoir_sample,
+)
+
+
+def write_fastq(path: Path, reads: int, good: int, length: int) -> Path:
+    """先頭good塩基がQ38、それ以降がQ10のリードを持つFASTQを作成する"""
+    qual = "G" * good + "+" * (length - good)
+    body = "".join(f"@r{i}\n{'A' * length}\n+\n{qual}\n" for i in range(reads)).encode()
+    path.write_bytes(gzip.compress(body))
+    return path
+
+
+def test_reservoir_sample_is_deterministic(tmp_path):
+    path = write_fastq(tmp_path / "s_R1.fastq.gz", 50, 5, 10)
+
+    first = reservoir_sample(path, 10, seed=1)
+    assert len(first) == 10
+    assert first == reservoir_sample(path, 10, seed=1)
+    assert len(reservoir_sample(path, 100)) == 50
+
+
+def test_profile_histograms_and_quantiles():
+    profile = QualityProfile.from_qualities([b"II#", b"I5", b"5"])
+
+    assert profile.reads == 3
+    assert profile.histograms[0] == {40: 2, 20: 1}
+    assert profile.histograms[2] == {2: 1}
+    assert profile.quantile(0.5) == [40, 20, 2]
+    assert profile.coverage() == [1.0, 2 / 3, 1 / 3]
+
+    merged = profile + QualityProfile.from_qualities([b"####"])
+    assert merged.reads == 4
+    assert merged.histograms[0] == {40: 2, 20: 1, 2: 1}
+    assert merged.histograms[3] == {2: 1}
+
+
+def test_propose_truncation_stops_where_quality_drops():
+    profile = QualityProfile.from_qualities([b"IIII####"] * 4)
+    assert propose_truncation(profile, threshold=25) == 4
+    assert propose_truncation(profile, threshold=1) == 8
+
+
+def test_propose_region_keeps_overlap(tmp_path):
+    pairs = [
+        (
+            write_fastq(tmp_path / f"s{i}_R1.fastq.gz", 20, 60, 100),
+            write_fastq(tmp_path / f"s{i}_R2.fastq.gz", 20, 40, 100),
+        )
+        for i in range(2)
+    ]
+    base = Region("Test", 5, 5, 100, 100)
+
+    region = propose_region(pairs, base, amplicon_length=None, max_workers=1)
+    assert (region.trunc_len_f, region.trunc_len_r) == (60, 40)
+    assert region.trim_left_f == 5
+    assert Region.from_toml(region.to_toml()) == region
+
+    region = propose_region(
+        pairs, base, amplicon_length=100, min_overlap=12, max_workers=1
+    )
+    assert region.trunc_len_f + region.trunc_len_r == 112
+
+    with pytest.raises(ValueError):
+        propose_region(pairs, base, amplicon_length=200, max_workers=1)
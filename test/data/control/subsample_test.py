@@ -0,0 +1,110 @@
+import argparse
+import gzip
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+from qiime_pipeline.data.store import Dataset, Datasets, Region
+from qiime_pipeline.data.control.fastq_io import iter_reads, open_fastq
+from qiime_pipeline.data.control.fastq_scan import preflight
+from qiime_pipeline.data.control.subsample import (
+    parse_preview,
+    preview_datasets,
+    subsample_pair,
+)
+
+
+def write_pair(folder: Path, name: str, reads: int) -> tuple[Path, Path]:
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for direction in ("R1", "R2"):
+        body = "".join(
+            f"@{name}.{i} {direction}\nACGT\n+\nIIII\n" for i in range(reads)
+        ).encode()
+        path = folder / f"{name}_{direction}.fastq.gz"
+        path.write_bytes(gzip.compress(body))
+        paths.append(path)
+    return tuple(paths)
+
+
+def read_ids(path: Path) -> list[bytes]:
+    with open_fastq(path) as f:
+        return [header.split()[0] for header, _, _ in iter_reads(f)]
+
+
+@pytest.mark.parametrize(
+    "value,expected", [("0.1", 0.1), ("1.0", 1.0), ("500", 500), ("1", 1)]
+)
+def test_parse_preview(value, expected):
+    amount = parse_preview(value)
+    assert amount == expected
+    assert type(amount) is type(expected)
+
+
+@pytest.mark.parametrize("value", ["0.0", "1.5", "0", "abc"])
+def test_parse_preview_rejects_invalid_values(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_preview(value)
+
+
+@pytest.mark.parametrize("amount", [0.3, 25])
+def test_subsample_pair_is_paired_and_deterministic(tmp_path, amount):
+    pair = write_pair(tmp_path / "in", "s1", 100)
+
+    out = subsample_pair(pair, tmp_path / "a", amount, seed=1)
+    again = subsample_pair(pair, tmp_path / "b", amount, seed=1)
+
+    fwd, rvs = read_ids(out[0]), read_ids(out[1])
+    assert fwd == rvs
+    assert fwd == read_ids(again[0])
+    assert 0 < len(fwd) < 100
+    if isinstance(amount, int):
+        assert len(fwd) == amount
+
+
+def test_preview_datasets_points_to_subsampled_files(tmp_path):
+    fastq_folder = tmp_path / "data" / "batch1"
+    write_pair(fastq_folder, "s1", 50)
+    write_pair(fastq_folder, "s2", 50)
+    metadata = tmp_path / "metadata.csv"
+    metadata.write_text("#SampleID,Species\ns1,a\ns2,b\n")
+
+    region = Region("Test", 0, 0, 4, 4)
+    datasets = Datasets(
+        sets={Dataset("batch1", fastq_folder, metadata, region)},
+    )
+
+    previewed = preview_datasets(datasets, 10, tmp_path / "preview", max_workers=1)
+
+    dataset = previewed.sets.pop()
+    assert dataset.fastq_folder == tmp_path / "preview" / "10" / "batch1"
+    assert dataset.region == region
+    assert len(dataset.fastq_files) == 4
+    for path in dataset.fastq_files:
+        assert len(read_ids(path)) == 10
+
+
+def test_preview_datasets_uses_preflight_read_counts(tmp_path, mocker):
+    fastq_folder = tmp_path / "data" / "batch1"
+    pair = write_pair(fastq_folder, "s1", 50)
+    metadata = tmp_path / "metadata.csv"
+    metadata.write_text("#SampleID,Species\ns1,a\n")
+    datasets = Datasets(
+        sets={Dataset("batch1", fastq_folder, metadata, Region("Test", 0, 0, 4, 4))},
+    )
+    cache_path = tmp_path / "scan_cache.json"
+    preflight([pair], cache_path=cache_path, max_workers=1)
+
+    # プロセスプールの代わりに同じプロセスで実行し、数え直さないことを確認する
+    mocker.patch(
+        "qiime_pipeline.data.control.subsample.ProcessPoolExecutor",
+        return_value=mocker.MagicMock(__enter__=lambda self: SimpleNamespace(map=map)),
+    )
+    scan = mocker.patch("qiime_pipeline.data.control.subsample.scan_fastq")
+
+    previewed = preview_datasets(
+        datasets, 10, tmp_path / "preview", cache_path=cache_path
+    )
+
+    scan.assert_not_called()
+    for path in previewed.sets.pop().fastq_files:
+        assert len(read_ids(path)) == 10
@@ -0,0 +1,74 @@
+import pytest
+from qiime_pipeline.data.store import MetadataTable
+
+
+@pytest.fixture()
+def metadata_file(tmp_path):
+    path = tmp_path / "metadata.csv"
+    path.write_text(
+        "#SampleID,Species,Note\n"
+        's1,human,"fever, cough"\n'
+        "s2,mouse,\n"
+        "\n"
+        's3,human,"say ""hi"""\n'
+    )
+    return path
+
+
+def test_from_csv_handles_quoted_fields(metadata_file):
+    table = MetadataTable.from_csv(metadata_file)
+
+    assert table.header == ["#SampleID", "Species", "Note"]
+    assert table.n_rows == 3
+    assert table.row(0) == ["s1", "human", "fever, cough"]
+    assert table.row(2) == ["s3", "human", 'say "hi"']
+
+
+def test_column_lookup_by_name_and_index(metadata_file):
+    table = MetadataTable.from_csv(metadata_file)
+
+    assert table.column("Species") == ["human", "mouse", "human"]
+    assert table.column(0) == ["s1", "s2", "s3"]
+    with pytest.raises(KeyError):
+        table.column("Unknown")
+
+
+def test_behaves_like_list_of_rows_with_header(metadata_file):
+    table = MetadataTable.from_csv(metadata_file)
+
+    assert len(table) == 4
+    assert table[0] == table.header
+    assert table[1:] == list(table.rows())
+    assert table[-1] == ["s3", "human", 'say "hi"']
+    assert list(table)[0] == table.header
+    with pytest.raises(IndexError):
+        table[4]
+
+
+def test_short_rows_are_padded_and_trailing_empty_fields_ignored(tmp_path):
+    path = tmp_path / "metadata.csv"
+    path.write_text("#SampleID,Species\ns1\ns2,mouse,\n")
+
+    table = MetadataTable.from_csv(path)
+
+    assert list(table.rows()) == [["s1", ""], ["s2", "mouse"]]
+
+
+def test_rows_wider_than_header_raise(tmp_path):
+    path = tmp_path / "metadata.csv"
+    path.write_text("#SampleID,Species\ns1,human,extra\n")
+
+    with pytest.raises(ValueError):
+        MetadataTable.from_csv(path)
+
+
+def test_sorted_rows(tmp_path):
+    path = tmp_path / "metadata.csv"
+    path.write_text("#SampleID,Species\ns3,a\ns1,b\ns2,c\n")
+
+    table = MetadataTable.from_csv(path)
+
+    assert [row[0] for row in table.sorted_rows()] == ["s1", "s2", "s3"]
+    assert [row[1] for row in table.sorted_rows("Species")] == ["a", "b", "c"]
+    # 元の行の順序は変わらない
+    assert table.column(0) == ["s3", "s1", "s2"]
@@ -0,0 +1,26 @@
+from qiime_pipeline.data.store import SampleIdRegistry
+
+
+def test_registry_keeps_ids_across_sessions(tmp_path):
+    path = tmp_path / "sample_ids.sqlite"
+    with SampleIdRegistry(path) as registry:
+        assert registry.sample_id("s2") == "id1"
+        assert registry.sample_id("s1") == "id2"
+        assert registry.sample_id("s2") == "id1"
+
+    with SampleIdRegistry(path) as registry:
+        assert registry.sample_id("s1") == "id2"
+        assert registry.sample_id("s0") == "id3"
+
+
+def test_registry_discards_ids_of_failed_session(tmp_path):
+    path = tmp_path / "sample_ids.sqlite"
+    try:
+        with SampleIdRegistry(path) as registry:
+            registry.sample_id("s1")
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    with SampleIdRegistry(path, id_prefix="sample") as registry:
+        assert registry.sample_id("s2") == "sample1"
@@ -0,0 +1,27 @@
+from pathlib import Path
+from qiime_pipeline.data.store import ScratchData
+
+
+def test_tmpfs_mount_option():
+    scratch = ScratchData(tmpfs_size=1 << 30)
+
+    assert scratch.is_tmpfs
+    assert scratch.to_mount_option("batch") == [
+        "type=tmpfs",
+        "dst=/scratch",
+        f"tmpfs-size={1 << 30}",
+    ]
+    assert scratch.intermediate_path == Path("/scratch/intermediate")
+
+
+def test_host_path_is_bound_per_batch(tmp_path):
+    scratch = ScratchData(host_path=tmp_path)
+
+    option = scratch.to_mount_option("batch")
+
+    assert (tmp_path / "batch").is_dir()
+    assert option == [
+        "type=bind",
+        f"src={(tmp_path / 'batch').resolve()}",
+        "dst=/scratch",
+    ]
@@ -0,0 +1,97 @@
+import sqlite3
+import pytest
+from argparse import Namespace
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock
+from qiime_pipeline.data.store import Datasets, OutputMode
+from qiime_pipeline.main import _run, _save_history
+from qiime_pipeline.pipeline.main.history import FeatureCounter, RunHistory
+from qiime_pipeline.pipeline.main.telemetry import CommandRecord
+
+
+def make_context(executor) -> SimpleNamespace:
+    setting = SimpleNamespace(batch_id="batch1", datasets=Datasets(sets=set()))
+    return SimpleNamespace(setting=setting, executor=executor)
+
+
+def make_recorder() -> SimpleNamespace:
+    record = CommandRecord(
+        index=0,
+        part=None,
+        command="qiime tools import",
+        start=0.0,
+        end=1.0,
+        wall_time=1.0,
+        exit_status=0,
+    )
+    return SimpleNamespace(records=[record])
+
+
+def test_save_history_without_image_id(tmp_path):
+    # CommandExecutorのインターフェース（runとstop）のみを持つexecutor
+    executor = Mock(spec=["run", "stop"])
+    history = RunHistory(tmp_path / "history.sqlite")
+
+    _save_history(
+        history, make_context(executor), FeatureCounter(executor), make_recorder()
+    )
+
+    with RunHistory(tmp_path / "history.sqlite") as saved:
+        (row,) = saved.rows()
+    assert row.image is None
+    assert row.batch_id == "batch1"
+
+
+def test_save_history_failure_only_warns(capsys):
+    executor = Mock()
+    executor.image_id.return_value = "sha256:abc"
+    history = Mock()
+    history.add.side_effect = sqlite3.OperationalError("database is locked")
+
+    _save_history(
+        history, make_context(executor), FeatureCounter(executor), make_recorder()
+    )
+
+    history.close.assert_called_once()
+    assert "database is locked" in capsys.readouterr().err
+
+
+@pytest.fixture()
+def run_mocks(mocker, tmp_path):
+    """コンテナを起動せずに_runを実行するためのコンテキストと書き出し"""
+    context = MagicMock()
+    context.setting.output_mode = OutputMode.COPY
+    context.setting.local_batch_output_path = tmp_path
+    context.setting.scratch = None
+    mocker.patch("qiime_pipeline.main.setup_context", return_value=context)
+    exporter = mocker.patch("qiime_pipeline.main.ArtifactExporter").return_value
+    pipeline = Mock()
+    mocker.patch("qiime_pipeline.main._pipeline_func", return_value=pipeline)
+    args = Namespace(no_history=True, sample_interval=0, profile=[])
+    return args, context, exporter, pipeline
+
+
+def test_run_cleans_up_when_the_pipeline_fails(run_mocks, capsys):
+    args, context, exporter, pipeline = run_mocks
+    pipeline.side_effect = RuntimeError("Command failed")
+    exporter.close.side_effect = Exception("export failed")
+
+    # 後始末のエラーはパイプラインの例外を置き換えない
+    with pytest.raises(RuntimeError, match="Command failed"):
+        _run(args)
+
+    exporter.sync.assert_not_called()
+    exporter.close.assert_called_once()
+    context.executor.stop.assert_called_once()
+    assert "export failed" in capsys.readouterr().err
+
+
+def test_run_stops_the_container_when_export_fails(run_mocks):
+    args, context, exporter, pipeline = run_mocks
+    exporter.close.side_effect = Exception("export failed")
+
+    with pytest.raises(Exception, match="export failed"):
+        _run(args)
+
+    exporter.sync.assert_called_once()
+    context.executor.stop.assert_called_once()
@@ -0,0 +1,120 @@
+import hashlib
+import io
+import tarfile
+from pathlib import Path
+import pytest
+from qiime_pipeline.pipeline.main.exporter import ArtifactExporter, ExportError
+from qiime_pipeline.pipeline.support.events import FINISHED, STARTED, CommandEvent
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+
+CONTENT = {
+    "/workspace/out/table.qza": b"table",
+    "/workspace/out/extra/summary.qzv": b"summary",
+}
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class FakeExecutor:
+    """コンテナ内のfind/sha256sumの結果を返すExecutor"""
+
+    def run(self, command: list[str]) -> str:
+        root = command[1]
+        found = [p for p in CONTENT if p == root or p.startswith(root + "/")]
+        if not found:
+            raise RuntimeError(f"find: {root}: No such file or directory")
+        return "".join(f"{sha256(CONTENT[p])}  {p}\n" for p in found)
+
+
+class FakePopen:
+    """docker cp CONTAINER:PATH - の代わりにtarストリームを返す"""
+
+    calls = []
+
+    def __init__(self, args, stdout, stderr):
+        FakePopen.calls.append(args)
+        path = args[2].split(":", 1)[1]
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            info = tarfile.TarInfo(Path(path).name)
+            info.size = len(CONTENT[path])
+            tar.addfile(info, io.BytesIO(CONTENT[path]))
+        buffer.seek(0)
+        self.stdout = buffer
+        self.stderr = io.BytesIO()
+
+    def wait(self):
+        return 0
+
+
+@pytest.fixture()
+def exporter(tmp_path, mocker):
+    FakePopen.calls = []
+    mocker.patch("qiime_pipeline.pipeline.main.exporter.subprocess.Popen", FakePopen)
+    return ArtifactExporter(
+        FakeExecutor(), "ctn", Path("/workspace/out"), tmp_path / "batch"
+    )
+
+
+def finished(output: str) -> CommandEvent:
+    cmd = Q2Cmd("qiime dada2 denoise-paired").add_output("table", output)
+    return CommandEvent(FINISHED, cmd, 0, 1)
+
+
+def test_exports_outputs_of_finished_commands(exporter, tmp_path):
+    exporter(CommandEvent(STARTED, Q2Cmd("qiime"), 0, 1))
+    exporter(finished("/workspace/out/table.qza"))
+    exporter(finished("/elsewhere/ignored.qza"))
+    exporter.close()
+
+    local = tmp_path / "batch" / "out" / "table.qza"
+    assert local.read_bytes() == b"table"
+    assert exporter.exported == [local]
+    assert len(FakePopen.calls) == 1
+
+
+def test_sync_skips_files_already_on_host(exporter, tmp_path):
+    exporter(finished("/workspace/out/table.qza"))
+    exporter.sync()
+    exporter.close()
+
+    assert (tmp_path / "batch/out/extra/summary.qzv").read_bytes() == b"summary"
+    assert exporter.skipped == [tmp_path / "batch/out/table.qza"]
+    assert len(FakePopen.calls) == 2
+
+
+def test_overwritten_output_is_exported_once(exporter, tmp_path):
+    # 同じパスに出力する2つのコマンドが、前のコマンドの終了より先に開始した場合
+    first, second = (
+        Q2Cmd(f"qiime diversity {name}").add_output("v", "/workspace/out/table.qza")
+        for name in ("first", "second")
+    )
+    exporter(CommandEvent(STARTED, first, 0, 2))
+    exporter(CommandEvent(STARTED, second, 1, 2))
+    exporter(CommandEvent(FINISHED, first, 0, 2))
+    assert FakePopen.calls == []
+
+    exporter(CommandEvent(FINISHED, second, 1, 2))
+    exporter.close()
+
+    assert (tmp_path / "batch/out/table.qza").read_bytes() == b"table"
+    assert len(FakePopen.calls) == 1
+
+
+def test_started_command_waits_for_export_of_its_outputs(exporter):
+    future = exporter.submit("/workspace/out/table.qza")
+    cmd = Q2Cmd("qiime diversity second").add_output("v", "/workspace/out/table.qza")
+
+    exporter(CommandEvent(STARTED, cmd, 1, 2))
+
+    assert future.done()
+    exporter.close()
+
+
+def test_digest_mismatch_is_reported(exporter):
+    exporter.submit("/workspace/out/table.qza", digest=sha256(b"other"))
+
+    with pytest.raises(ExportError):
+        exporter.close()
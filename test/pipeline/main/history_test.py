@@ -0,0 +1,146 @@
+from unittest.mock import Mock
+import pytest
+from qiime_pipeline.pipeline.main.history import (
+    DurationModel,
+    FeatureCounter,
+    HistoryRow,
+    RunHistory,
+    RunInfo,
+)
+from qiime_pipeline.pipeline.main.telemetry import CommandRecord
+from qiime_pipeline.pipeline.support.events import FINISHED, STARTED, CommandEvent
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+
+DENOISE = "qiime dada2 denoise-paired"
+
+
+def record(command: str, wall_time: float, **fields) -> CommandRecord:
+    return CommandRecord(
+        index=0,
+        part="file_import",
+        command=command,
+        start=fields.pop("start", 0.0),
+        end=wall_time,
+        wall_time=wall_time,
+        exit_status=fields.pop("exit_status", 0),
+        **fields,
+    )
+
+
+def row(command: str, wall_time: float, samples: int, **fields) -> HistoryRow:
+    values = dict(
+        batch_id="b",
+        host="h",
+        image="sha256:a",
+        command=command,
+        part=None,
+        parameters={},
+        samples=samples,
+        features=None,
+        input_bytes=0,
+        output_bytes=0,
+        wall_time=wall_time,
+        exit_status=0,
+        start=0.0,
+    )
+    return HistoryRow(**{**values, **fields})
+
+
+def test_history_is_persisted(tmp_path):
+    path = tmp_path / "history.sqlite"
+    run = RunInfo("batch1", "node1", "sha256:abc", samples=12, features=340)
+
+    with RunHistory(path) as history:
+        added = history.add(
+            run,
+            [
+                record(
+                    DENOISE,
+                    120.0,
+                    inputs={"/workspace/out/demux.qza": 2048},
+                    outputs={"/workspace/out/table.qza": 512},
+                    parameters={"trunc-len-f": "280"},
+                ),
+                record("qiime tools import", 10.0, start=-1.0),
+            ],
+        )
+    assert added == 2
+
+    with RunHistory(path) as history:
+        rows = history.rows()
+        assert [r.command for r in rows] == ["qiime tools import", DENOISE]
+        (denoise,) = history.rows(command=DENOISE)
+        assert history.rows(image="sha256:other") == []
+
+    assert denoise == HistoryRow(
+        batch_id="batch1",
+        host="node1",
+        image="sha256:abc",
+        command=DENOISE,
+        part="file_import",
+        parameters={"trunc-len-f": "280"},
+        samples=12,
+        features=340,
+        input_bytes=2048,
+        output_bytes=512,
+        wall_time=120.0,
+        exit_status=0,
+        start=0.0,
+    )
+
+
+def test_duration_model_scales_with_samples():
+    # 実行時間がサンプル数にほぼ比例する履歴
+    rows = [row(DENOISE, 2.0 * n, samples=n) for n in (10, 20, 40, 80, 160, 320)]
+    rows.append(row(DENOISE, 1.0, samples=1000, exit_status=1))
+
+    model = DurationModel.fit(rows)
+
+    assert model.commands == {DENOISE}
+    assert model.predict(DENOISE, samples=640) == pytest.approx(1280, rel=0.05)
+    assert model.predict(DENOISE, samples=10) < model.predict(DENOISE, samples=100)
+
+
+def test_duration_model_with_little_history_uses_the_mean():
+    model = DurationModel.fit(
+        [row(DENOISE, 10.0, samples=10), row(DENOISE, 1000.0, samples=20)]
+    )
+
+    # 2件では傾きを推定せず、対数の平均（幾何平均）を使う
+    assert model.predict(DENOISE, samples=10_000) == pytest.approx(100.0)
+
+
+def test_duration_model_falls_back_for_unknown_commands():
+    model = DurationModel.fit(
+        [row(DENOISE, 30.0, samples=10), row("qiime tools import", 10.0, samples=10)]
+    )
+
+    assert model("qiime taxa barplot") == 20.0
+    assert DurationModel.fit([], default=5.0)(DENOISE) == 5.0
+
+
+def test_duration_model_for_run():
+    model = DurationModel.fit(
+        [row(DENOISE, 2.0 * n, samples=n) for n in (10, 20, 40, 80, 160)]
+    )
+    cost = model.for_run(samples=40)
+
+    assert cost(Q2Cmd(DENOISE)) == pytest.approx(80, rel=0.05)
+
+
+def test_feature_counter_counts_representative_sequences():
+    executor = Mock()
+    executor.run.return_value = "345\n"
+    counter = FeatureCounter(executor)
+    cmd = (
+        Q2Cmd(DENOISE)
+        .add_output("table", "/scratch/table.qza")
+        .add_output("representative-sequences", "/scratch/rep_seqs.qza")
+    )
+
+    counter(CommandEvent(STARTED, cmd, 0, 1))
+    assert counter.features is None
+    counter(CommandEvent(FINISHED, cmd, 0, 1, duration=1.0))
+
+    assert counter.features == 345
+    assert executor.run.call_args.args[0][-1] == "/scratch/rep_seqs.qza"
@@ -0,0 +1,179 @@
+import base64
+import pytest
+from qiime_pipeline.pipeline.main.profiling import (
+    CTN_PROFILE_DIR,
+    CommandProfiler,
+    parse_time_output,
+)
+from qiime_pipeline.pipeline.main.telemetry import TelemetryRecorder, read_telemetry
+from qiime_pipeline.pipeline.support.events import (
+    FAILED,
+    FINISHED,
+    STARTED,
+    CommandEvent,
+)
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+
+TIME_OUTPUT = """\
+Command exited with non-zero status 1
+	Command being timed: "qiime dada2 denoise-paired --p-n-threads 0"
+	User time (seconds): 312.54
+	System time (seconds): 8.10
+	Percent of CPU this job got: 389%
+	Elapsed (wall clock) time (h:mm:ss or m:ss): 1:22.31
+	Maximum resident set size (kbytes): 2048
+	Major (requiring I/O) page faults: 3
+	Minor (reclaiming a frame) page faults: 81234
+	Voluntary context switches: 1500
+	Involuntary context switches: 42
+	File system inputs: 128
+	File system outputs: 256
+	Page size (bytes): 4096
+	Exit status: 1
+"""
+PROF_BYTES = b"\x00\x01marshal"
+
+
+class FakeContainer:
+    """コンテナ内のファイルを辞書で表すexecutor"""
+
+    def __init__(self, binaries=("/usr/bin/time", "/opt/conda/bin/qiime")):
+        self.binaries = set(binaries)
+        self.files: dict[str, bytes] = {}
+        self.calls: list[list[str]] = []
+
+    def run(self, command: list[str]) -> str:
+        self.calls.append(command)
+        match command:
+            case ["sh", "-c", _, "which", name]:
+                if name in self.binaries:
+                    return name
+                return next((b for b in self.binaries if b.endswith(f"/{name}")), "")
+            case ["cat", path]:
+                if path not in self.files:
+                    raise RuntimeError(f"cat: {path}: No such file")
+                return self.files[path].decode().rstrip("\n")
+            case ["base64", path]:
+                return base64.encodebytes(self.files[path]).decode()
+            case ["rm", "-f", *paths]:
+                for path in paths:
+                    self.files.pop(path, None)
+        return ""
+
+    def execute(self, command: list[str]) -> None:
+        """wrapperを付けたコマンドの実行を模し、プロファイルを書き出す"""
+        if command[:2] == ["/usr/bin/time", "-v"]:
+            self.files[command[3]] = TIME_OUTPUT.encode()
+        if "cProfile" in command:
+            self.files[command[command.index("cProfile") + 2]] = PROF_BYTES
+
+
+def make_command() -> Q2Cmd:
+    return (
+        Q2Cmd("qiime dada2 denoise-paired")
+        .add_input("demultiplexed-seqs", "/workspace/out/demux.qza")
+        .add_parameter("n-threads", 0)
+    )
+
+
+def test_parse_time_output():
+    metrics = parse_time_output(TIME_OUTPUT)
+
+    assert metrics["user_seconds"] == 312.54
+    assert metrics["system_seconds"] == 8.10
+    assert metrics["cpu_percent"] == 389
+    assert metrics["elapsed_seconds"] == pytest.approx(82.31)
+    assert metrics["max_rss_bytes"] == 2048 * 1024
+    assert metrics["minor_page_faults"] == 81234
+    assert metrics["involuntary_context_switches"] == 42
+    assert metrics["fs_outputs"] == 256
+    assert metrics["exit_status"] == 1
+    assert "page_size" not in metrics
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        ("dada2 *", True),
+        ("qiime dada2 denoise-paired", True),
+        ("*denoise*", True),
+        ("diversity *", False),
+    ],
+)
+def test_matches(tmp_path, pattern, expected):
+    profiler = CommandProfiler(FakeContainer(), [pattern], tmp_path)
+    assert profiler.matches(make_command()) is expected
+
+
+def test_profiled_command_is_wrapped_and_collected(tmp_path):
+    container = FakeContainer()
+    profiler = CommandProfiler(container, ["dada2 *"], tmp_path, python=True)
+    cmd = make_command()
+
+    assert profiler.start(cmd, 3)
+    command = cmd.build()
+    stem = f"{CTN_PROFILE_DIR}/003-dada2-denoise-paired"
+    assert command[:4] == ["/usr/bin/time", "-v", "-o", f"{stem}.time.txt"]
+    assert command[4:10] == [
+        "python",
+        "-m",
+        "cProfile",
+        "-o",
+        f"{stem}.prof",
+        "/opt/conda/bin/qiime",
+    ]
+    assert command[10:12] == ["dada2", "denoise-paired"]
+    container.execute(command)
+
+    profile = profiler.stop(CommandEvent(FINISHED, cmd, 3, 5, duration=82.0))
+
+    assert cmd.build()[0] == "qiime"
+    assert profile["metrics"]["max_rss_bytes"] == 2048 * 1024
+    assert profile["files"] == [
+        "profiles/003-dada2-denoise-paired.time.txt",
+        "profiles/003-dada2-denoise-paired.prof",
+    ]
+    assert (tmp_path / profile["files"][1]).read_bytes() == PROF_BYTES
+    assert "User time (seconds): 312.54" in (tmp_path / profile["files"][0]).read_text()
+    # コンテナ内の一時ファイルは削除する
+    assert container.files == {}
+
+
+def test_unmatched_command_is_not_wrapped(tmp_path):
+    container = FakeContainer()
+    profiler = CommandProfiler(container, ["diversity *"], tmp_path)
+    cmd = make_command()
+
+    assert not profiler.start(cmd, 0)
+    assert cmd.build()[0] == "qiime"
+    assert profiler.stop(CommandEvent(FINISHED, cmd, 0, 1, duration=1.0)) is None
+    assert container.calls == []
+
+
+def test_missing_time_binary_disables_profiling(tmp_path, capsys):
+    container = FakeContainer(binaries=())
+    profiler = CommandProfiler(container, ["dada2 *"], tmp_path)
+    cmd = make_command()
+
+    assert not profiler.start(cmd, 0)
+    assert not profiler.start(make_command(), 1)
+    assert cmd.build()[0] == "qiime"
+    assert capsys.readouterr().err.count("not found") == 1
+
+
+def test_recorder_stores_profile(tmp_path):
+    container = FakeContainer()
+    profiler = CommandProfiler(container, ["dada2 *"], tmp_path)
+    recorder = TelemetryRecorder(
+        container, tmp_path / "telemetry.jsonl", profiler=profiler
+    )
+    cmd = make_command()
+    error = RuntimeError("Command failed")
+
+    recorder(CommandEvent(STARTED, cmd, 0, 1, timestamp=10.0))
+    container.execute(cmd.build())
+    recorder(CommandEvent(FAILED, cmd, 0, 1, timestamp=92.0, error=error))
+
+    (record,) = read_telemetry(tmp_path / "telemetry.jsonl")
+    assert record.profile["metrics"]["exit_status"] == 1
+    assert record.profile["files"] == ["profiles/000-dada2-denoise-paired.time.txt"]
@@ -0,0 +1,77 @@
+from unittest.mock import Mock
+import pytest
+from qiime_pipeline.pipeline.main.resources import CgroupSample, ResourceSampler
+from qiime_pipeline.pipeline.main.telemetry import TelemetryRecorder
+from qiime_pipeline.pipeline.support.events import FINISHED, STARTED, CommandEvent
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+
+
+def cgroup_output(cpu_usec, memory, rss, io_read, io_write, peak=None) -> str:
+    lines = [
+        f"cpu_usec {cpu_usec}",
+        f"memory {memory}",
+        f"rss {rss}",
+        f"io_read {io_read}",
+        f"io_write {io_write}",
+    ]
+    if peak is not None:
+        lines.append(f"memory_peak {peak}")
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture()
+def clock(mocker):
+    times = iter([10.0, 12.0, 14.0])
+    return mocker.patch(
+        "qiime_pipeline.pipeline.main.resources.time.monotonic",
+        side_effect=lambda: next(times),
+    )
+
+
+@pytest.fixture()
+def sampler(clock):
+    executor = Mock()
+    executor.run.side_effect = [
+        cgroup_output(1_000_000, 500, 100, 0, 0, peak=600),
+        cgroup_output(5_000_000, 900, 700, 4096, 0, peak=900),
+        cgroup_output(6_000_000, 800, 300, 8192, 1024, peak=2000),
+    ]
+    sampler = ResourceSampler(executor, interval=60)
+    yield sampler
+    sampler.close()
+
+
+def test_parse_falls_back_to_memory_for_rss():
+    sample = CgroupSample.parse("cpu_usec 10\nmemory 2048\n", at=1.0)
+
+    assert sample.rss == 2048
+    assert sample.memory_peak is None
+
+
+def test_usage_between_start_and_stop(sampler):
+    sampler.start(0)
+    usage = sampler.stop(0)
+
+    assert usage.samples == 2
+    assert usage.cpu_seconds == pytest.approx(4.0)
+    assert usage.cpu_avg == pytest.approx(2.0)
+    assert usage.rss_peak == 700
+    assert usage.rss_avg == 400
+    assert usage.memory_peak == 900
+    assert usage.io_read_bytes == 4096
+    assert sampler.stop(0) is None
+
+
+def test_recorder_stores_resource_usage(sampler, tmp_path):
+    executor = Mock()
+    executor.run.return_value = ""
+    recorder = TelemetryRecorder(executor, tmp_path / "telemetry.jsonl", sampler)
+    cmd = Q2Cmd("qiime feature-classifier classify-sklearn")
+
+    recorder(CommandEvent(STARTED, cmd, 0, 1))
+    recorder(CommandEvent(FINISHED, cmd, 0, 1, duration=4.0))
+
+    resources = recorder.records[0].resources
+    assert resources["cpu_seconds"] == pytest.approx(4.0)
+    assert resources["rss_peak"] == 700
+    assert "700 B" in recorder.summary()
@@ -1,4 +1,15 @@
-from qiime_pipeline.pipeline.main.setup import setup_datasets
+import gzip
+import pytest
+import tomlkit
+from argparse import Namespace
+from pathlib import Path
+from qiime_pipeline.data.control import FastqIntegrityError
+from qiime_pipeline.data.store import Datasets, PairPath, Region
+from qiime_pipeline.pipeline.main.setup import (
+    REGIONS_FILE_NAME,
+    setup_datasets,
+    setup_mounts,
+)
 
 
 def test_setup_datasets(namespace):
@@ -11,3 +22,74 @@ def test_setup_datasets(namespace):
         assert datasets.fastq_folder.exists()
         assert datasets.metadata_path.exists()
         assert datasets.region is not None
+
+
+def make_namespace(tmp_path: Path, truncated: bool = False, **fields) -> Namespace:
+    fastq_folder = tmp_path / "fastq"
+    fastq_folder.mkdir()
+    body = gzip.compress(b"".join(b"@r%d\nACGT\n+\nIIII\n" % i for i in range(100)))
+    (fastq_folder / "s1_R1.fastq.gz").write_bytes(body[:-20] if truncated else body)
+    (fastq_folder / "s1_R2.fastq.gz").write_bytes(body)
+    metadata = tmp_path / "metadata.csv"
+    metadata.write_text("sample-id,Host\ns1,dog\n")
+    values = dict(
+        data=[(metadata, fastq_folder)],
+        dataset_region="V3V4",
+        auto_truncation=False,
+        quality_sample_size=10,
+        local_output=tmp_path / "output",
+    )
+    return Namespace(**{**values, **fields})
+
+
+@pytest.mark.parametrize(
+    "dataset_region,auto_truncation", [("auto", False), ("V3V4", True)]
+)
+def test_setup_datasets_checks_fastq_before_reading(
+    tmp_path, dataset_region, auto_truncation
+):
+    namespace = make_namespace(
+        tmp_path,
+        truncated=True,
+        dataset_region=dataset_region,
+        auto_truncation=auto_truncation,
+    )
+
+    # gzipのEOFErrorではなく、検査結果をまとめた例外になる
+    with pytest.raises(FastqIntegrityError, match="s1_R1"):
+        setup_datasets(namespace)
+
+
+def test_setup_datasets_writes_proposed_regions(tmp_path, mocker, capsys):
+    proposed = Region("V3V4", 17, 21, 250, 200)
+    mocker.patch(
+        "qiime_pipeline.pipeline.main.setup.propose_region", return_value=proposed
+    )
+
+    datasets = setup_datasets(make_namespace(tmp_path, auto_truncation=True))
+
+    assert datasets.sets.pop().region == proposed
+    doc = tomlkit.parse((tmp_path / "output" / REGIONS_FILE_NAME).read_text())
+    assert Region.from_toml(doc["fastq"]) == proposed
+    assert capsys.readouterr().out == ""
+
+
+def test_setup_mounts_binds_output_read_write(tmp_path):
+    def pair(name: str) -> PairPath:
+        return PairPath(local_pos=tmp_path / name, ctn_pos=Path("/workspace") / name)
+
+    output = PairPath(
+        local_pos=tmp_path / "out" / "batch" / "out", ctn_pos=Path("/workspace/out")
+    )
+    mounts = setup_mounts(
+        metafile_pairpath=pair("metadata.tsv"),
+        manifest_pairpath=pair("manifest.tsv"),
+        db_pairpath=pair("classifier.qza"),
+        ctn_workspace_dir=Path("/workspace"),
+        datasets=Datasets(sets=set()),
+        output_pairpath=output,
+    )
+
+    assert output.local_pos.is_dir()
+    assert mounts[-1] == output.to_mount_option(readonly=False)
+    assert all(mount[-1].endswith(",readonly") for mount in mounts[:-1])
@@ -0,0 +1,168 @@
+import pytest
+from qiime_pipeline.pipeline.main.simulation import (
+    CostModel,
+    FailureRule,
+    SimulatedExecutor,
+    base_command,
+    output_paths,
+    simulate_schedule,
+)
+from qiime_pipeline.pipeline.main.telemetry import CommandRecord, exit_status
+from qiime_pipeline.pipeline.support.qiime_command import Q2CmdAssembly
+
+DENOISE = [
+    "qiime",
+    "dada2",
+    "denoise-paired",
+    "--i-demultiplexed-seqs",
+    "/workspace/out/demux.qza",
+    "--p-n-threads",
+    "0",
+    "--o-table",
+    "/workspace/out/table.qza",
+    "--o-representative-sequences",
+    "/workspace/out/rep_seqs.qza",
+]
+
+
+def record(command: str, wall_time: float, exit_status: int = 0) -> CommandRecord:
+    return CommandRecord(
+        index=0,
+        part=None,
+        command=command,
+        start=0.0,
+        end=wall_time,
+        wall_time=wall_time,
+        exit_status=exit_status,
+    )
+
+
+def test_base_command_and_output_paths():
+    assert base_command(DENOISE) == "qiime dada2 denoise-paired"
+    assert output_paths(DENOISE) == [
+        "/workspace/out/table.qza",
+        "/workspace/out/rep_seqs.qza",
+    ]
+    assert output_paths(
+        ["qiime", "tools", "import", "--output-path", "/scratch/demux.qza"]
+    ) == ["/scratch/demux.qza"]
+
+
+def test_executor_creates_placeholders(tmp_path):
+    executor = SimulatedExecutor(
+        tmp_path, CostModel({"qiime dada2 denoise-paired": 30})
+    )
+
+    assert executor.run(DENOISE) == ""
+
+    assert (tmp_path / "workspace/out/table.qza").is_file()
+    assert (tmp_path / "workspace/out/rep_seqs.qza").is_file()
+    assert executor.work == 30
+    assert executor.calls[0].command == "qiime dada2 denoise-paired"
+
+
+def test_executor_handles_host_commands(tmp_path):
+    executor = SimulatedExecutor(tmp_path)
+    executor.run(DENOISE)
+
+    executor.run(["mkdir", "-p", "/workspace/out/archive"])
+    executor.run(["mv", "/workspace/out/table.qza", "/workspace/out/archive/table.qza"])
+    executor.run(["rm", "-rf", "/workspace/out/rep_seqs.qza"])
+    assert executor.run(["sh", "-c", 'du -sb -- "$@"', "du", "/x"]) == ""
+
+    assert (tmp_path / "workspace/out/archive/table.qza").is_file()
+    assert not (tmp_path / "workspace/out/table.qza").exists()
+    assert not (tmp_path / "workspace/out/rep_seqs.qza").exists()
+
+
+def test_executor_injects_failures(tmp_path):
+    executor = SimulatedExecutor(
+        tmp_path, failures=[FailureRule("qiime dada2 *", return_code=137)]
+    )
+
+    with pytest.raises(RuntimeError, match="denoise-paired") as excinfo:
+        executor.run(DENOISE)
+
+    assert exit_status(excinfo.value) == 137
+    assert executor.calls[0].failed
+    assert not (tmp_path / "workspace/out/table.qza").exists()
+
+
+def test_failure_probability_is_reproducible(tmp_path):
+    def failures(seed):
+        executor = SimulatedExecutor(
+            tmp_path, failures=[FailureRule("qiime *", 0.5)], seed=seed
+        )
+        for _ in range(20):
+            try:
+                executor.run(DENOISE)
+            except RuntimeError:
+                pass
+        return [call.failed for call in executor.calls]
+
+    assert failures(1) == failures(1)
+    assert 0 < sum(failures(1)) < 20
+
+
+def test_stopped_executor_rejects_commands(tmp_path):
+    executor = SimulatedExecutor(tmp_path)
+    executor.stop()
+
+    with pytest.raises(RuntimeError):
+        executor.run(DENOISE)
+
+
+def test_cost_model_is_fitted_from_telemetry(tmp_path):
+    path = tmp_path / "telemetry.jsonl"
+    path.write_text(
+        "".join(
+            r.to_json() + "\n"
+            for r in [
+                record("qiime dada2 denoise-paired", 100),
+                record("qiime dada2 denoise-paired", 300),
+                record("qiime dada2 denoise-paired", 5, exit_status=1),
+                record("qiime tools import", 10),
+            ]
+        )
+    )
+
+    model = CostModel.from_telemetry(path)
+
+    assert model("qiime dada2 denoise-paired") == 200
+    assert model("qiime tools import") == 10
+    assert model("qiime taxa barplot") == 100
+    assert CostModel.fit([], default=3)("qiime tools import") == 3
+
+
+def test_simulate_schedule():
+    # a -> (b, c) -> d
+    assembly = Q2CmdAssembly()
+    assembly.new_cmd("qiime a").add_output("x", "x.qza")
+    assembly.new_cmd("qiime b").add_input("x", "x.qza").add_output("b", "b.qza")
+    assembly.new_cmd("qiime c").add_input("x", "x.qza").add_output("c", "c.qza")
+    assembly.new_cmd("qiime d").add_input("b", "b.qza").add_input("c", "c.qza")
+    model = CostModel({"qiime a": 1, "qiime b": 2, "qiime c": 4, "qiime d": 1})
+
+    sequential = simulate_schedule(assembly, model, workers=1)
+    parallel = simulate_schedule(assembly, model, workers=2)
+
+    assert sequential.makespan == sequential.work == 8
+    assert parallel.starts == [0, 1, 1, 5]
+    assert parallel.makespan == 6
+    assert parallel.utilization == pytest.approx(8 / 12)
+
+
+def test_simulate_schedule_with_priority():
+    # 順番の早い短いコマンドを先に実行すると、長い連鎖の開始が遅れる
+    assembly = Q2CmdAssembly()
+    assembly.new_cmd("qiime short1").add_output("a", "a.qza")
+    assembly.new_cmd("qiime short2").add_output("b", "b.qza")
+    assembly.new_cmd("qiime long").add_output("c", "c.qza")
+    assembly.new_cmd("qiime tail").add_input("c", "c.qza")
+    model = CostModel({"qiime long": 5, "qiime tail": 5}, default=3)
+
+    fifo = simulate_schedule(assembly, model, workers=2)
+    critical = simulate_schedule(assembly, model, workers=2, priority=model)
+
+    assert fifo.makespan == 13
+    assert critical.makespan == 10
@@ -0,0 +1,83 @@
+from unittest.mock import Mock
+import pytest
+from qiime_pipeline.pipeline.main.telemetry import (
+    TelemetryRecorder,
+    exit_status,
+    format_bytes,
+    read_telemetry,
+)
+from qiime_pipeline.pipeline.support.events import (
+    FAILED,
+    FINISHED,
+    STARTED,
+    CommandEvent,
+)
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+
+
+def make_command() -> Q2Cmd:
+    cmd = (
+        Q2Cmd("qiime feature-table summarize")
+        .add_input("table", "/workspace/out/table.qza")
+        .add_output("visualization", "/workspace/out/summary.qzv")
+    )
+    cmd.origin = "filtering"
+    return cmd
+
+
+@pytest.fixture()
+def executor():
+    executor = Mock()
+    executor.run.return_value = (
+        "2048\t/workspace/out/table.qza\n512\t/workspace/out/summary.qzv\n"
+    )
+    return executor
+
+
+def test_records_are_written_as_json_lines(executor, tmp_path):
+    path = tmp_path / "batch" / "telemetry.jsonl"
+    recorder = TelemetryRecorder(executor, path)
+    cmd = make_command()
+
+    recorder(CommandEvent(STARTED, cmd, 0, 1, timestamp=100.0))
+    recorder(CommandEvent(FINISHED, cmd, 0, 1, timestamp=103.5, duration=3.5))
+
+    (record,) = read_telemetry(path)
+    assert record == recorder.records[0]
+    assert record.part == "filtering"
+    assert record.command == "qiime feature-table summarize"
+    assert (record.start, record.end, record.wall_time) == (100.0, 103.5, 3.5)
+    assert record.exit_status == 0
+    assert record.inputs == {"/workspace/out/table.qza": 2048}
+    assert record.outputs == {"/workspace/out/summary.qzv": 512}
+
+    summary = recorder.summary()
+    assert "filtering" in summary
+    assert "feature-table summarize" in summary
+    assert "2.0 KiB" in summary
+
+
+def test_failed_command_records_exit_status(executor, tmp_path):
+    recorder = TelemetryRecorder(executor, tmp_path / "telemetry.jsonl")
+    cause = Exception("docker exec failed")
+    cause.return_code = 137
+    error = RuntimeError("Command failed")
+    error.__cause__ = cause
+
+    recorder(CommandEvent(FAILED, make_command(), 0, 1, duration=1.0, error=error))
+
+    assert recorder.records[0].exit_status == 137
+    assert recorder.records[0].error == "Command failed"
+    assert "exit 137" in recorder.summary()
+
+
+@pytest.mark.parametrize("error,expected", [(None, 0), (RuntimeError("no cause"), 1)])
+def test_exit_status(error, expected):
+    assert exit_status(error) == expected
+
+
+@pytest.mark.parametrize(
+    "size,expected", [(10, "10 B"), (1536, "1.5 KiB"), (3 << 30, "3.0 GiB")]
+)
+def test_format_bytes(size, expected):
+    assert format_bytes(size) == expected
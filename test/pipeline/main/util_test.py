@@ -0,0 +1,19 @@
+from pathlib import Path
+from types import SimpleNamespace
+from qiime_pipeline.data.store import OutputMode
+from qiime_pipeline.pipeline.main.util import copy_from_container
+
+
+def test_copy_from_container_is_noop_for_bind_mounted_output(tmp_path, mocker):
+    copy = mocker.patch("qiime_pipeline.pipeline.main.util.python_on_whales")
+    setting = SimpleNamespace(
+        local_batch_output_path=tmp_path / "batch",
+        ctn_output_path=Path("/workspace/out"),
+        output_mode=OutputMode.BIND,
+    )
+    context = SimpleNamespace(setting=setting)
+
+    local = copy_from_container(context, Path("/workspace/out"))
+
+    assert local == tmp_path / "batch" / "out"
+    copy.docker.copy.assert_not_called()
@@ -0,0 +1,76 @@
+from pathlib import Path
+import pytest
+from qiime_pipeline.data.store import PairPath
+from qiime_pipeline.pipeline.support.container_pool import (
+    ContainerPool,
+    PoolExhaustedError,
+)
+from qiime_pipeline.pipeline.support.executor import Executor
+
+
+@pytest.fixture()
+def mock_docker(mocker):
+    docker = mocker.patch("qiime_pipeline.pipeline.support.container_pool.docker")
+    docker.container.exists.return_value = False
+    return docker
+
+
+@pytest.fixture()
+def mock_provider(mocker):
+    provider = mocker.patch("qiime_pipeline.pipeline.support.container_pool.Provider")
+    provider.return_value.provide.side_effect = lambda: mocker.MagicMock()
+    return provider
+
+
+@pytest.fixture()
+def pool(tmp_path, mock_docker, mock_provider) -> ContainerPool:
+    return ContainerPool(
+        image="quay.io/qiime2/amplicon:2024.10",
+        size=2,
+        database=PairPath(tmp_path / "classifier.qza", Path("/db/classifier.qza")),
+        workspace=Path("/workspace"),
+        state_dir=tmp_path / "pool",
+    )
+
+
+def test_acquire_hands_out_each_slot_once(pool, mock_provider):
+    first = pool.acquire(timeout=0)
+    second = pool.acquire(timeout=0)
+
+    assert first.container is not second.container
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire(timeout=0)
+
+    # データベースのみをマウントし、停止しても削除しないコンテナを作る
+    kwargs = mock_provider.call_args.kwargs
+    assert kwargs["remove"] is False
+    assert kwargs["mounts"] == [pool.database.to_mount_option(readonly=True)]
+
+    first.release()
+    third = pool.acquire(timeout=0)
+    assert not third.released
+
+
+def test_executor_stop_returns_container_to_pool(pool):
+    lease = pool.acquire(timeout=0)
+    executor = Executor(lease.container, on_stop=lease.release)
+
+    executor.stop()
+
+    assert lease.released
+    lease.container.stop.assert_not_called()
+    lease.container.execute.assert_called_with(
+        ["find", "/workspace", "-mindepth", "1", "-delete"]
+    )
+
+
+def test_stage_copies_files_into_container(pool, mock_docker, tmp_path):
+    lease = pool.acquire(timeout=0)
+    manifest = PairPath(tmp_path / "manifest.tsv", Path("/workspace/manifest.tsv"))
+
+    lease.stage([manifest])
+
+    mock_docker.copy.assert_called_once_with(
+        source=str(manifest.local_resolved),
+        destination=(lease.container.name, "/workspace/manifest.tsv"),
+    )
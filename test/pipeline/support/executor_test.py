@@ -1,6 +1,14 @@
 from pathlib import Path
+from types import SimpleNamespace
 import pytest
-from qiime_pipeline.pipeline.support.executor import Executor, Provider
+from qiime_pipeline.pipeline.support.executor import (
+    Executor,
+    Provider,
+    PullPolicy,
+    dockerfile_fingerprint,
+    plugin_cache_mount,
+    resolve_image,
+)
 from python_on_whales import Container
 
 
@@ -65,3 +73,87 @@ def test_command_execution(
 def test_command_execution_when_command_is_failed(shared_container):
     with Executor(shared_container) as executor:
         pytest.raises(RuntimeError, executor.run, ["NonExistingCmd"])
+
+
+@pytest.fixture()
+def mock_docker(mocker):
+    return mocker.patch("qiime_pipeline.pipeline.support.executor.docker")
+
+
+@pytest.mark.parametrize(
+    "policy, exists, pulled",
+    [
+        (PullPolicy.ALWAYS, True, True),
+        (PullPolicy.IF_NOT_PRESENT, True, False),
+        (PullPolicy.IF_NOT_PRESENT, False, True),
+        ("never", True, False),
+    ],
+)
+def test_resolve_image_follows_pull_policy(mock_docker, policy, exists, pulled):
+    mock_docker.image.exists.return_value = exists
+
+    image = resolve_image("quay.io/qiime2/amplicon:2024.10", policy)
+
+    assert mock_docker.image.pull.called is pulled
+    if pulled:
+        assert image is mock_docker.image.pull.return_value
+    else:
+        assert image is mock_docker.image.inspect.return_value
+
+
+def test_resolve_image_never_pulls_missing_image(mock_docker):
+    mock_docker.image.exists.return_value = False
+
+    with pytest.raises(RuntimeError):
+        resolve_image("quay.io/qiime2/amplicon:2024.10", PullPolicy.NEVER)
+    mock_docker.image.pull.assert_not_called()
+
+
+def test_dockerfile_fingerprint_tracks_context_content(tmp_path):
+    dockerfile = tmp_path / "Dockerfile"
+    dockerfile.write_text("FROM alpine\nCOPY env.yml /env.yml\n")
+    (tmp_path / "env.yml").write_text("a")
+    (tmp_path / ".dockerignore").write_text("out\n*.log\n")
+    (tmp_path / "out").mkdir()
+
+    first = dockerfile_fingerprint(dockerfile)
+
+    # 除外されたファイルは影響しない
+    (tmp_path / "out" / "result.qza").write_text("x")
+    (tmp_path / "build.log").write_text("x")
+    assert dockerfile_fingerprint(dockerfile) == first
+
+    (tmp_path / "env.yml").write_text("b")
+    assert dockerfile_fingerprint(dockerfile) != first
+
+
+def test_from_dockerfile_reuses_tagged_image(tmp_path, mock_docker):
+    dockerfile = tmp_path / "Dockerfile"
+    dockerfile.write_text("FROM alpine")
+    mock_docker.image.exists.return_value = True
+
+    Provider.from_dockerfile(dockerfile)
+
+    mock_docker.image.build.assert_not_called()
+    tag = mock_docker.image.inspect.call_args.args[0]
+    assert tag.endswith(dockerfile_fingerprint(dockerfile)[:16])
+
+
+@pytest.mark.parametrize(
+    "env, expected_dst",
+    [
+        (["MAMBA_ROOT_PREFIX=/opt/conda"], "/opt/conda/var/q2cli/cache"),
+        (["CONDA_PREFIX=/opt/env", "PATH=/bin"], "/opt/env/var/q2cli/cache"),
+        (None, "/opt/conda/var/q2cli/cache"),
+    ],
+)
+def test_plugin_cache_mount_is_keyed_by_image(env, expected_dst):
+    image = SimpleNamespace(
+        id="sha256:0123456789abcdef0123", config=SimpleNamespace(env=env)
+    )
+
+    assert plugin_cache_mount(image) == [
+        "type=volume",
+        "src=qiime-pipeline-q2cli-cache-0123456789ab",
+        f"dst={expected_dst}",
+    ]
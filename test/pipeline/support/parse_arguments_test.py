@@ -1,6 +1,12 @@
 import pytest
 from pathlib import Path
-from qiime_pipeline.pipeline.support.parse_arguments import parse_pair
+import argparse
+from qiime_pipeline.pipeline.support.parse_arguments import (
+    parse_pair,
+    parse_size,
+    parse_sample_interval,
+    parse_workers,
+)
 
 
 @pytest.mark.parametrize(
@@ -28,3 +34,38 @@ def test_parse_pair_invalid_format():
 
     with pytest.raises(ValueError, match="Invalid pair format: :fastq_folder"):
         parse_pair(":fastq_folder")
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [("1024", 1024), ("512m", 512 << 20), ("8G", 8 << 30), ("1.5gb", 3 << 29)],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+@pytest.mark.parametrize("size", ["", "abc", "0", "-1g"])
+def test_parse_size_invalid(size):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_size(size)
+
+
+def test_parse_workers():
+    assert parse_workers("4") == 4
+
+
+@pytest.mark.parametrize("workers", ["0", "-2", "two"])
+def test_parse_workers_invalid(workers):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_workers(workers)
+
+
+@pytest.mark.parametrize("interval,expected", [("2.5", 2.5), ("0", 0.0)])
+def test_parse_sample_interval(interval, expected):
+    assert parse_sample_interval(interval) == expected
+
+
+@pytest.mark.parametrize("interval", ["-1", "nan", "often"])
+def test_parse_sample_interval_invalid(interval):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_sample_interval(interval)
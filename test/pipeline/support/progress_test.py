@@ -0,0 +1,53 @@
+import io
+from qiime_pipeline.pipeline.support.events import FINISHED, STARTED, CommandEvent
+from qiime_pipeline.pipeline.support.progress import ProgressReporter, format_duration
+from qiime_pipeline.pipeline.support.qiime_command import Q2CmdAssembly
+
+COSTS = {"qiime a": 60, "qiime b": 600, "qiime c": 120}
+
+
+def make_assembly() -> Q2CmdAssembly:
+    # a -> b, a -> c
+    assembly = Q2CmdAssembly()
+    assembly.new_cmd("qiime a").add_output("x", "x.qza")
+    assembly.new_cmd("qiime b").add_input("x", "x.qza").add_output("y", "y.qza")
+    assembly.new_cmd("qiime c").add_input("x", "x.qza").add_output("z", "z.qza")
+    return assembly
+
+
+def test_format_duration():
+    assert format_duration(0) == "0:00:00"
+    assert format_duration(3725.4) == "1:02:05"
+
+
+def test_progress_reports_eta():
+    assembly = make_assembly()
+    a, b, c = assembly.commands
+    now = [0.0]
+    stream = io.StringIO()
+    progress = ProgressReporter(
+        assembly,
+        lambda cmd: COSTS[str(cmd)],
+        workers=2,
+        stream=stream,
+        clock=lambda: now[0],
+    )
+
+    # 最長経路 a -> b が作業量/ワーカー数 (780 / 2) より長い
+    assert progress.eta() == 660
+
+    progress(CommandEvent(STARTED, a, 0, 3))
+    now[0] = 30.0
+    assert progress.eta() == 630
+
+    now[0] = 60.0
+    progress(CommandEvent(FINISHED, a, 0, 3, duration=60.0))
+    progress(CommandEvent(STARTED, b, 1, 3))
+    progress(CommandEvent(STARTED, c, 2, 3))
+    now[0] = 160.0
+    assert progress.eta() == 500
+    assert progress.fraction == 60 / 780
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "[0/3]   0% ETA 0:11:00  started a (~0:01:00)"
+    assert lines[1] == "[1/3]   8% ETA 0:10:00  finished a (0:01:00)"
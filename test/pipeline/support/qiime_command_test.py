@@ -227,3 +227,68 @@ def test_build_all():
         ["qiime", "cmd1", "--i-in", "input1.qza", "--o-out", "output1.qza"],
         ["qiime", "cmd2", "--i-in", "output1.qza", "--o-out", "output2.qza"],
     ]
+
+
+def test_dependencies():
+    assembly = Q2CmdAssembly()
+    assembly.new_cmd("qiime a").add_output("x", "x.qza")
+    assembly.new_cmd("qiime b").add_input("x", "x.qza").add_output("y", "y.qza")
+    assembly.new_cmd("qiime c").add_input("x", "x.qza").add_output("z", "z.qza")
+    (
+        assembly.new_cmd("qiime d")
+        .add_input("y", "y.qza")
+        .add_metadata("metadata-file", "z.qza")
+        .add_output("w", "w.qza")
+    )
+
+    assert assembly.dependencies() == [set(), {0}, {0}, {1, 2}]
+
+
+def test_dependencies_of_commands_writing_the_same_output():
+    assembly = Q2CmdAssembly()
+    assembly.new_cmd("qiime a").add_output("x", "x.qza")
+    assembly.new_cmd("qiime b").add_input("x", "x.qza").add_output("v", "v.qzv")
+    assembly.new_cmd("qiime c").add_input("x", "x.qza").add_output("v", "v.qzv")
+    assembly.new_cmd("qiime d").add_input("v", "v.qzv").add_output("w", "w.qza")
+    assembly.new_cmd("qiime e").add_input("x", "x.qza").add_output("v", "v.qzv")
+
+    # 同じ出力を書くコマンドは前に書いたコマンドと、その後に読んだコマンドを待つ
+    assert assembly.dependencies() == [set(), {0}, {0, 1}, {2}, {0, 2, 3}]
+    assert assembly.critical_path(lambda cmd: 1.0) == [5.0, 4.0, 3.0, 2.0, 1.0]
+
+
+def test_get_parameters():
+    cmd = (
+        Q2CmdAssembly()
+        .new_cmd("qiime dada2 denoise-paired")
+        .add_input("demultiplexed-seqs", "demux.qza")
+        .add_parameter("trunc-len-f", 280)
+        .add_parameter("n-threads", 0)
+    )
+
+    assert cmd.get_parameters() == {"trunc-len-f": "280", "n-threads": "0"}
+
+
+def test_build_with_wrapper():
+    cmd = Q2CmdAssembly().new_cmd("qiime tools import").add_input("data", "in.qza")
+    cmd.wrapper = lambda command: ["/usr/bin/time", "-v", *command]
+
+    assert cmd.build()[:3] == ["/usr/bin/time", "-v", "qiime"]
+    assert cmd.build()[-2:] == ["--i-data", "in.qza"]
+    assert str(cmd) == "qiime tools import"
+
+    cmd.wrapper = None
+    assert cmd.build()[0] == "qiime"
+
+
+def test_critical_path_and_priorities():
+    # short -> end, long -> end
+    assembly = Q2CmdAssembly()
+    assembly.new_cmd("qiime short").add_output("s", "s.qza")
+    assembly.new_cmd("qiime long").add_output("l", "l.qza")
+    assembly.new_cmd("qiime end").add_input("s", "s.qza").add_input("l", "l.qza")
+    costs = {"qiime short": 1, "qiime long": 5, "qiime end": 2}
+
+    assert assembly.critical_path(lambda cmd: costs[str(cmd)]) == [3, 7, 2]
+    assert assembly.priorities() == [(0, 0), (0, 1), (0, 2)]
+    assert sorted(assembly.priorities(lambda cmd: costs[str(cmd)]))[0] == (-7, 1)
@@ -0,0 +1,72 @@
+from pathlib import Path
+from unittest.mock import Mock, call
+from qiime_pipeline.pipeline.support.events import FINISHED, STARTED, CommandEvent
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+from qiime_pipeline.pipeline.support.reaper import ArtifactReaper
+
+
+def make_commands() -> list[Q2Cmd]:
+    denoise = Q2Cmd("qiime dada2 denoise-paired").add_output("table", "/s/table.qza")
+    summarize = (
+        Q2Cmd("qiime feature-table summarize")
+        .add_input("table", "/s/table.qza")
+        .add_output("visualization", "/out/summary.qzv")
+    )
+    barplot = (
+        Q2Cmd("qiime taxa barplot")
+        .add_input("table", "/s/table.qza")
+        .add_metadata("metadata-file", "/s/taxonomy.qza")
+        .add_output("visualization", "/out/barplot.qzv")
+    )
+    return [denoise, summarize, barplot]
+
+
+def finished(cmd: Q2Cmd) -> CommandEvent:
+    return CommandEvent(FINISHED, cmd, 0, 1)
+
+
+def test_reaps_after_last_consumer_finishes():
+    executor = Mock()
+    denoise, summarize, barplot = make_commands()
+    reaper = ArtifactReaper(
+        executor, [denoise, summarize, barplot], candidates=["/s/table.qza"]
+    )
+    assert reaper.remaining == {"/s/table.qza": 2}
+
+    reaper(CommandEvent(STARTED, summarize, 1, 3))
+    reaper(finished(summarize))
+    executor.run.assert_not_called()
+
+    reaper(finished(barplot))
+    executor.run.assert_called_once_with(["rm", "-rf", "/s/table.qza"])
+    assert reaper.reaped == ["/s/table.qza"]
+    assert reaper.remaining == {}
+
+
+def test_only_candidates_are_reaped():
+    executor = Mock()
+    commands = make_commands()
+    reaper = ArtifactReaper(executor, commands, candidates=[])
+
+    for cmd in commands:
+        reaper(finished(cmd))
+
+    executor.run.assert_not_called()
+
+
+def test_archive_moves_instead_of_deleting():
+    executor = Mock()
+    denoise, summarize, barplot = make_commands()
+    reaper = ArtifactReaper(
+        executor,
+        [barplot],
+        candidates=["/s/taxonomy.qza"],
+        archive_path=Path("/out/archive"),
+    )
+
+    reaper(finished(barplot))
+
+    assert executor.run.call_args_list == [
+        call(["mkdir", "-p", "/out/archive"]),
+        call(["mv", "/s/taxonomy.qza", "/out/archive/taxonomy.qza"]),
+    ]
@@ -1,4 +1,15 @@
-from pathlib import PurePath
+import threading
+from pathlib import Path, PurePath
+from types import SimpleNamespace
+from unittest.mock import Mock
+import pytest
+from qiime_pipeline.data.store import ReapMode
+from qiime_pipeline.pipeline.support.events import (
+    FAILED,
+    FINISHED,
+    STARTED,
+    EventBus,
+)
 from qiime_pipeline.pipeline.support.support_class import Pipeline
 from qiime_pipeline.pipeline.commands import parts
 
@@ -17,3 +28,243 @@ def test_pipeline_concatination_pipeline(mocked_context):
     for value in pipeline_exp_result.values():
         assert value.endswith(".qza") or value.endswith(".qzv")
         assert PurePath(value).is_absolute()
+
+
+def make_context(
+    executor, intermediate: Path = Path("/workspace/out")
+) -> SimpleNamespace:
+    return SimpleNamespace(
+        setting=SimpleNamespace(
+            ctn_output_path=Path("/workspace/out"),
+            ctn_intermediate_path=intermediate,
+            reap_mode=ReapMode.OFF,
+        ),
+        executor=executor,
+        events=EventBus(),
+    )
+
+
+def add_two_commands(pipeline: Pipeline) -> None:
+    pipeline._assembly.new_cmd("qiime a").add_output("x", "/workspace/out/x.qza")
+    pipeline._assembly.new_cmd("qiime b").add_input("x", "/workspace/out/x.qza")
+
+
+def test_pipeline_run_emits_command_events():
+    context = make_context(Mock())
+    events = []
+    context.events.subscribe(events.append)
+
+    pipeline = Pipeline(context)
+    add_two_commands(pipeline)
+    pipeline.run()
+
+    assert [(e.kind, e.index, e.total) for e in events] == [
+        (STARTED, 0, 2),
+        (FINISHED, 0, 2),
+        (STARTED, 1, 2),
+        (FINISHED, 1, 2),
+    ]
+    assert events[1].outputs == ["/workspace/out/x.qza"]
+    assert events[1].duration >= 0
+
+
+def test_pipeline_run_emits_failed_event():
+    executor = Mock()
+    executor.run.side_effect = [None, RuntimeError("boom")]
+    context = make_context(executor)
+    events = []
+    context.events.subscribe(events.append)
+
+    pipeline = Pipeline(context)
+    add_two_commands(pipeline)
+    with pytest.raises(RuntimeError):
+        pipeline.run()
+
+    assert events[-1].kind == FAILED
+    assert str(events[-1].error) == "boom"
+
+
+class Denoise(Pipeline):
+    def _cmd_build(self, inputs=None):
+        demux = (
+            self._assembly.new_cmd("qiime tools import")
+            .add_option("output-path", self._intermediate_output("demux.qza"))
+            .get_outputs()
+        )
+        self._result["table"] = (
+            self._assembly.new_cmd("qiime dada2 denoise-paired")
+            .add_input("demultiplexed-seqs", demux)
+            .add_output("table", self._intermediate_output("table.qza"))
+            .get_outputs()
+        )
+        return self._result
+
+
+class Summarize(Pipeline):
+    def _cmd_build(self, inputs=None):
+        self._result["summary"] = (
+            self._assembly.new_cmd("qiime feature-table summarize")
+            .add_input("table", inputs["table"])
+            .add_output("visualization", self._output / "summary.qzv")
+            .get_outputs()
+        )
+        return self._result
+
+
+def test_intermediates_are_placed_on_scratch():
+    context = make_context(Mock(), intermediate=Path("/scratch/intermediate"))
+
+    pipeline = Denoise(context) + Summarize(context)
+    result = pipeline()
+
+    assert result["table"] == "/scratch/intermediate/table.qza"
+    assert result["summary"] == "/workspace/out/summary.qzv"
+    assert pipeline.intermediates == {
+        "/scratch/intermediate/demux.qza",
+        "/scratch/intermediate/table.qza",
+    }
+
+    pipeline.run()
+    context.executor.run.assert_any_call(["mkdir", "-p", Path("/scratch/intermediate")])
+
+
+@pytest.mark.parametrize(
+    "keep,reaped",
+    [
+        ((), ["/scratch/intermediate/demux.qza", "/scratch/intermediate/table.qza"]),
+        (("table",), ["/scratch/intermediate/demux.qza"]),
+        (("demux.*",), ["/scratch/intermediate/table.qza"]),
+    ],
+)
+def test_pipeline_run_reaps_unused_intermediates(keep, reaped):
+    context = make_context(Mock(), intermediate=Path("/scratch/intermediate"))
+    context.setting.reap_mode = ReapMode.DELETE
+    context.setting.keep_results = keep
+
+    pipeline = Denoise(context) + Summarize(context)
+    pipeline.run()
+
+    removed = [
+        c.args[0][-1]
+        for c in context.executor.run.call_args_list
+        if c.args[0][:2] == ["rm", "-rf"]
+    ]
+    assert removed == reaped
+
+
+def test_commands_are_tagged_with_their_part():
+    context = make_context(Mock())
+
+    pipeline = Denoise(context) + Summarize(context)
+
+    assert [cmd.origin for cmd in pipeline._assembly] == [
+        "Denoise",
+        "Denoise",
+        "Summarize",
+    ]
+
+
+def add_diamond(pipeline: Pipeline) -> None:
+    """a -> (b, c) -> d"""
+    assembly = pipeline._assembly
+    assembly.new_cmd("qiime a").add_output("x", "/workspace/out/x.qza")
+    for name in ("b", "c"):
+        (
+            assembly.new_cmd(f"qiime {name}")
+            .add_input("x", "/workspace/out/x.qza")
+            .add_output(name, f"/workspace/out/{name}.qza")
+        )
+    (
+        assembly.new_cmd("qiime d")
+        .add_input("b", "/workspace/out/b.qza")
+        .add_input("c", "/workspace/out/c.qza")
+    )
+
+
+def test_pipeline_run_in_parallel_overlaps_independent_commands():
+    # bとcが同時に実行されなければBarrierがタイムアウトする
+    barrier = threading.Barrier(2, timeout=5)
+
+    def run(command):
+        if command[:2] in (["qiime", "b"], ["qiime", "c"]):
+            barrier.wait()
+
+    context = make_context(Mock(run=Mock(side_effect=run)))
+    events = []
+    context.events.subscribe(events.append)
+
+    pipeline = Pipeline(context)
+    add_diamond(pipeline)
+    pipeline.run(workers=2)
+
+    started = [e.index for e in events if e.kind == STARTED]
+    finished = [e.index for e in events if e.kind == FINISHED]
+    assert started[0] == 0 and started[-1] == 3
+    assert sorted(finished) == [0, 1, 2, 3]
+    assert finished.index(3) == 3
+    assert {e.total for e in events} == {4}
+
+
+def test_pipeline_run_in_parallel_stops_after_failure():
+    def run(command):
+        if command[:2] == ["qiime", "b"]:
+            raise RuntimeError("boom")
+
+    context = make_context(Mock(run=Mock(side_effect=run)))
+    events = []
+    context.events.subscribe(events.append)
+
+    pipeline = Pipeline(context)
+    add_diamond(pipeline)
+    with pytest.raises(RuntimeError, match="boom"):
+        pipeline.run(workers=2)
+
+    assert [e.index for e in events if e.kind == FAILED] == [1]
+    assert 3 not in [e.index for e in events if e.kind == STARTED]
+
+
+def test_pipeline_run_in_parallel_starts_ready_commands_before_finished_listeners():
+    # aの終了イベントのリスナーが、aの終了で実行可能になったbの開始を待つ
+    b_started = threading.Event()
+
+    def run(command):
+        if command[:2] == ["qiime", "b"]:
+            b_started.set()
+
+    context = make_context(Mock(run=Mock(side_effect=run)))
+    waited = []
+
+    def slow_listener(event):
+        if event.kind == FINISHED and event.index == 0:
+            waited.append(b_started.wait(timeout=5))
+
+    context.events.subscribe(slow_listener)
+    pipeline = Pipeline(context)
+    add_diamond(pipeline)
+    pipeline.run(workers=2)
+
+    assert waited == [True]
+
+
+def test_pipeline_run_rejects_zero_workers():
+    with pytest.raises(ValueError):
+        Pipeline(make_context(Mock())).run(workers=0)
+
+
+def test_pipeline_run_prefers_the_critical_path():
+    context = make_context(Mock())
+    events = []
+    context.events.subscribe(events.append)
+
+    pipeline = Pipeline(context)
+    assembly = pipeline._assembly
+    assembly.new_cmd("qiime short1").add_output("a", "/workspace/out/a.qza")
+    assembly.new_cmd("qiime short2").add_output("b", "/workspace/out/b.qza")
+    assembly.new_cmd("qiime long").add_output("c", "/workspace/out/c.qza")
+    assembly.new_cmd("qiime tail").add_input("c", "/workspace/out/c.qza")
+    costs = {"qiime short1": 1, "qiime short2": 1, "qiime long": 5, "qiime tail": 5}
+
+    pipeline.run(workers=2, cost=lambda cmd: costs[str(cmd)])
+
+    started = [e.index for e in events if e.kind == STARTED]
+    assert started[:2] == [2, 0]
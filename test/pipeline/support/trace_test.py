@@ -0,0 +1,69 @@
+import json
+import pytest
+from qiime_pipeline.pipeline.support import trace
+from qiime_pipeline.pipeline.support.events import (
+    FAILED,
+    FINISHED,
+    STARTED,
+    CommandEvent,
+)
+from qiime_pipeline.pipeline.support.qiime_command import Q2Cmd
+from qiime_pipeline.pipeline.support.trace import HOST_TID, NullTracer, Tracer
+
+
+@pytest.fixture()
+def tracer():
+    tracer = Tracer()
+    trace.set_tracer(tracer)
+    yield tracer
+    trace.set_tracer(None)
+
+
+def spans(tracer: Tracer) -> list[dict]:
+    return [e for e in tracer.to_dict()["traceEvents"] if e["ph"] == "X"]
+
+
+def test_null_tracer_is_the_default():
+    assert isinstance(trace.get_tracer(), NullTracer)
+    with trace.span("setup_config"):
+        pass
+
+
+def test_host_spans_are_recorded(tracer):
+    with trace.span("image pull", image="alpine"):
+        pass
+
+    (event,) = spans(tracer)
+    assert event["name"] == "image pull"
+    assert event["tid"] == HOST_TID
+    assert event["args"] == {"image": "alpine"}
+    assert event["dur"] >= 0
+
+
+def test_overlapping_commands_use_separate_workers(tracer, tmp_path):
+    first, second = Q2Cmd("qiime a"), Q2Cmd("qiime b")
+    first.origin = "file_import"
+
+    tracer(CommandEvent(STARTED, first, 0, 3))
+    tracer(CommandEvent(STARTED, second, 1, 3))
+    tracer(CommandEvent(FINISHED, first, 0, 3))
+    tracer(CommandEvent(STARTED, Q2Cmd("qiime c"), 2, 3))
+    tracer(CommandEvent(FAILED, second, 1, 3, error=RuntimeError("boom")))
+    tracer(CommandEvent(FINISHED, Q2Cmd("qiime c"), 2, 3))
+
+    by_name = {e["name"]: e for e in spans(tracer)}
+    assert by_name["a"]["tid"] == 1
+    assert by_name["a"]["args"]["part"] == "file_import"
+    assert by_name["b"]["tid"] == 2
+    assert by_name["b"]["cat"] == "failed"
+    # 空いたworker-0のトラックを再利用する
+    assert by_name["c"]["tid"] == 1
+
+    path = tmp_path / "trace.json"
+    tracer.write(path)
+    names = {
+        e["args"]["name"]
+        for e in json.loads(path.read_text())["traceEvents"]
+        if e["name"] == "thread_name"
+    }
+    assert names == {"host", "worker-0", "worker-1"}